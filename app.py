@@ -1,18 +1,135 @@
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, jsonify, request, Response
+from flask.json.provider import DefaultJSONProvider
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
-import time
-from models.chess_game import ChessGame
-from models.llm_player import LLMPlayer
+import os
+from typing import Optional
 from models.battle import ChessBattle
+from models.battle_runner import create_battle, resume_battle, run_battle
+from models.checkpoint import checkpoints, list_checkpoints, startup_resume_ids
+from models.event_loop import LoopLagMonitor
+from models.message_queue import PayloadJSON, PreEncoded, create_client_manager
+from models.reasoning_store import ReasoningStore
+from models.replay import GameReplay
+from models.spectators import SpectatorRegistry, battle_room, battle_snapshot, overflow_room
+from models import analysis
+from models.rate_limiter import rate_limiters
+from models.request_scheduler import request_scheduler
+from models.log import get_logger
+from models.metrics import metrics, stats_collector, SOCKETIO_EMITS, SOCKETIO_EMIT_BYTES
 from config import Config
 
+
+logger = get_logger('app')
+
+
+class ChessJSONProvider(DefaultJSONProvider):
+    """Flask 接口的JSON序列化，同样支持带 to_dict 的对象"""
+    
+    def default(self, o):
+        if hasattr(o, 'to_dict'):
+            return o.to_dict()
+        return super().default(o)
+
+
+class InstrumentedSocketIO(SocketIO):
+    """统计事件数和负载字节数的SocketIO（指标关闭时不做序列化）"""
+    
+    def emit(self, event, *args, **kwargs):
+        if metrics.enabled:
+            SOCKETIO_EMITS.inc(event=event)
+            if args:
+                # 预先序列化的负载直接取字节数，不再重复序列化
+                if isinstance(args[0], PreEncoded):
+                    size = args[0].size
+                else:
+                    size = len(PayloadJSON.dumps(args[0], ensure_ascii=False).encode('utf-8'))
+                SOCKETIO_EMIT_BYTES.inc(size, event=event)
+        return super().emit(event, *args, **kwargs)
+
+
 app = Flask(__name__)
 app.config.from_object(Config)
-socketio = SocketIO(app, cors_allowed_origins="*")
+app.json = ChessJSONProvider(app)
+# 配置了 MESSAGE_QUEUE 时经消息队列广播，多个Web进程共享对战事件（见 serve.py）
+socketio = InstrumentedSocketIO(app, cors_allowed_origins="*", json=PayloadJSON,
+                                client_manager=create_client_manager())
+
+# 限流器与对冲调度器的统计在导出时拉取
+metrics.register_collector(stats_collector('llm_rate_limiter', rate_limiters.get_stats, 'limiter'))
+metrics.register_collector(stats_collector(
+    'llm_hedge', lambda: {'all': {k: v for k, v in request_scheduler.get_stats().items() if k != 'latency'}}, 'scope'))
+metrics.register_collector(stats_collector('llm_latency_window', request_scheduler.tracker.snapshot, 'endpoint'))
+metrics.register_collector(stats_collector('checkpoint', lambda: {'all': checkpoints.get_stats()}, 'scope'))
+
+# 本进程的观众登记（每局对战的实时/溢出房间人数）
+spectators = SpectatorRegistry()
+metrics.register_collector(stats_collector('spectators', lambda: {'all': spectators.get_stats()}, 'scope'))
+
+# 事件循环延迟监测：由 start_background_services 启动，结果见 /metrics 的 event_loop_lag_seconds
+lag_monitor = LoopLagMonitor(socketio)
 
-# 全局变量存储当前对战
+# 进行中和最近结束的对战，按 battle_id 索引；current_battle 为最近开始的一局（供前端状态接口使用）
+battles = {}
 current_battle = None
+# 多进程模式（serve.py）下由对战工作进程运行对战，此处为 WorkerPool；单进程模式为None
+worker_pool = None
+
+
+def register_battle(battle: ChessBattle):
+    """登记新对战，超出保留上限时丢弃最早结束的对战"""
+    global current_battle
+    battles[battle.battle_id] = battle
+    current_battle = battle
+    finished = [b for b in battles.values() if b.status in ("finished", "error", "stopped")]
+    for old in finished[:max(0, len(finished) - Config.BATTLE_HISTORY_LIMIT)]:
+        battles.pop(old.battle_id, None)
+        old.release()
+
+def start_background_services():
+    """启动服务器前调用：启动事件循环延迟监测；单进程模式下继续上次未结束的对战"""
+    socketio.start_background_task(lag_monitor.run)
+    if worker_pool is None:
+        for battle_id in startup_resume_ids():
+            try:
+                launch_resumed_battle(battle_id)
+            except Exception as e:
+                logger.warning("无法从检查点继续对战 %s: %s", battle_id, e)
+
+def launch_resumed_battle(battle_id: str, overrides: Optional[dict] = None) -> ChessBattle:
+    """从检查点恢复对战并在后台继续运行（单进程模式）"""
+    previous = battles.get(battle_id)
+    if previous and previous.status not in ("finished", "error", "stopped"):
+        raise ValueError(f"对战 {battle_id} 正在进行")
+    battle = resume_battle(battle_id, socketio, overrides)
+    if previous:
+        # 文件已由新对象接管，只关闭旧对象的句柄
+        previous.reasoning.close()
+    register_battle(battle)
+    socketio.start_background_task(run_battle, battle, socketio)
+    return battle
+
+def last_battle_id() -> Optional[str]:
+    """最近开始的一局"""
+    if worker_pool is not None:
+        return worker_pool.last_battle_id()
+    return current_battle.battle_id if current_battle else None
+
+def find_snapshot(battle_id: Optional[str]):
+    """观众加入时发送的局面快照，对战不存在时返回None"""
+    if worker_pool is not None:
+        return worker_pool.snapshot(battle_id)
+    battle = battles.get(battle_id)
+    if not battle:
+        return None
+    return battle.channel.snapshot() if battle.channel else battle_snapshot(battle)
+
+def find_replay(battle_id: Optional[str]) -> Optional[GameReplay]:
+    """按 battle_id 查找对战回放，未指定时取最近开始的一局"""
+    if worker_pool is not None:
+        return worker_pool.replay(battle_id or worker_pool.last_battle_id())
+    battle = battles.get(battle_id) if battle_id else current_battle
+    return battle.replay if battle else None
 
 @app.route('/')
 def index():
@@ -22,204 +139,291 @@ def index():
 @app.route('/api/start_battle', methods=['POST'])
 def start_battle():
     """开始对战"""
-    global current_battle
-    
     data = request.json
-    red_config = data.get('red_player')
-    black_config = data.get('black_player')
     
     try:
-        # 创建玩家实例（传入socketio实例以支持流式输出）
-        # 红方使用前端选择的模型，通过SiliconFlow API
-        red_player = LLMPlayer(
-            model_name=red_config['model_name'],
-            api_key=red_config['api_key'],
-            base_url=red_config.get('base_url', "https://api.siliconflow.cn/v1"),
-            display_name=red_config.get('display_name', red_config['model_name']),
-            socketio=socketio
-        )
+        if worker_pool is not None:
+            # 多进程模式：交给负载最低的对战工作进程
+            return jsonify({"status": "success", "message": "对战已开始", "battle_id": worker_pool.start_battle(data)})
         
-        black_player = LLMPlayer(
-            model_name=black_config['model_name'],
-            api_key=black_config['api_key'],
-            base_url=black_config.get('base_url'),
-            display_name=black_config['display_name'],
-            socketio=socketio
-        )
-        
-        # 创建对战实例
-        current_battle = ChessBattle(red_player, black_player)
+        # 创建对战实例（传入socketio实例以支持流式输出）
+        battle = create_battle(data, socketio)
+        register_battle(battle)
         
         # 启动对战（在后台线程中）
-        socketio.start_background_task(run_battle)
+        socketio.start_background_task(run_battle, battle, socketio)
         
-        return jsonify({"status": "success", "message": "对战已开始"})
+        return jsonify({"status": "success", "message": "对战已开始", "battle_id": battle.battle_id})
         
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
-def run_battle():
-    """运行对战（后台任务）"""
-    global current_battle
-    
-    if not current_battle:
-        print("错误: 没有当前对战实例")
-        return
-    
-    print("开始运行对战...")
-    
-    while not current_battle.game.is_game_over():
-        try:
-            # 获取当前玩家
-            current_player = (current_battle.red_player 
-                            if current_battle.game.current_player == "red" 
-                            else current_battle.black_player)
-            
-            print(f"当前轮到: {current_player.display_name}")
-            
-            # 发送思考状态
-            socketio.emit('thinking', {
-                'player': current_player.display_name,
-                'message': f'{current_player.display_name} 正在思考...'
-            })
-            
-            # 使用真实的模型接入获取棋步
-            print(f"{current_player.display_name} 正在思考...")
-            
-            # 获取当前棋盘状态和合法棋步
-            print(f"当前棋盘状态:\n{current_battle.game.get_board_unicode()}")
-            legal_moves = current_battle.game.get_legal_moves()
-            print(f"当前合法棋步数量: {len(legal_moves)}")
-            
-            # 重试机制：最多尝试3次获取有效棋步
-            max_retries = 3
-            valid_move_found = False
-            
-            for attempt in range(max_retries):
-                try:
-                    print(f"第 {attempt + 1} 次尝试获取 {current_player.display_name} 的棋步...")
-                    
-                    # 调用真实的AI模型获取棋步
-                    board_state = current_battle.game.get_board_state()
-                    move_history = current_battle.game.move_history
-                    move_result = current_player.get_move(board_state, move_history, legal_moves)
-                    
-                    print(f"AI返回的棋步结果: {move_result}")
-                    
-                    # 检查是否获得有效的棋步结果
-                    if move_result and move_result.get('move'):
-                        # 尝试执行棋步
-                        if current_battle.game.make_move(move_result['move']):
-                            # 棋步有效，记录并发送更新
-                            current_battle.log_move(current_player.display_name, move_result)
-                            
-                            # 获取更新后的棋盘状态
-                            updated_board_state = current_battle.game.get_board_state()
-                            board_unicode = current_battle.game.get_board_unicode()
-                            
-                            print(f"棋步执行成功，更新后的棋盘状态: {updated_board_state}")
-                            print(f"棋盘Unicode显示:\n{board_unicode}")
-                            
-                            # 发送棋步更新事件
-                            move_data = {
-                                'player': current_player.display_name,
-                                'player_color': current_battle.game.current_player,  # 注意：这里是下一个玩家的颜色
-                                'move': move_result['move'],
-                                'thinking': move_result.get('thinking', ''),
-                                'board_state': updated_board_state,
-                                'board_unicode': board_unicode,
-                                'move_count': len(current_battle.game.move_history),
-                                'history': current_battle.battle_log[-10:],  # 最近10步
-                                'current_player': current_battle.game.current_player,
-                                'is_game_over': current_battle.game.is_game_over()
-                            }
-                            
-                            print(f"准备发送move_made事件: {move_data}")
-                            socketio.emit('move_made', move_data)
-                            print(f"move_made事件已发送")
-                            
-                            # 强制刷新Socket.IO
-                            socketio.sleep(0.1)
-                            
-                            print(f"{current_player.display_name} 走了: {move_result['move']}")
-                            valid_move_found = True
-                            break
-                        else:
-                            print(f"第 {attempt + 1} 次尝试：无效棋步 {move_result['move']}")
-                    else:
-                        print(f"第 {attempt + 1} 次尝试：AI未返回有效棋步结果")
-                    
-                    # 如果不是最后一次尝试，等待一段时间再重试
-                    if attempt < max_retries - 1:
-                        print(f"等待2秒后进行第 {attempt + 2} 次尝试...")
-                        time.sleep(2)
-                        
-                except Exception as e:
-                    print(f"第 {attempt + 1} 次尝试时发生异常: {e}")
-                    if attempt < max_retries - 1:
-                        print(f"等待3秒后进行第 {attempt + 2} 次尝试...")
-                        time.sleep(3)
-                    else:
-                        print("所有重试都失败了")
-            
-            # 如果所有重试都失败，发送错误并结束游戏
-            if not valid_move_found:
-                error_msg = f'{current_player.display_name} 在 {max_retries} 次尝试后仍无法产生有效棋步'
-                print(error_msg)
-                socketio.emit('game_error', {'message': error_msg})
-                break
-            
-            # 短暂延迟，便于观察
-            time.sleep(1)
-                
-        except Exception as e:
-            print(f"对战过程中出现异常: {e}")
-            import traceback
-            traceback.print_exc()
-            socketio.emit('game_error', {'message': f'对战出错: {str(e)}'})
-            break
-    
-    # 游戏结束，发送结果
-    try:
-        result = current_battle.get_battle_result()
-        socketio.emit('game_over', {
-            'result': result,
-            'total_moves': len(current_battle.game.move_history),
-            'battle_log': current_battle.battle_log
-        })
-        print(f"游戏结束: {result}")
-    except Exception as e:
-        print(f"发送游戏结束信息时出错: {e}")
-
 @app.route('/api/stop_battle', methods=['POST'])
 def stop_battle():
-    """停止对战"""
+    """停止对战，未指定 battle_id 时停止最近开始的一局"""
     global current_battle
-    current_battle = None
+    data = request.get_json(silent=True) or {}
+    if worker_pool is not None:
+        worker_pool.stop_battle(data.get('battle_id'))
+        return jsonify({"status": "success", "message": "对战已停止"})
+    battle = battles.get(data['battle_id']) if data.get('battle_id') else current_battle
+    if battle:
+        battle.stop_battle()
+    if battle is current_battle:
+        current_battle = None
     return jsonify({"status": "success", "message": "对战已停止"})
 
+@app.route('/api/battles/<battle_id>/resume', methods=['POST'])
+def resume_battle_endpoint(battle_id):
+    """继续对战：暂停中的对局直接恢复，否则从检查点恢复（进程重启、崩溃或出错结束之后）
+
+    请求体可选：{"red_player": {"api_key": ...}, "black_player": {...}}，检查点中不保存密钥，
+    环境变量中取不到时需在这里传入。
+    """
+    data = request.get_json(silent=True) or {}
+    overrides = {side: data[side] for side in ('red_player', 'black_player') if data.get(side)}
+    try:
+        if worker_pool is not None:
+            worker_pool.resume_battle(battle_id, overrides)
+            return jsonify({"status": "success", "message": "对战已继续", "battle_id": battle_id})
+        battle = battles.get(battle_id)
+        if battle and battle.status == "paused":
+            battle.resume_battle()
+        else:
+            launch_resumed_battle(battle_id, overrides)
+        return jsonify({"status": "success", "message": "对战已继续", "battle_id": battle_id})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@app.route('/api/checkpoints', methods=['GET'])
+def get_checkpoints():
+    """检查点目录中的对战（是否可继续、已走步数、是否有崩溃前已完成的模型结果）"""
+    return jsonify({"status": "success", "checkpoints": list_checkpoints()})
+
 @app.route('/api/get_battle_status', methods=['GET'])
 def get_battle_status():
     """获取对战状态"""
     global current_battle
     
+    if worker_pool is not None:
+        entry = worker_pool.get(worker_pool.last_battle_id())
+        if not entry:
+            return jsonify({"status": "no_battle"})
+        return jsonify({"status": "active", **{key: entry.get(key) for key in
+                        ('battle_id', 'board_state', 'move_count', 'current_player', 'is_game_over',
+                         'legal_move_cache')}})
+    
     if not current_battle:
         return jsonify({"status": "no_battle"})
     
     return jsonify({
         "status": "active",
+        "battle_id": current_battle.battle_id,
         "board_state": current_battle.game.get_board_state(),
         "move_count": len(current_battle.game.move_history),
         "current_player": current_battle.game.current_player,
-        "is_game_over": current_battle.game.is_game_over()
+        "is_game_over": current_battle.is_game_over(),
+        "legal_move_cache": dict(current_battle.game.legal_move_stats)
+    })
+
+@app.route('/api/battles', methods=['GET'])
+def list_battles():
+    """列出进行中和最近结束的对战"""
+    if worker_pool is not None:
+        return jsonify({"battles": worker_pool.list_battles()})
+    return jsonify({
+        "battles": [{
+            "battle_id": battle.battle_id,
+            "status": battle.status,
+            "move_count": len(battle.game.move_history),
+            "red_player": battle.red_player.display_name,
+            "black_player": battle.black_player.display_name,
+            "start_time": battle.start_time
+        } for battle in list(battles.values())]
     })
 
+@app.route('/api/battles/<battle_id>/position', methods=['GET'])
+def get_battle_position(battle_id):
+    """回放：第 ply 步之后的局面，不传 ply 时返回最新局面"""
+    replay = find_replay(battle_id)
+    if not replay:
+        return jsonify({"status": "error", "message": "对战不存在"}), 404
+    try:
+        ply = request.args.get('ply', type=int)
+        return jsonify({"status": "success", "battle_id": battle_id, **replay.position(ply)})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@app.route('/api/battles/<battle_id>/moves', methods=['GET'])
+def get_battle_moves(battle_id):
+    """回放：全部棋步列表（不含局面）"""
+    replay = find_replay(battle_id)
+    if not replay:
+        return jsonify({"status": "error", "message": "对战不存在"}), 404
+    return jsonify({"status": "success", "battle_id": battle_id, "moves": replay.get_moves()})
+
+@app.route('/api/battles/<battle_id>/reasoning', methods=['GET'])
+def get_battle_reasoning(battle_id):
+    """按步数读取思考过程"""
+    ply = request.args.get('ply', type=int)
+    if worker_pool is not None:
+        # 多进程模式：直接读取对战工作进程写入的记录文件
+        if not worker_pool.get(battle_id):
+            return jsonify({"status": "error", "message": "对战不存在"}), 404
+        store = ReasoningStore.load(battle_id)
+        reasoning = store.get(ply) if store and ply is not None else None
+        if store:
+            store.close()
+    else:
+        battle = battles.get(battle_id)
+        if not battle:
+            return jsonify({"status": "error", "message": "对战不存在"}), 404
+        reasoning = battle.get_reasoning(ply) if ply is not None else None
+    if reasoning is None:
+        return jsonify({"status": "error", "message": f"第 {ply} 步没有思考记录"}), 404
+    return jsonify({"status": "success", "battle_id": battle_id, "ply": ply, **reasoning})
+
+def follow_analysis(job_id: str):
+    """按完成顺序产出后台分析任务的结果，直到任务结束；两次轮询之间用 socketio.sleep 让出"""
+    offset = 0
+    while True:
+        results, running = analysis.jobs.follow(job_id, offset)
+        offset += len(results)
+        yield from results
+        if not running:
+            return
+        socketio.sleep(Config.ANALYSIS_POLL_INTERVAL)
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze():
+    """批量局面分析
+
+    请求体：{"positions": [FEN或棋盘状态字符串, 或 {"fen"/"board_state", "player"}], "depth": 3, "stream": false}
+    也可传 {"battle_id": ...} 分析一局对战的每一步。
+    分析总在后台任务中进行，处理函数只轮询任务并在两次轮询之间让出，不阻塞事件循环。
+    stream 为 true 时按完成顺序逐行返回 NDJSON（每行带 index）；否则工作量在同步预算内时按输入顺序一次返回，
+    超出预算时返回 202 和 job_id，经 GET /api/analyze/<job_id> 查询进度和结果。
+    """
+    data = request.get_json(silent=True) or {}
+    positions = data.get('positions')
+    if data.get('battle_id'):
+        replay = find_replay(data['battle_id'])
+        if not replay:
+            return jsonify({"status": "error", "message": "对战不存在"}), 404
+        positions = [{'board_state': p['board_state'], 'player': p['current_player']}
+                     for p in (replay.position(ply) for ply in range(len(replay) + 1))]
+    if not isinstance(positions, list) or not positions:
+        return jsonify({"status": "error", "message": "positions 必须是非空列表"}), 400
+    if len(positions) > Config.ANALYSIS_MAX_POSITIONS:
+        return jsonify({"status": "error", "message": f"单次最多分析 {Config.ANALYSIS_MAX_POSITIONS} 个局面"}), 400
+    depth = data.get('depth')
+    if depth is not None and (not isinstance(depth, int) or isinstance(depth, bool)):
+        return jsonify({"status": "error", "message": "depth 必须是整数"}), 400
+    
+    job_id = analysis.jobs.submit(positions, depth)
+    if data.get('stream'):
+        def generate():
+            try:
+                for result in follow_analysis(job_id):
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+                job = analysis.jobs.get(job_id)
+                if job and job['status'] == 'error':
+                    yield json.dumps({"error": job['message']}, ensure_ascii=False) + "\n"
+            finally:
+                # 客户端断开时放弃剩余局面
+                analysis.jobs.cancel(job_id)
+        return Response(generate(), mimetype='application/x-ndjson')
+    
+    if analysis.estimated_cost(len(positions), depth) > Config.ANALYSIS_SYNC_BUDGET:
+        return jsonify({"status": "accepted", "job_id": job_id, "total": len(positions)}), 202
+    for _ in follow_analysis(job_id):
+        pass
+    job = analysis.jobs.get(job_id)
+    if job['status'] == 'error':
+        return jsonify({"status": "error", "message": job['message']}), 500
+    return jsonify({"status": "success", "results": job['results']})
+
+@app.route('/api/analyze/<job_id>')
+def analyze_job(job_id):
+    """后台分析任务的进度；status 为 finished/error 时带上按输入顺序排列的 results"""
+    job = analysis.jobs.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "分析任务不存在"}), 404
+    return jsonify({"status": "success", "job": job})
+
+@socketio.on('seek')
+def handle_seek(data):
+    """回放拖动：只回复请求方，原样带回 request_id，前端据此丢弃过期的响应"""
+    data = data or {}
+    battle_id = data.get('battle_id') or last_battle_id()
+    replay = find_replay(battle_id)
+    reply = {'battle_id': battle_id if replay else None, 'request_id': data.get('request_id')}
+    if not replay:
+        emit('position', {**reply, 'status': 'error', 'message': '对战不存在'})
+        return
+    try:
+        ply = data.get('ply')
+        emit('position', {**reply, 'status': 'success', **replay.position(None if ply is None else int(ply))})
+    except (TypeError, ValueError) as e:
+        emit('position', {**reply, 'status': 'error', 'message': str(e)})
+
+@socketio.on('join_battle')
+def handle_join_battle(data):
+    """观战：加入对战房间并收到当前局面快照，未指定 battle_id 时观看最近开始的一局
+    
+    实时房间满员后加入溢出房间，思考内容按间隔合并推送；viewer_mode 事件告知当前模式。
+    """
+    data = data or {}
+    battle_id = data.get('battle_id') or last_battle_id()
+    snapshot = find_snapshot(battle_id) if battle_id else None
+    if snapshot is None:
+        emit('viewer_mode', {'battle_id': battle_id, 'status': 'error', 'message': '对战不存在'})
+        return
+    leave_battle(request.sid)
+    mode = spectators.join(request.sid, battle_id)
+    join_room(battle_room(battle_id) if mode == 'live' else overflow_room(battle_id))
+    emit('battle_snapshot', snapshot)
+    emit('viewer_mode', {'battle_id': battle_id, 'status': 'success', 'mode': mode, **spectators.counts(battle_id)})
+
+@socketio.on('leave_battle')
+def handle_leave_battle(data=None):
+    leave_battle(request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    leave_battle(request.sid)
+
+def leave_battle(sid: str):
+    """离开当前观看的对战；实时房间空出的位置让给最早进入溢出房间的观众"""
+    left = spectators.leave(sid)
+    if not left:
+        return
+    battle_id = left['battle_id']
+    leave_room(battle_room(battle_id) if left['mode'] == 'live' else overflow_room(battle_id), sid=sid, namespace='/')
+    promoted = left['promoted']
+    if promoted:
+        leave_room(overflow_room(battle_id), sid=promoted, namespace='/')
+        join_room(battle_room(battle_id), sid=promoted, namespace='/')
+        socketio.emit('viewer_mode', {'battle_id': battle_id, 'status': 'success', 'mode': 'live',
+                                      **spectators.counts(battle_id)}, to=promoted)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus格式的监控指标"""
+    if not metrics.enabled:
+        return Response("# metrics disabled\n", status=404, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     try:
-        print("正在启动AI象棋对战系统...")
-        print("访问地址: http://localhost:5003")
-        socketio.run(app, debug=True, host='0.0.0.0', port=5003)
+        logger.info("正在启动AI象棋对战系统，访问地址: http://localhost:5003")
+        # DEBUG 模式的重载器会先启动一个只负责监视文件的父进程，后台服务（含从检查点继续对战）
+        # 只在实际提供服务的子进程中启动，否则同一局对战会被继续两次
+        if not Config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_services()
+        # eventlet 不可用（如 Python 3.12）时 Flask-SocketIO 退回 threading 模式，
+        # 此时非交互启动需要显式允许 Werkzeug 服务器，与 serve.py 相同
+        socketio.run(app, debug=Config.DEBUG, host='0.0.0.0', port=5003,
+                     use_reloader=Config.DEBUG, allow_unsafe_werkzeug=True)
     except Exception as e:
-        print(f"启动应用时发生错误: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("启动应用时发生错误: %s", e)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+象棋引擎基准测试：perft 计数与 models/chess_game.py 的微基准
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_engine                      # 默认深度，结果写入 benchmarks/results/
+    python -m benchmarks.bench_engine --max-depth 5        # 更深的 perft（较慢）
+    python -m benchmarks.bench_engine --compare benchmarks/results/<旧提交>.json
+
+perft 计数同时作为走法生成的正确性基准：与 EXPECTED_PERFT 不一致时以非零状态退出。
+get_legal_moves 生成的是伪合法棋步（不排除送将和将帅照面，对局中以吃将结束），
+perft 在其上排除走后己方被将军的棋步，计数与标准象棋 perft 一致（初始局面深度2为1920）。
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from models.chess_game import ChessGame
+
+START_POSITION = "rnbakabnr/........./.c.....c./p.p.p.p.p/........./........./P.P.P.P.P/.C.....C./........./RNBAKABNR"
+
+# 基准局面：(棋盘状态, 行棋方, 默认最大深度)
+POSITIONS = {
+    'start': (START_POSITION, 'red', 3),
+    'middlegame': ("r.bakab.r/........./.cn...nc./p.p.p.p.p/........./..P....../P...P.P.P/.C..C.N../........./RNBAKAB.R", 'red', 3),
+    'endgame_red': ("...k...../....a..../........./........./..p....../........./........./....C..../....A..../.R..K....", 'red', 4),
+    'endgame_black': ("...k...../....a..../........./........./..p....../........./........./....C..../....A..../.R..K....", 'black', 4),
+}
+
+# 标准规则下的 perft 计数（正确性基准，初始局面为公认值）；未列出的深度只报告计数不做校验
+EXPECTED_PERFT = {
+    'start': {1: 44, 2: 1920, 3: 79666, 4: 3290240},
+    'middlegame': {1: 33, 2: 1305, 3: 44485},
+    'endgame_red': {1: 30, 2: 148, 3: 4672, 4: 23098, 5: 718537},
+    'endgame_black': {1: 5, 2: 157, 3: 766, 4: 23681, 5: 125281},
+}
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def load_position(board_state: str, player: str) -> ChessGame:
+    game = ChessGame()
+    game.set_board_state(board_state, player)
+    return game
+
+
+def strict_legal_moves(game: ChessGame) -> List[str]:
+    """按标准规则的合法棋步：去掉伪合法棋步中走后己方被将军（含将帅照面）的"""
+    mover = game.current_player
+    moves = []
+    for move in game.get_legal_moves():
+        game.make_move(move)
+        if not game.is_in_check(mover):
+            moves.append(move)
+        game.undo_last_move()
+    return moves
+
+
+def perft(game: ChessGame, depth: int) -> int:
+    """统计指定深度的叶子节点数（最后一层只计数不继续展开）"""
+    moves = strict_legal_moves(game)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        game.make_move(move)
+        nodes += perft(game, depth - 1)
+        game.undo_last_move()
+    return nodes
+
+
+def run_perft(max_depth: Optional[int]) -> Dict:
+    """对每个基准局面逐层运行 perft，返回计数、耗时和每秒节点数"""
+    results = {}
+    for name, (board_state, player, default_depth) in POSITIONS.items():
+        depth_limit = max_depth or default_depth
+        results[name] = {}
+        for depth in range(1, depth_limit + 1):
+            game = load_position(board_state, player)
+            start = time.perf_counter()
+            nodes = perft(game, depth)
+            elapsed = time.perf_counter() - start
+            expected = EXPECTED_PERFT.get(name, {}).get(depth)
+            results[name][str(depth)] = {
+                'nodes': nodes,
+                'expected': expected,
+                'ok': expected is None or nodes == expected,
+                'seconds': round(elapsed, 4),
+                'nps': round(nodes / elapsed) if elapsed > 0 else None
+            }
+            status = "" if expected is None else ("OK" if nodes == expected else f"不一致（期望 {expected}）")
+            print(f"perft {name:<14} 深度{depth}: {nodes:>10} 节点 {elapsed:8.3f}s "
+                  f"{results[name][str(depth)]['nps'] or 0:>9} nps {status}")
+    return results
+
+
+def bench(func: Callable[[], object], min_time: float = 0.3, repeat: int = 3) -> Dict:
+    """自动确定迭代次数，取多轮中最快的一轮，返回每次调用的耗时"""
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat:
+            break
+        iterations *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        best = min(best, time.perf_counter() - start)
+    per_call = best / iterations
+    return {
+        'iterations': iterations,
+        'us_per_call': round(per_call * 1e6, 3),
+        'calls_per_second': round(1 / per_call) if per_call > 0 else None
+    }
+
+
+def run_micro() -> Dict:
+    """引擎各热点函数的微基准"""
+    game = load_position(*POSITIONS['middlegame'][:2])
+    legal_moves = game.get_legal_moves()
+    move = legal_moves[len(legal_moves) // 2]
+    from_pos, to_pos = game.coord_to_pos(move[:2]), game.coord_to_pos(move[2:])
+    piece = game.board[from_pos[0]][from_pos[1]]
+    notation = game.pos_to_chinese_notation(from_pos, to_pos, piece)
+    all_squares = [(r, c) for r in range(10) for c in range(9)]
+
+    def make_undo():
+        game.make_move(move)
+        game.undo_last_move()
+
+    def valid_move_scan():
+        # 与 get_legal_moves 内层相同的扫描：一个棋子对所有目标格
+        for target in all_squares:
+            game.is_valid_move(from_pos, target)
+
+    cases = {
+        'get_legal_moves': game.generate_legal_moves,  # 走法生成本身（不经缓存），与旧结果可比
+        'get_legal_moves_cached': game.get_legal_moves,
+        'is_valid_move_x90': valid_move_scan,
+        'make_move+undo_last_move': make_undo,
+        'get_board_state': game.get_board_state,
+        'get_position_evaluation': game.get_position_evaluation,
+        'is_game_over': game.is_game_over,
+        'pos_to_chinese_notation': lambda: game.pos_to_chinese_notation(from_pos, to_pos, piece),
+        'parse_chinese_notation': lambda: game.parse_chinese_notation(notation),
+    }
+
+    results = {}
+    for name, func in cases.items():
+        results[name] = bench(func)
+        print(f"micro {name:<26} {results[name]['us_per_call']:>12.3f} us/次 "
+              f"{results[name]['calls_per_second']:>10} 次/秒")
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: Dict, baseline_path: str):
+    """与之前保存的结果对比，输出变化百分比（正数表示变慢）"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n对比基线 {baseline.get('revision')}（{baseline_path}）:")
+    for name, result in current['micro'].items():
+        old = baseline.get('micro', {}).get(name)
+        if old:
+            change = (result['us_per_call'] - old['us_per_call']) / old['us_per_call'] * 100
+            print(f"  {name:<26} {old['us_per_call']:>10.3f} -> {result['us_per_call']:>10.3f} us ({change:+.1f}%)")
+    for name, depths in current['perft'].items():
+        for depth, result in depths.items():
+            old = baseline.get('perft', {}).get(name, {}).get(depth)
+            if old and old.get('nps') and result.get('nps'):
+                change = (result['nps'] - old['nps']) / old['nps'] * 100
+                print(f"  perft {name:<14} 深度{depth} {old['nps']:>9} -> {result['nps']:>9} nps ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="象棋引擎 perft 与微基准")
+    parser.add_argument('--max-depth', type=int, default=None, help="所有局面使用的最大 perft 深度（1-5）")
+    parser.add_argument('--skip-perft', action='store_true', help="只运行微基准")
+    parser.add_argument('--output', default=None, help="结果JSON路径，默认 benchmarks/results/<提交>.json")
+    parser.add_argument('--compare', default=None, help="与之前的结果JSON对比")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    results = {
+        'revision': revision,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'perft': {} if args.skip_perft else run_perft(args.max_depth),
+        'micro': run_micro()
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    mismatches = [(name, depth) for name, depths in results['perft'].items()
+                  for depth, result in depths.items() if not result['ok']]
+    if mismatches:
+        print(f"perft 计数不一致: {mismatches}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
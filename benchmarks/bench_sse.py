@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流式响应解析基准：回放一段约2万token的 SSE 流，对比旧的逐行解析与 models/sse.py
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_sse                              # 生成的 DeepSeek-R1 风格流，2万token
+    python -m benchmarks.bench_sse --tokens 50000 --repeat 10
+    python -m benchmarks.bench_sse --capture stream.bin         # 回放抓取的原始响应体（字节原样保存）
+    python -m benchmarks.bench_sse --save-capture stream.bin    # 保存生成的流，便于在不同提交间对比
+
+legacy 复现原先 call_deepseek_stream 的做法：requests.iter_lines（512字节读取）、
+逐行解码为 str、json.loads、字符串 += 拼接；sse 为 SSEParser 直接处理字节块、
+列表累积文本，安装了 orjson 时另外给出 json 与 orjson 两种解码器的结果。
+两种实现解析出的文本不一致时以非零状态退出。
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List
+
+from benchmarks.bench_engine import git_revision, RESULTS_DIR
+from models import sse
+from models.sse import SSEParser, DONE
+
+FILLER = "观察双方子力分布，考虑中路控制与两翼出子的先后次序，炮二平五后黑方可能以马8进7应对。"
+
+EMIT_SIZE = 5  # 与 call_deepseek_stream 相同的推送粒度
+
+
+def generate_stream(tokens: int, seed: int = 1) -> bytes:
+    """生成 DeepSeek-R1 风格的流：前七成为 reasoning_content，其余为 content，夹带保活注释和 usage"""
+    rng = random.Random(seed)
+    out = []
+    reasoning_tokens = tokens * 7 // 10
+    position = 0
+    for index in range(tokens):
+        size = rng.randint(1, 4)
+        text = (FILLER * 2)[position % len(FILLER):position % len(FILLER) + size]
+        position += size
+        field = 'reasoning_content' if index < reasoning_tokens else 'content'
+        chunk = {'id': 'bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'deepseek-reasoner',
+                 'choices': [{'index': 0, 'delta': {field: text}, 'finish_reason': None}]}
+        out.append(b"data: " + json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b"\n\n")
+        if index % 500 == 499:
+            out.append(b": keep-alive\n\n")
+    out.append(b"data: " + json.dumps({'choices': [], 'usage': {'prompt_tokens': 900, 'completion_tokens': tokens}})
+               .encode('utf-8') + b"\n\n")
+    out.append(b"data: [DONE]\n\n")
+    return b"".join(out)
+
+
+def split_network(body: bytes, seed: int = 2) -> List[bytes]:
+    """按网络读取的大小（几百字节到几KB）切分，行会跨块"""
+    rng = random.Random(seed)
+    chunks = []
+    offset = 0
+    while offset < len(body):
+        size = rng.randint(200, 4000)
+        chunks.append(body[offset:offset + size])
+        offset += size
+    return chunks
+
+
+def rechunk(chunks: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """iter_content(chunk_size=size) 的读取方式"""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        while len(pending) >= size:
+            yield pending[:size]
+            pending = pending[size:]
+    if pending:
+        yield pending
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """requests.Response.iter_lines 的实现"""
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def parse_legacy(chunks: List[bytes], emit: Callable[[str], None]) -> str:
+    full_content = ""
+    buffer = ""
+    for line in iter_lines(rechunk(chunks, 512)):
+        if line:
+            line_str = line.decode('utf-8')
+            if not line_str.startswith('data: '):
+                continue
+            json_str = line_str[6:]
+            if json_str.strip() == '[DONE]':
+                break
+            try:
+                chunk_data = json.loads(json_str)
+                if 'choices' in chunk_data and chunk_data['choices']:
+                    delta = chunk_data['choices'][0].get('delta', {})
+                    if 'content' in delta and delta['content']:
+                        full_content += delta['content']
+                        buffer += delta['content']
+                    if 'reasoning_content' in delta and delta['reasoning_content']:
+                        full_content += delta['reasoning_content']
+                        buffer += delta['reasoning_content']
+                    if len(buffer) >= EMIT_SIZE:
+                        emit(buffer)
+                        buffer = ""
+            except json.JSONDecodeError:
+                continue
+    return full_content
+
+
+def parse_sse(chunks: List[bytes], emit: Callable[[str], None], loads: Callable) -> str:
+    """与 call_deepseek_stream 当前的解析循环相同"""
+    parts = []
+    buffer = []
+    buffered = 0
+    parser = SSEParser()
+    for chunk in chunks:
+        finished = False
+        for event in parser.feed(chunk):
+            if event == DONE:
+                finished = True
+                break
+            try:
+                chunk_data = loads(event)
+            except ValueError:
+                continue
+            choices = chunk_data.get('choices')
+            if not choices:
+                continue
+            delta = choices[0].get('delta') or {}
+            for text in (delta.get('content'), delta.get('reasoning_content')):
+                if text:
+                    parts.append(text)
+                    buffer.append(text)
+                    buffered += len(text)
+            if buffered >= EMIT_SIZE:
+                emit("".join(buffer))
+                buffer = []
+                buffered = 0
+        if finished:
+            break
+    return "".join(parts)
+
+
+def measure(parse: Callable[[List[bytes], Callable[[str], None]], str], chunks: List[bytes],
+            repeat: int) -> Dict:
+    emitted = []
+    text = parse(chunks, emitted.append)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(chunks, lambda content: None)
+        timings.append(time.perf_counter() - start)
+    return {'text': text, 'emits': len(emitted), 'seconds': timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 流式响应解析基准")
+    parser.add_argument('--tokens', type=int, default=20000, help="生成的流包含的token（数据块）数")
+    parser.add_argument('--repeat', type=int, default=7, help="每种实现的测量次数，取中位数")
+    parser.add_argument('--capture', default=None, help="回放抓取的原始响应体文件")
+    parser.add_argument('--save-capture', default=None, help="把生成的流保存到文件")
+    parser.add_argument('--output', default=None, help="结果JSON路径，默认 benchmarks/results/sse-<提交>.json")
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, 'rb') as f:
+            body = f.read()
+    else:
+        body = generate_stream(args.tokens)
+        if args.save_capture:
+            with open(args.save_capture, 'wb') as f:
+                f.write(body)
+    chunks = split_network(body)
+    print(f"流大小 {len(body) / 1024:.0f} KB，{body.count(b'data: ')} 个 data 事件，{len(chunks)} 个网络块")
+
+    implementations = {
+        'legacy': parse_legacy,
+        'sse+json': lambda chunks, emit: parse_sse(chunks, emit, lambda data: json.loads(data.decode('utf-8'))),
+    }
+    if sse.JSON_BACKEND == 'orjson':
+        implementations['sse+orjson'] = lambda chunks, emit: parse_sse(chunks, emit, sse.json_loads)
+    else:
+        print("未安装 orjson，只测量标准库 json 解码器")
+
+    results = {}
+    baseline_text = None
+    failures = []
+    for name, parse in implementations.items():
+        result = measure(parse, chunks, args.repeat)
+        if baseline_text is None:
+            baseline_text = result['text']
+        elif result['text'] != baseline_text:
+            failures.append(f"{name} 解析出的文本与 legacy 不一致")
+        median = statistics.median(result['seconds'])
+        results[name] = {
+            'median_ms': round(median * 1000, 2),
+            'min_ms': round(min(result['seconds']) * 1000, 2),
+            'mb_per_second': round(len(body) / median / 1e6, 1),
+            'text_chars': len(result['text']),
+            'emits': result['emits']
+        }
+        speedup = results['legacy']['median_ms'] / results[name]['median_ms']
+        print(f"{name:<12} 中位数 {results[name]['median_ms']:>8.2f} ms  {results[name]['mb_per_second']:>6.1f} MB/s  "
+              f"x{speedup:.2f}  推送 {result['emits']} 次")
+
+    revision = git_revision()
+    output = args.output or os.path.join(RESULTS_DIR, f"sse-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'revision': revision, 'timestamp': time.time(), 'python': sys.version.split()[0],
+                   'stream_bytes': len(body), 'json_backend': sse.JSON_BACKEND, 'results': results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {output}")
+
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
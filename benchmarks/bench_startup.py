@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+启动耗时基准：基于 python -X importtime 统计 app.py 与 models 的导入开销
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_startup                     # 默认每个目标运行5次取中位数
+    python -m benchmarks.bench_startup --budget-scale 2    # 较慢的机器上放宽预算
+    python -m benchmarks.bench_startup --compare benchmarks/results/startup-<旧提交>.json
+
+每次测量都在新的子进程中进行（字节码缓存已生成，测的是热启动）。
+以下情况以非零状态退出：
+- 导入耗时中位数超出 IMPORT_BUDGET_MS（乘以 --budget-scale）；
+- 导入过程中加载了 LAZY_MODULES 中的服务商SDK（它们应在首次调用对应接口时才导入）。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.bench_engine import git_revision, RESULTS_DIR
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测量目标 -> 导入预算（毫秒，热启动中位数）
+IMPORT_BUDGET_MS = {
+    'config': 40,
+    'models.llm_player': 150,
+    'models.battle': 150,
+    'models.battle_worker': 400,
+    'app': 500,
+}
+
+# 不允许在导入阶段加载的模块（服务商SDK）
+LAZY_MODULES = ('openai', 'google.genai', 'anthropic')
+
+
+def measure(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """在子进程中导入模块，返回 (总耗时毫秒, [(模块名, 自身微秒, 累计微秒), ...])"""
+    # 允许写入字节码缓存，否则每次测量都包含编译耗时
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    # 最后一行是目标模块本身，其累计耗时即整体导入耗时
+    return imports[-1][2] / 1000, imports
+
+
+def run(targets: List[str], repeat: int, top: int) -> Dict:
+    results = {}
+    for module in targets:
+        timings = []
+        imports = []
+        for _ in range(repeat):
+            total_ms, imports = measure(module)
+            timings.append(total_ms)
+        loaded = {name for name, _, _ in imports}
+        heaviest = sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+        results[module] = {
+            'median_ms': round(statistics.median(timings), 2),
+            'min_ms': round(min(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'modules': len(imports),
+            'lazy_violations': sorted(name for name in loaded
+                                      if any(name == lazy or name.startswith(lazy + '.') for lazy in LAZY_MODULES)),
+            'heaviest': [{'module': name, 'self_ms': round(self_us / 1000, 2)} for name, self_us, _ in heaviest]
+        }
+        print(f"import {module:<22} 中位数 {results[module]['median_ms']:>8.1f} ms "
+              f"(最快 {results[module]['min_ms']:.1f}, 最慢 {results[module]['max_ms']:.1f})，"
+              f"共 {len(imports)} 个模块")
+        for item in results[module]['heaviest']:
+            print(f"    {item['module']:<40} {item['self_ms']:>8.2f} ms")
+    return results
+
+
+def compare(current: Dict, baseline_path: str):
+    """与之前保存的结果对比，输出变化百分比（正数表示变慢）"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n对比基线 {baseline.get('revision')}（{baseline_path}）:")
+    for module, result in current['imports'].items():
+        old = baseline.get('imports', {}).get(module)
+        if old:
+            change = (result['median_ms'] - old['median_ms']) / old['median_ms'] * 100
+            print(f"  {module:<22} {old['median_ms']:>8.1f} -> {result['median_ms']:>8.1f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py 与 models 的导入耗时基准")
+    parser.add_argument('--repeat', type=int, default=5, help="每个目标的测量次数")
+    parser.add_argument('--top', type=int, default=5, help="列出自身耗时最高的模块个数")
+    parser.add_argument('--budget-scale', type=float, default=1.0, help="导入预算的倍数")
+    parser.add_argument('--output', default=None, help="结果JSON路径，默认 benchmarks/results/startup-<提交>.json")
+    parser.add_argument('--compare', default=None, help="与之前的结果JSON对比")
+    args = parser.parse_args()
+
+    # 先导入一次生成字节码缓存，避免首轮测量包含编译耗时
+    for module in IMPORT_BUDGET_MS:
+        measure(module)
+
+    revision = git_revision()
+    results = {
+        'revision': revision,
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'imports': run(list(IMPORT_BUDGET_MS), args.repeat, args.top)
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    failures = []
+    for module, result in results['imports'].items():
+        budget = IMPORT_BUDGET_MS[module] * args.budget_scale
+        if result['median_ms'] > budget:
+            failures.append(f"{module} 导入耗时 {result['median_ms']:.1f} ms 超出预算 {budget:.0f} ms")
+        if result['lazy_violations']:
+            failures.append(f"{module} 在导入阶段加载了服务商SDK: {', '.join(result['lazy_violations'])}")
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+离线端到端压测：通过 /api/start_battle 启动N局对战，连接M个Socket.IO观众，
+统计每秒步数、推送延迟，以及从 /metrics 采样的每局CPU和内存
+
+准备：
+    python -m benchmarks.mock_llm_server --port 8900 --ttft-ms 300 --tokens-per-second 200
+    MOVE_DELAY=0 python app.py
+运行：
+    python -m benchmarks.load_test --battles 20 --viewers 20 --duration 60
+
+每局对战的双方使用不同的API Key，因此各自拥有独立的限流额度；
+加 --shared-key 可让所有对战共用一个Key，观察共享限流下的排队情况。
+观众按轮询方式分配到各局对战的观战房间（join_battle）。
+推送延迟 = 观众收到 move_made 的时刻 - 服务端写入的 timestamp，要求压测端与服务在同一台机器上。
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+import socketio
+
+METRIC_LINE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? ([0-9.eE+-]+)$')
+
+
+def scrape_metrics(app_url: str) -> Dict[str, float]:
+    """读取 /metrics，同名指标（不同标签）求和"""
+    totals = {}
+    try:
+        text = requests.get(f"{app_url}/metrics", timeout=10).text
+    except requests.RequestException:
+        return totals
+    for line in text.splitlines():
+        match = METRIC_LINE_RE.match(line)
+        if match:
+            totals[match.group(1)] = totals.get(match.group(1), 0.0) + float(match.group(3))
+    return totals
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+class Viewer:
+    """一个Socket.IO观众，记录收到的事件和推送延迟"""
+
+    def __init__(self, app_url: str, stats: "LoadStats"):
+        self.client = socketio.Client(reconnection=False)
+        self.stats = stats
+        self.client.on('move_made', self.on_move_made)
+        self.client.on('thinking_stream', self.on_thinking_stream)
+        self.client.on('game_over', self.on_game_over)
+        self.client.on('game_error', self.on_game_error)
+        self.client.on('battle_snapshot', self.on_battle_snapshot)
+        self.client.on('viewer_mode', self.on_viewer_mode)
+        self.client.connect(app_url, wait_timeout=10)
+
+    def watch(self, battle_id: str):
+        self.client.emit('join_battle', {'battle_id': battle_id})
+
+    def on_move_made(self, data):
+        received = time.time()
+        if data.get('timestamp'):
+            self.stats.record_latency(received - data['timestamp'])
+        self.stats.count('move_made')
+
+    def on_thinking_stream(self, data):
+        self.stats.count('thinking_stream')
+
+    def on_game_over(self, data):
+        self.stats.count('game_over')
+
+    def on_game_error(self, data):
+        self.stats.count('game_error')
+
+    def on_battle_snapshot(self, data):
+        self.stats.count('battle_snapshot')
+
+    def on_viewer_mode(self, data):
+        self.stats.count(f"viewer_{data.get('mode', 'error')}")
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.events = {}
+
+    def record_latency(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def count(self, event: str):
+        with self.lock:
+            self.events[event] = self.events.get(event, 0) + 1
+
+
+def player_config(args, index: int, color: str) -> Dict:
+    key = "mock-shared" if args.shared_key else f"mock-{index}-{color}"
+    return {
+        'model_name': args.model,
+        'api_key': key,
+        'base_url': args.mock_url,
+        'display_name': f"{color}-{index}"
+    }
+
+
+def start_battles(args) -> List[str]:
+    battle_ids = []
+    for i in range(args.battles):
+        response = requests.post(f"{args.app_url}/api/start_battle", json={
+            'red_player': player_config(args, i, 'red'),
+            'black_player': player_config(args, i, 'black')
+        }, timeout=30).json()
+        if response.get('status') != 'success':
+            print(f"第 {i + 1} 局启动失败: {response.get('message')}")
+            continue
+        battle_ids.append(response['battle_id'])
+        if args.ramp > 0:
+            time.sleep(args.ramp)
+    return battle_ids
+
+
+def battle_states(app_url: str, battle_ids: List[str]) -> Dict[str, Dict]:
+    battles = requests.get(f"{app_url}/api/battles", timeout=10).json().get('battles', [])
+    wanted = set(battle_ids)
+    return {b['battle_id']: b for b in battles if b['battle_id'] in wanted}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线端到端压测")
+    parser.add_argument('--app-url', default='http://127.0.0.1:5003')
+    parser.add_argument('--mock-url', default='http://127.0.0.1:8900/v1')
+    parser.add_argument('--model', default='deepseek-mock', help="模型名（含 deepseek 时走流式接口）")
+    parser.add_argument('--battles', type=int, default=10)
+    parser.add_argument('--viewers', type=int, default=None, help="观众数，默认与对战数相同")
+    parser.add_argument('--duration', type=float, default=60.0, help="压测时长（秒），所有对战提前结束时提前停止")
+    parser.add_argument('--ramp', type=float, default=0.0, help="相邻两局启动的间隔（秒）")
+    parser.add_argument('--shared-key', action='store_true', help="所有对战共用一个API Key")
+    parser.add_argument('--output', default=None, help="结果JSON路径")
+    args = parser.parse_args()
+
+    stats = LoadStats()
+    viewers = []
+    for _ in range(args.viewers if args.viewers is not None else args.battles):
+        try:
+            viewers.append(Viewer(args.app_url, stats))
+        except Exception as e:
+            print(f"观众连接失败: {e}")
+            break
+
+    before = scrape_metrics(args.app_url)
+    started = time.time()
+    battle_ids = start_battles(args)
+    for i, viewer in enumerate(viewers):
+        if battle_ids:
+            viewer.watch(battle_ids[i % len(battle_ids)])
+    print(f"已启动 {len(battle_ids)} 局对战，{len(viewers)} 个观众")
+
+    states = {}
+    while time.time() - started < args.duration:
+        time.sleep(2)
+        states = battle_states(args.app_url, battle_ids)
+        running = sum(1 for s in states.values() if s['status'] == 'playing')
+        moves = sum(s['move_count'] for s in states.values())
+        print(f"  {time.time() - started:6.1f}s 进行中 {running:>4} 局，累计 {moves} 步")
+        if running == 0:
+            break
+    elapsed = time.time() - started
+    after = scrape_metrics(args.app_url)
+    states = battle_states(args.app_url, battle_ids)
+
+    for battle_id in battle_ids:
+        requests.post(f"{args.app_url}/api/stop_battle", json={'battle_id': battle_id}, timeout=10)
+    for viewer in viewers:
+        viewer.close()
+
+    battle_count = max(1, len(battle_ids))
+    total_moves = sum(s['move_count'] for s in states.values())
+    cpu_seconds = after.get('process_cpu_seconds_total', 0) - before.get('process_cpu_seconds_total', 0)
+    rss_after = after.get('process_resident_memory_bytes', 0)
+    rss_delta = rss_after - before.get('process_resident_memory_bytes', 0)
+    latencies_ms = [value * 1000 for value in stats.latencies]
+    results = {
+        'battles': len(battle_ids),
+        'viewers': len(viewers),
+        'duration_seconds': round(elapsed, 2),
+        'total_moves': total_moves,
+        'moves_per_second': round(total_moves / elapsed, 3) if elapsed > 0 else None,
+        'battle_status': {status: sum(1 for s in states.values() if s['status'] == status)
+                          for status in {s['status'] for s in states.values()}},
+        'emit_latency_ms': {
+            'samples': len(latencies_ms),
+            'p50': percentile(latencies_ms, 50),
+            'p95': percentile(latencies_ms, 95),
+            'p99': percentile(latencies_ms, 99),
+            'max': max(latencies_ms) if latencies_ms else None
+        },
+        'events_received': dict(stats.events),
+        'cpu_seconds_per_battle': round(cpu_seconds / battle_count, 3),
+        'cpu_utilization': round(cpu_seconds / elapsed, 3) if elapsed > 0 else None,
+        'rss_bytes': rss_after,
+        'rss_delta_bytes_per_battle': round(rss_delta / battle_count),
+        'server_move_retries': after.get('battle_move_retries_total', 0) - before.get('battle_move_retries_total', 0),
+        'server_emit_bytes': after.get('socketio_emit_bytes_total', 0) - before.get('socketio_emit_bytes_total', 0)
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟大模型服务，用于离线端到端压测
+
+支持的接口：
+    POST /v1/chat/completions                          OpenAI兼容（stream=true 时为SSE）
+    POST /v1/messages                                  Anthropic messages
+    POST /v1beta/models/<model>:generateContent        Gemini风格
+    POST /v1beta/models/<model>:streamGenerateContent  Gemini风格SSE
+    GET  /stats                                        请求统计
+
+回复中的棋步从提示词里的合法棋步列表中选取，因此对局可以一直进行下去。
+可配置首token延迟分布、输出速度、错误/429注入和非法棋步比例。
+响应中带有 usage：系统提示词在之前的请求中出现过时计为命中前缀缓存
+（Anthropic 需要 cache_control 标记），用于验证缓存友好的请求布局。
+
+用法：
+    python -m benchmarks.mock_llm_server --port 8900 --ttft-ms 800 --tokens-per-second 60
+然后把玩家的 base_url 设为 http://127.0.0.1:8900/v1（模型名含 deepseek 时走流式接口），
+Claude/Gemini 分别通过 ANTHROPIC_BASE_URL / GEMINI_BASE_URL 环境变量指向本服务。
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+COORD_RE = re.compile(r'[a-i][0-9][a-i][0-9]')
+# 主提示词和追问提示词中，合法棋步列表都紧跟在这句话之后的一行
+LEGAL_LIST_RE = re.compile(r'中选择一个：\s*\n([^\n]*)')
+PLY_RE = re.compile(r'总步数: (\d+)')
+
+FILLER = "观察双方子力分布，考虑中路控制与两翼出子的先后次序，"
+
+
+class MockSettings:
+    """模拟服务行为配置"""
+
+    def __init__(self, ttft_ms: float = 500.0, ttft_sigma: float = 0.5, tokens_per_second: float = 50.0,
+                 output_tokens: int = 200, chars_per_token: int = 3, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 1.0, illegal_rate: float = 0.0,
+                 strategy: str = "random", script: Optional[List[str]] = None, seed: Optional[int] = None):
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.chars_per_token = chars_per_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.illegal_rate = illegal_rate
+        self.strategy = strategy
+        self.script = script or []
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'completed': 0,
+            'errors_injected': 0,
+            'rate_limited_injected': 0,
+            'illegal_injected': 0,
+            'no_legal_list': 0,
+            'client_disconnects': 0,
+            'prompt_cache_hits': 0,
+        }
+        self.cached_prefixes = set()
+
+    def count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def roll(self, probability: float) -> bool:
+        with self.lock:
+            return probability > 0 and self.random.random() < probability
+
+    def prompt_usage(self, api: str, payload: Dict, prompt: str) -> Dict:
+        """输入token数和命中缓存的token数（按系统提示词前缀模拟）"""
+        prefix, cacheable = extract_system(api, payload)
+        prompt_tokens = len(prompt) // self.chars_per_token
+        cached_tokens = 0
+        if prefix and cacheable:
+            with self.lock:
+                if prefix in self.cached_prefixes:
+                    cached_tokens = len(prefix) // self.chars_per_token
+                    self.stats['prompt_cache_hits'] += 1
+                self.cached_prefixes.add(prefix)
+        return {'prompt_tokens': prompt_tokens, 'cached_tokens': cached_tokens}
+
+    def sample_ttft(self) -> float:
+        """首token延迟（秒），对数正态分布，ttft_ms 为中位数"""
+        if self.ttft_ms <= 0:
+            return 0.0
+        with self.lock:
+            if self.ttft_sigma <= 0:
+                return self.ttft_ms / 1000
+            return self.random.lognormvariate(math.log(self.ttft_ms / 1000), self.ttft_sigma)
+
+    def choose_move(self, prompt: str, ply_hint: int) -> str:
+        """从提示词中的合法棋步里选一步；按比例注入非法棋步"""
+        match = LEGAL_LIST_RE.search(prompt)
+        legal_moves = COORD_RE.findall(match.group(1)) if match else []
+        if not legal_moves:
+            self.count('no_legal_list')
+            return "a0a0"
+        if self.roll(self.illegal_rate):
+            self.count('illegal_injected')
+            return "i9a0" if "i9a0" not in legal_moves else "a0i9"
+        if ply_hint < len(self.script) and self.script[ply_hint] in legal_moves:
+            return self.script[ply_hint]
+        if self.strategy == "first":
+            return legal_moves[0]
+        with self.lock:
+            return self.random.choice(legal_moves)
+
+    def build_reply(self, prompt: str) -> List[str]:
+        """生成按token切分的回复文本"""
+        match = PLY_RE.search(prompt)
+        ply_hint = int(match.group(1)) if match else 0
+        move = self.choose_move(prompt, ply_hint)
+        body_chars = max(0, self.output_tokens * self.chars_per_token - 40)
+        analysis = (FILLER * (body_chars // len(FILLER) + 1))[:body_chars]
+        text = f"分析：{analysis}\n策略：稳步推进，保持子力协调。\n棋步：{move}"
+        size = self.chars_per_token
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def extract_prompt(payload: Dict) -> str:
+    """从三种请求格式中取出全部文本"""
+    parts = []
+    for message in payload.get('messages', []):
+        content = message.get('content', '')
+        if isinstance(content, list):
+            parts.extend(block.get('text', '') for block in content if isinstance(block, dict))
+        else:
+            parts.append(str(content))
+    system = payload.get('system')
+    if isinstance(system, str):
+        parts.append(system)
+    elif isinstance(system, list):
+        parts.extend(block.get('text', '') for block in system if isinstance(block, dict))
+    contents = payload.get('contents', [])
+    if isinstance(contents, str):
+        contents = [{'parts': [{'text': contents}]}]
+    for content in contents:
+        for part in content.get('parts', []):
+            parts.append(part.get('text', ''))
+    return "\n".join(parts)
+
+
+def extract_system(api: str, payload: Dict):
+    """系统提示词文本，以及服务商是否会缓存它（Anthropic 需要 cache_control）"""
+    if api == 'anthropic':
+        system = payload.get('system')
+        if isinstance(system, list):
+            text = "".join(block.get('text', '') for block in system if isinstance(block, dict))
+            return text, any(isinstance(block, dict) and block.get('cache_control') for block in system)
+        return system or "", False
+    if api == 'openai':
+        messages = payload.get('messages', [])
+        if messages and messages[0].get('role') == 'system':
+            return str(messages[0].get('content', '')), True
+        return "", False
+    # Gemini 按内容前缀隐式缓存，取第一段的前半部分近似
+    contents = payload.get('contents', [])
+    if isinstance(contents, str):
+        return contents[:len(contents) // 2], True
+    text = "".join(part.get('text', '') for content in contents[:1] for part in content.get('parts', []))
+    return text[:len(text) // 2], True
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            with self.settings.lock:
+                self.send_json(200, dict(self.settings.stats))
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        settings = self.settings
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {'error': 'invalid json'})
+            return
+        settings.count('requests')
+
+        path = self.path.split('?')[0]
+        if path.endswith('/chat/completions'):
+            api = 'openai'
+        elif path.endswith('/messages'):
+            api = 'anthropic'
+        elif ':generateContent' in path or ':streamGenerateContent' in path:
+            api = 'gemini'
+        else:
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        if settings.roll(settings.rate_limit_rate):
+            settings.count('rate_limited_injected')
+            self.send_json(429, {'error': {'message': 'rate limited', 'code': 429}},
+                           {'Retry-After': f"{settings.retry_after:g}"})
+            return
+        if settings.roll(settings.error_rate):
+            settings.count('errors_injected')
+            self.send_json(500, {'error': {'message': 'injected error', 'code': 500}})
+            return
+
+        prompt = extract_prompt(payload)
+        tokens = settings.build_reply(prompt)
+        usage = settings.prompt_usage(api, payload, prompt)
+        time.sleep(settings.sample_ttft())
+        stream = payload.get('stream') is True or ':streamGenerateContent' in path
+        try:
+            if stream:
+                include_usage = (payload.get('stream_options') or {}).get('include_usage')
+                self.stream_reply(api, tokens, usage if include_usage or api != 'openai' else None)
+            else:
+                # OpenAI 接口的 n 参数：一次返回多个独立生成的回复
+                count = max(1, int(payload.get('n') or 1)) if api == 'openai' else 1
+                replies = [tokens] + [settings.build_reply(prompt) for _ in range(count - 1)]
+                self.wait_generation(tokens)
+                self.send_json(200, self.full_reply(api, ["".join(reply) for reply in replies],
+                                                    sum(len(reply) for reply in replies), usage))
+            settings.count('completed')
+        except (BrokenPipeError, ConnectionResetError):
+            settings.count('client_disconnects')
+
+    def wait_generation(self, tokens: List[str]):
+        if self.settings.tokens_per_second > 0:
+            time.sleep(len(tokens) / self.settings.tokens_per_second)
+
+    def usage_fields(self, api: str, usage: Dict, token_count: int) -> Dict:
+        """按各服务商的格式组装 usage"""
+        prompt_tokens, cached_tokens = usage['prompt_tokens'], usage['cached_tokens']
+        if api == 'openai':
+            return {'prompt_tokens': prompt_tokens, 'completion_tokens': token_count,
+                    'prompt_tokens_details': {'cached_tokens': cached_tokens}}
+        if api == 'anthropic':
+            return {'input_tokens': prompt_tokens - cached_tokens, 'cache_read_input_tokens': cached_tokens,
+                    'output_tokens': token_count}
+        return {'promptTokenCount': prompt_tokens, 'cachedContentTokenCount': cached_tokens,
+                'candidatesTokenCount': token_count}
+
+    def full_reply(self, api: str, texts: List[str], token_count: int, usage: Dict) -> Dict:
+        text = texts[0]
+        if api == 'openai':
+            return {
+                'id': 'mock', 'object': 'chat.completion',
+                'choices': [{'index': index, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}
+                            for index, reply in enumerate(texts)],
+                'usage': self.usage_fields(api, usage, token_count)
+            }
+        if api == 'anthropic':
+            return {
+                'id': 'mock', 'type': 'message', 'role': 'assistant',
+                'content': [{'type': 'text', 'text': text}],
+                'stop_reason': 'end_turn', 'usage': self.usage_fields(api, usage, token_count)
+            }
+        return {
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+            'usageMetadata': self.usage_fields(api, usage, token_count)
+        }
+
+    def stream_chunk(self, api: str, token: str) -> Dict:
+        if api == 'openai':
+            return {'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': token}}]}
+        if api == 'anthropic':
+            return {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': token}}
+        return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': token}]}}]}
+
+    def stream_reply(self, api: str, tokens: List[str], usage: Optional[Dict] = None):
+        """按配置的速度逐token发送SSE，使用分块传输以便保持长连接"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        interval = 1 / self.settings.tokens_per_second if self.settings.tokens_per_second > 0 else 0
+        for token in tokens:
+            self.write_event(self.stream_chunk(api, token))
+            if interval:
+                time.sleep(interval)
+        if usage is not None:
+            if api == 'openai':
+                self.write_event({'object': 'chat.completion.chunk', 'choices': [],
+                                  'usage': self.usage_fields(api, usage, len(tokens))})
+            elif api == 'anthropic':
+                self.write_event({'type': 'message_delta', 'usage': self.usage_fields(api, usage, len(tokens))})
+            else:
+                self.write_event({'candidates': [], 'usageMetadata': self.usage_fields(api, usage, len(tokens))})
+        if api == 'openai':
+            self.write_chunk(b"data: [DONE]\n\n")
+        elif api == 'anthropic':
+            self.write_event({'type': 'message_stop'})
+        self.write_chunk(b"")
+
+    def write_event(self, payload: Dict):
+        self.write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+def create_server(host: str, port: int, settings: MockSettings) -> ThreadingHTTPServer:
+    handler = type('BoundMockHandler', (MockHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟大模型服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--ttft-ms', type=float, default=500.0, help="首token延迟中位数（毫秒）")
+    parser.add_argument('--ttft-sigma', type=float, default=0.5, help="首token延迟对数正态分布的sigma，0为固定值")
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help="输出速度，0为立即返回")
+    parser.add_argument('--output-tokens', type=int, default=200, help="每次回复的token数")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回500的比例")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="返回429的比例")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="429响应的Retry-After秒数")
+    parser.add_argument('--illegal-rate', type=float, default=0.0, help="回复非法棋步的比例")
+    parser.add_argument('--strategy', choices=['random', 'first'], default='random', help="从合法棋步中选择的方式")
+    parser.add_argument('--script', default=None, help="JSON文件，按步数给出优先使用的棋步列表")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, 'r', encoding='utf-8') as f:
+            script = json.load(f)
+
+    settings = MockSettings(
+        ttft_ms=args.ttft_ms, ttft_sigma=args.ttft_sigma, tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after, illegal_rate=args.illegal_rate, strategy=args.strategy,
+        script=script, seed=args.seed
+    )
+    server = create_server(args.host, args.port, settings)
+    print(f"模拟大模型服务已启动: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
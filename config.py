@@ -1,19 +1,115 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'chess-llm-battle-secret-key'
+    DEBUG = os.environ.get('DEBUG', 'true').lower() == 'true'  # 生产部署请设为false或使用 serve.py
     
     # API配置
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY')
     DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL') or 'https://api.deepseek.com/v1'
+    # 可指向本地模拟服务（benchmarks/mock_llm_server.py）做离线压测
+    ANTHROPIC_BASE_URL = os.environ.get('ANTHROPIC_BASE_URL') or 'https://api.anthropic.com/v1'
+    GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL')  # 为空时使用SDK默认端点
+    PROMPT_CACHE_CONTROL = True  # Claude 请求在系统提示词（对局规则）上标记 cache_control，其他服务商按前缀自动缓存
     
     # 对战配置
-    MAX_THINKING_TIME = 30  # 最大思考时间（秒）
-    MAX_MOVES = 200  # 最大步数
+    # 对局时钟：每方基础用时加每步加秒；每步思考（含重试）不得超过 MAX_THINKING_TIME，超时判负
+    MAX_THINKING_TIME = float(os.environ.get('MAX_THINKING_TIME', 90))  # 每步最长思考时间（秒），0为不限
+    CLOCK_BASE_TIME = float(os.environ.get('CLOCK_BASE_TIME', 1800))  # 每方基础用时（秒），0为不限总用时
+    CLOCK_INCREMENT = float(os.environ.get('CLOCK_INCREMENT', 15))  # 每走一步加秒
+    CLOCK_MARGIN = 0.5  # 模型请求提前于截止时刻结束的秒数，留出解析和落子的时间
+    MAX_MOVES = 200  # 最大步数，达到后判和
+    REPETITION_LIMIT = 3  # 同一局面出现该次数时裁决（长将/长捉判负，否则判和）
+    NO_CAPTURE_MOVES = 60  # 连续该回合数（双方各走一步为一回合）无吃子时判和
+    MOVE_DELAY = float(os.environ.get('MOVE_DELAY', 1.0))  # 每步之间的停顿（秒），便于观察；压测时设为0
+    BATTLE_POLL_INTERVAL = 0.02  # 对战任务等待模型时的让出间隔（秒），同时决定流式内容的推送粒度
+    MODEL_CALL_WORKERS = int(os.environ.get('MODEL_CALL_WORKERS', 32))  # 模型调用线程池大小，约为同时进行的对战数
+    LOOP_LAG_INTERVAL = 0.5  # 事件循环延迟采样间隔（秒）
+    LOOP_LAG_WARN = 0.2  # 事件循环延迟超过该值（秒）时记录警告
+    # 观战配置：每局对战的实时房间人数上限，超出的观众进入溢出房间，思考内容按间隔合并推送
+    SPECTATOR_MAX_VIEWERS = int(os.environ.get('SPECTATOR_MAX_VIEWERS', 500))
+    SPECTATOR_OVERFLOW_INTERVAL = 2.0  # 溢出房间思考内容的推送间隔（秒）
+    SPECTATOR_THINKING_BUFFER = 20000  # 快照中保留的当前思考内容（字符数，保留末尾）
+    SPECTATOR_RECENT_MOVES = 10  # 快照中的最近棋步数
+    BATTLE_HISTORY_LIMIT = 100  # 内存中保留的已结束对战数
+    REPLAY_SNAPSHOT_INTERVAL = 10  # 回放每隔多少步保存一次局面快照
+    # 思考过程压缩后追加写入该目录，对战日志中只保留棋步索引
+    REASONING_DIR = os.environ.get('REASONING_DIR') or os.path.join(tempfile.gettempdir(), 'aichess_reasoning')
+    REASONING_COMPRESS_LEVEL = 6
+    # 对战检查点：每步追加写入局面、棋步、时钟和最后一次完成的模型响应，进程重启后从中断处继续，
+    # 已完成的模型调用不会重复发出。写入只进页缓存，fsync 由后台线程按间隔批量执行（0为每次写入都 fsync）
+    CHECKPOINT_ENABLED = os.environ.get('CHECKPOINT_ENABLED', 'true').lower() == 'true'
+    CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR') or os.path.join(tempfile.gettempdir(), 'aichess_checkpoints')
+    CHECKPOINT_FSYNC_INTERVAL = float(os.environ.get('CHECKPOINT_FSYNC_INTERVAL', 1.0))
+    CHECKPOINT_RESUME_ON_START = os.environ.get('CHECKPOINT_RESUME_ON_START', 'true').lower() == 'true'  # 启动时自动继续未结束的对战
+    
+    # 多进程部署配置（serve.py）
+    # Socket.IO 消息队列：为空时单进程内存模式；支持 redis://、amqp:// 和本机 unix:///path.sock
+    MESSAGE_QUEUE = os.environ.get('MESSAGE_QUEUE', '')
+    BATTLE_WORKERS = int(os.environ.get('BATTLE_WORKERS', 2))  # 对战工作进程数
+    WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 2))  # Web前端进程数，端口从 WEB_BASE_PORT 起依次递增
+    WEB_BASE_PORT = int(os.environ.get('WEB_BASE_PORT', 5003))
+    WORKER_QUERY_TIMEOUT = 2.0  # Web进程向对战工作进程查询快照、棋步的超时（秒）
+    WORKER_QUERY_POLL_INTERVAL = 0.01  # 等待查询结果时的轮询间隔（秒）
+    
+    # 棋步解析配置
+    MOVE_FOLLOWUP_ENABLED = True  # 响应中没有合法棋步时，发起简短追问而不是整轮重试
+    MOVE_FOLLOWUP_MAX_CANDIDATES = 40  # 追问中最多列出的合法棋步数
+    MOVE_SAMPLES = int(os.environ.get('MOVE_SAMPLES', 1))  # 每步采样的回复数，大于1时一步内并发尝试多个回复
+    MOVE_SAMPLE_SELECTION = os.environ.get('MOVE_SAMPLE_SELECTION', 'first_legal')  # first_legal 或 majority（按棋步投票）
+    
+    # 集成玩家配置（玩家配置中传 ensemble 成员列表时启用）
+    ENSEMBLE_TIMEOUT = float(os.environ.get('ENSEMBLE_TIMEOUT', 60))  # 每步最多等待成员的秒数，到时只用已返回的棋步
+    ENSEMBLE_SELECTION = os.environ.get('ENSEMBLE_SELECTION', 'vote')  # vote（按成员权重投票）或 weighted（再乘以解析置信度）
+    ENSEMBLE_MAX_WORKERS = 8  # 成员调用线程池大小
+    
+    # 局面分析配置（/api/analyze）
+    ANALYSIS_DEFAULT_DEPTH = 3  # 默认搜索深度（半回合）
+    ANALYSIS_MAX_DEPTH = 4
+    ANALYSIS_MAX_POSITIONS = 500  # 单次请求最多局面数
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS') or os.cpu_count() or 2)  # 分析进程数
+    # 非流式请求的同步预算：估算工作量 = 局面数 × ANALYSIS_BRANCHING ** 深度，超出时转为后台任务返回 job_id
+    ANALYSIS_BRANCHING = 8  # alpha-beta 剪枝后的有效分支数（估算用）
+    ANALYSIS_SYNC_BUDGET = int(os.environ.get('ANALYSIS_SYNC_BUDGET', 16 * 8 ** 3))  # 约等于深度3下16个局面
+    ANALYSIS_JOB_LIMIT = 50  # 保留的已完成后台分析任务数
+    ANALYSIS_POLL_INTERVAL = 0.05  # 流式和同步请求轮询后台任务的间隔（秒），两次轮询之间让出事件循环
+    
+    # 日志配置
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')  # DEBUG 级别才会输出棋盘、响应全文等大段内容
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # text 或 json
+    
+    # 监控指标配置（/metrics）
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    
+    # 对冲请求配置
+    HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', 'true').lower() == 'true'
+    LATENCY_WINDOW = 100  # 每个 (provider, model) 保留的延迟样本数
+    HEDGE_MIN_SAMPLES = 5  # 样本不足时使用默认对冲延迟
+    HEDGE_DEFAULT_DELAY = 45.0  # 默认对冲延迟（秒）
+    HEDGE_MIN_DELAY = 5.0  # 对冲延迟下限（秒），避免对快速请求也发出对冲
+    HEDGE_MAX_RATIO = 0.2  # 对冲请求占主请求数的上限（成本上限）
+    HEDGE_MAX_PER_GAME = 10  # 每位玩家每局最多对冲次数
+    HEDGE_MAX_WORKERS = 16  # 对冲调度线程池大小
+    # 备用端点：model_name -> {'base_url': ..., 'model_name': ..., 'api_key_env': ...}
+    # 未配置时对冲请求发往同一端点
+    HEDGE_ALTERNATES = {}
+    
+    # 限流配置：按 (base_url, API Key) 共享额度，'default' 为未单独配置时的默认值
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMITS = {
+        'default': {'rpm': 60, 'tpm': 200000, 'concurrency': 4},
+        'https://api.siliconflow.cn/v1': {'rpm': 1000, 'tpm': 50000, 'concurrency': 8},
+    }
+    RATE_LIMIT_EST_OUTPUT_TOKENS = 1500  # 估算token消耗时计入的预估输出长度
+    RATE_LIMIT_MAX_RETRIES = 4  # 被限流后的最大重试次数
+    RATE_LIMIT_CANCEL_POLL = 0.1  # 排队等待额度时检查取消的间隔（秒）
+    BACKOFF_BASE = 1.0  # 指数退避基数（秒）
+    BACKOFF_MAX = 30.0  # 指数退避上限（秒）
     
     # 模型配置
     SUPPORTED_MODELS = {
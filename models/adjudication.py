@@ -0,0 +1,167 @@
+import random
+from typing import Dict, Optional, Tuple
+from config import Config
+from .chess_game import ChessGame
+
+# Zobrist 表：每种棋子在每个格子上一个64位随机数；固定种子，保证各进程中同一局面的哈希一致
+_rng = random.Random(20240601)
+ZOBRIST = {piece: [_rng.getrandbits(64) for _ in range(90)] for piece in 'KABNRCPkabnrcp'}
+SIDE_KEY = _rng.getrandbits(64)  # 黑方行棋时异或
+
+COLOR_NAMES = {'red': '红方', 'black': '黑方'}
+
+
+def position_hash(game: ChessGame) -> int:
+    """完整计算局面哈希（棋子位置 + 行棋方），只在开局或恢复局面时调用"""
+    h = SIDE_KEY if game.current_player == "black" else 0
+    for row in range(10):
+        for col in range(9):
+            piece = game.board[row][col]
+            if piece != '.':
+                h ^= ZOBRIST[piece][row * 9 + col]
+    return h
+
+
+def opponent(color: str) -> str:
+    return "black" if color == "red" else "red"
+
+
+def is_chase(game: ChessGame, to_pos: Tuple[int, int]) -> bool:
+    """刚走到 to_pos 的棋子是否在“捉”对方的子
+
+    按亚洲规则的简化：将帅和兵卒可以随意捉子；捉将属于将军，不算捉；
+    未过河的兵卒不算被捉；目标无保护即为捉，马、炮捉车时有保护也算捉。
+    只看走动的这个棋子，不判断闪击（移开后露出的攻击）。
+    需要扫描整个棋盘及每个目标的保护者，开销较大，只在出现循环局面、判定长捉时回放循环内的各步调用。
+    """
+    piece = game.board[to_pos[0]][to_pos[1]]
+    if piece.lower() in ('k', 'p'):
+        return False
+    enemy = opponent("red" if piece.isupper() else "black")
+    for row in range(10):
+        for col in range(9):
+            target = game.board[row][col]
+            if target == '.' or target.isupper() != (enemy == "red") or target.lower() == 'k':
+                continue
+            if target.lower() == 'p' and (row >= 5 if enemy == "red" else row <= 4):
+                continue
+            if not game.reaches(to_pos, (row, col)):
+                continue
+            if target.lower() == 'r' and piece.lower() in ('n', 'c'):
+                return True
+            if not is_protected(game, (row, col)):
+                return True
+    return False
+
+
+def is_protected(game: ChessGame, pos: Tuple[int, int]) -> bool:
+    """pos 上的棋子被吃后己方能否吃回"""
+    piece = game.board[pos[0]][pos[1]]
+    for row in range(10):
+        for col in range(9):
+            defender = game.board[row][col]
+            if defender == '.' or (row, col) == pos or defender.isupper() != piece.isupper():
+                continue
+            if game.reaches((row, col), pos):
+                return True
+    return False
+
+
+class Adjudicator:
+    """对局裁决：步数上限、重复局面、无吃子步数，以及长将/长捉
+
+    每步调用一次 record()：局面哈希按 Zobrist 增量更新，重复次数和距上次吃子的步数
+    都是常数时间维护；吃子后之前的局面不可能再出现，重复计数随之清空。
+    同一局面第 REPETITION_LIMIT 次出现时按亚洲规则判定循环：
+    只有一方在循环中步步将军（长将）则该方判负；双方都长将或都不犯规则判和；
+    没有长将时，只有一方步步将军或捉子（长捉）则该方判负。
+    每步只记录是否将军；捉子只在出现循环且无法由长将判定时，对循环内的各步回放计算。
+    """
+
+    def __init__(self, game: ChessGame, max_plies: Optional[int] = None, repetition_limit: Optional[int] = None,
+                 no_capture_moves: Optional[int] = None):
+        self.max_plies = max_plies or Config.MAX_MOVES
+        self.repetition_limit = repetition_limit or Config.REPETITION_LIMIT
+        self.no_capture_plies = 2 * (no_capture_moves or Config.NO_CAPTURE_MOVES)  # 回合数换算为步数
+        self.reset(game)
+
+    def reset(self, game: ChessGame):
+        """从 game 的当前局面重新开始计数"""
+        self.hash = position_hash(game)
+        self.ply = len(game.move_history)
+        self.plies_since_capture = 0
+        self.occurrences = {self.hash: [self.ply]}  # 局面哈希 -> 出现时的步数
+        self.checks = {}  # 步数 -> 走完这步后是否将军，只保留上次吃子之后的
+        self.verdict = None
+
+    def record(self, game: ChessGame) -> Optional[Dict]:
+        """在 game.make_move 成功后调用，返回裁决结果（对局继续时为 None）"""
+        move = game.move_history[-1]
+        from_index = move.from_pos[0] * 9 + move.from_pos[1]
+        to_index = move.to_pos[0] * 9 + move.to_pos[1]
+        self.hash ^= ZOBRIST[move.piece][from_index] ^ ZOBRIST[move.piece][to_index] ^ SIDE_KEY
+        self.ply += 1
+
+        if move.captured != '.':
+            self.hash ^= ZOBRIST[move.captured][to_index]
+            self.plies_since_capture = 0
+            self.occurrences = {}
+            self.checks = {}
+        else:
+            self.plies_since_capture += 1
+
+        if game.is_game_over():
+            return None
+
+        self.checks[self.ply] = game.is_in_check(game.current_player)
+        seen = self.occurrences.setdefault(self.hash, [])
+        seen.append(self.ply)
+
+        if len(seen) >= self.repetition_limit:
+            self.verdict = self.judge_cycle(game, seen[0], move.player)
+        elif self.plies_since_capture >= self.no_capture_plies:
+            self.verdict = self.draw('no_capture', f"连续{self.no_capture_plies // 2}回合无吃子，判和")
+        elif self.ply >= self.max_plies:
+            self.verdict = self.draw('max_moves', f"达到最大步数{self.max_plies}，判和")
+        return self.verdict
+
+    def judge_cycle(self, game: ChessGame, start_ply: int, last_mover: str) -> Dict:
+        """判定 start_ply 之后的循环：统计每方在循环中的每一步是否都是将军或捉子"""
+        plies = {'red': [], 'black': []}
+        mover = last_mover
+        for ply in range(self.ply, start_ply, -1):
+            plies[mover].append(ply)
+            mover = opponent(mover)
+
+        perpetual_check = [color for color, moved in plies.items()
+                           if moved and all(self.checks[ply] for ply in moved)]
+        if len(perpetual_check) == 1:
+            return self.loss(perpetual_check[0], 'perpetual_check', "长将")
+        if not perpetual_check:
+            chases = self.cycle_chases(game, start_ply)
+            perpetual_chase = [color for color, moved in plies.items()
+                               if moved and all(self.checks[ply] or chases[ply] for ply in moved)]
+            if len(perpetual_chase) == 1:
+                return self.loss(perpetual_chase[0], 'perpetual_chase', "长捉")
+        return self.draw('repetition', f"同一局面重复{self.repetition_limit}次，判和")
+
+    def cycle_chases(self, game: ChessGame, start_ply: int) -> Dict[int, bool]:
+        """在棋盘副本上从当前局面逐步撤回到 start_ply，计算循环内每一步是否捉子"""
+        scratch = ChessGame()
+        scratch.board = [row[:] for row in game.board]
+        offset = len(game.move_history) - self.ply
+        chases = {}
+        for ply in range(self.ply, start_ply, -1):
+            move = game.move_history[offset + ply - 1]
+            chases[ply] = not self.checks[ply] and is_chase(scratch, move.to_pos)
+            scratch.board[move.from_pos[0]][move.from_pos[1]] = move.piece
+            scratch.board[move.to_pos[0]][move.to_pos[1]] = move.captured
+        return chases
+
+    def draw(self, reason: str, message: str) -> Dict:
+        return {'result': 'draw', 'winner': None, 'reason': reason, 'message': message}
+
+    def loss(self, loser: str, reason: str, name: str) -> Dict:
+        winner = opponent(loser)
+        return {'result': winner, 'winner': winner, 'reason': reason,
+                'message': f"{COLOR_NAMES[loser]}{name}，{COLOR_NAMES[winner]}获胜"}
@@ -0,0 +1,281 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from config import Config
+from .chess_game import ChessGame
+
+# 走法排序用的子力价值（与 get_position_evaluation 一致）
+PIECE_VALUES = {'k': 1000, 'a': 20, 'b': 20, 'n': 40, 'r': 90, 'c': 45, 'p': 10}
+# 将死（将/帅被吃或无棋可走）的分值，按距离扣减以偏好更快的杀棋
+MATE_SCORE = 10000.0
+
+PositionSpec = Union[str, Dict]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def parse_position(spec: PositionSpec) -> Tuple[str, str]:
+    """把输入的局面统一为 (棋盘状态, 行棋方)
+
+    支持 FEN 字符串、get_board_state 格式字符串，或
+    {'fen': ...} / {'board_state': ..., 'player': 'red'} 字典。
+    """
+    game = ChessGame()
+    if isinstance(spec, dict):
+        if spec.get('fen'):
+            game.set_fen(spec['fen'])
+        else:
+            game.set_board_state(spec.get('board_state', ''), spec.get('player', 'red'))
+    elif '.' in spec.split()[0]:
+        # get_board_state 格式用 '.' 表示空位，可在末尾附加行棋方
+        fields = spec.split()
+        game.set_board_state(fields[0], fields[1] if len(fields) > 1 else 'red')
+    else:
+        game.set_fen(spec)
+    return game.get_board_state(), game.current_player
+
+
+class Searcher:
+    """基于 ChessGame 的定深 alpha-beta 搜索（负极大值形式）
+
+    评估沿用 get_position_evaluation 的子力分，吃子按被吃子价值优先搜索。
+    走法生成是伪合法的，因此用“将/帅被吃”判定胜负。
+    """
+
+    def __init__(self, game: ChessGame):
+        self.game = game
+        self.nodes = 0
+
+    def king_alive(self, player: str) -> bool:
+        king = 'K' if player == "red" else 'k'
+        return any(king in row for row in self.game.board)
+
+    def evaluate(self) -> float:
+        """站在行棋方视角的局面分"""
+        score = self.game.get_position_evaluation()
+        return score if self.game.current_player == "red" else -score
+
+    def ordered_moves(self) -> List[str]:
+        board = self.game.board
+
+        def victim_value(move: str) -> int:
+            target = board[int(move[3])][ord(move[2]) - ord('a')]
+            return PIECE_VALUES.get(target.lower(), 0)
+
+        return sorted(self.game.get_legal_moves(), key=victim_value, reverse=True)
+
+    def search(self, depth: int, alpha: float, beta: float, ply: int = 0) -> Tuple[float, List[str]]:
+        self.nodes += 1
+        if not self.king_alive(self.game.current_player):
+            return -MATE_SCORE + ply, []
+        if depth == 0:
+            return self.evaluate(), []
+
+        moves = self.ordered_moves()
+        if not moves:
+            return -MATE_SCORE + ply, []
+
+        best_pv = []
+        for move in moves:
+            self.game.make_move(move)
+            score, pv = self.search(depth - 1, -beta, -alpha, ply + 1)
+            self.game.undo_last_move()
+            score = -score
+            if score > alpha:
+                alpha = score
+                best_pv = [move] + pv
+                if alpha >= beta:
+                    break
+        return alpha, best_pv
+
+
+def clamp_depth(depth: Optional[int]) -> int:
+    return min(max(1, depth or Config.ANALYSIS_DEFAULT_DEPTH), Config.ANALYSIS_MAX_DEPTH)
+
+
+def estimated_cost(count: int, depth: Optional[int] = None) -> int:
+    """一批分析的估算工作量（局面数 × 有效分支数 ** 深度），用于判断能否在请求内同步完成"""
+    return count * Config.ANALYSIS_BRANCHING ** clamp_depth(depth)
+
+
+def analyze_position(spec: PositionSpec, depth: Optional[int] = None) -> Dict:
+    """分析单个局面，返回最佳棋步、分数（红方视角）、主要变例和搜索节点数"""
+    depth = clamp_depth(depth)
+    start = time.perf_counter()
+    board_state, player = parse_position(spec)
+    game = ChessGame()
+    game.set_board_state(board_state, player)
+
+    searcher = Searcher(game)
+    score, pv = searcher.search(depth, -MATE_SCORE - 1, MATE_SCORE + 1)
+    red_score = score if player == "red" else -score
+    result = {
+        'board_state': board_state,
+        'player': player,
+        'fen': game.get_fen(),
+        'best_move': pv[0] if pv else None,
+        'score': round(red_score, 2),
+        'pv': pv,
+        'depth': depth,
+        'nodes': searcher.nodes,
+        'seconds': round(time.perf_counter() - start, 4)
+    }
+    if abs(score) > MATE_SCORE - 100:
+        # 正数表示红方可在若干步内吃掉对方将/帅
+        plies = int(MATE_SCORE - abs(score))
+        result['mate_in'] = plies if red_score > 0 else -plies
+    return result
+
+
+def _analyze_task(index: int, spec: PositionSpec, depth: Optional[int]) -> Dict:
+    """进程池任务：出错时把错误放进结果，不影响同批其他局面"""
+    try:
+        return {'index': index, **analyze_position(spec, depth)}
+    except Exception as e:
+        return {'index': index, 'error': str(e)}
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """惰性创建共享进程池；使用 spawn，避免在已有后台线程的进程里 fork"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def iter_analysis(positions: List[PositionSpec], depth: Optional[int] = None) -> Iterator[Dict]:
+    """并行分析一批局面，按完成顺序逐个产出结果（带 index 字段）"""
+    if len(positions) > Config.ANALYSIS_MAX_POSITIONS:
+        raise ValueError(f"单次最多分析 {Config.ANALYSIS_MAX_POSITIONS} 个局面")
+    executor = get_executor()
+    futures = [executor.submit(_analyze_task, i, spec, depth) for i, spec in enumerate(positions)]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # 调用方提前停止迭代（如客户端断开）时取消尚未开始的任务
+        for future in futures:
+            future.cancel()
+
+
+def analyze_positions(positions: List[PositionSpec], depth: Optional[int] = None) -> List[Dict]:
+    """并行分析一批局面，结果按输入顺序返回"""
+    results = [None] * len(positions)
+    for result in iter_analysis(positions, depth):
+        results[result['index']] = result
+    return results
+
+
+class AnalysisJobs:
+    """后台分析任务
+
+    /api/analyze 的所有请求都在后台线程中消费 iter_analysis，请求处理函数不等待进程池的 future：
+    流式和预算内的请求按 follow() 轮询新结果并在两次轮询之间让出，超出预算的非流式请求直接返回 job_id，
+    由客户端按 job_id 查询进度，结束后取回按输入顺序排列的结果。只保留最近 limit 个已结束的任务。
+    任务保存在当前进程内；多 Web 进程部署时按客户端 IP 粘滞路由，查询会回到同一进程。
+    """
+
+    # 不随状态返回的内部字段
+    INTERNAL_FIELDS = ('arrivals', 'cancel')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, positions: List[PositionSpec], depth: Optional[int] = None) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'job_id': job_id,
+            'status': 'running',
+            'total': len(positions),
+            'completed': 0,
+            'depth': clamp_depth(depth),
+            'created': time.time(),
+            'finished': None,
+            'arrivals': [],  # 按完成顺序排列的结果
+            'cancel': threading.Event()
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+            self.prune()
+        threading.Thread(target=self.run, args=(job, positions, depth),
+                         name=f'analysis-{job_id}', daemon=True).start()
+        return job_id
+
+    def run(self, job: Dict, positions: List[PositionSpec], depth: Optional[int]):
+        results = iter_analysis(positions, depth)
+        try:
+            for result in results:
+                with self.lock:
+                    job['arrivals'].append(result)
+                    job['completed'] += 1
+                if job['cancel'].is_set():
+                    break
+            status, message = ('cancelled' if job['cancel'].is_set() else 'finished'), None
+        except Exception as e:
+            status, message = 'error', str(e)
+        finally:
+            results.close()  # 提前结束时取消尚未开始的局面
+        with self.lock:
+            job['status'] = status
+            job['finished'] = time.time()
+            if message:
+                job['message'] = message
+
+    def cancel(self, job_id: str):
+        """放弃任务（如流式请求的客户端断开），在下一个结果完成时停止"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job['cancel'].set()
+
+    def prune(self):
+        """去掉最早的已结束任务（调用方持有锁）"""
+        ended = [job_id for job_id, job in self.jobs.items() if job['status'] != 'running']
+        for job_id in ended[:max(0, len(ended) - self.limit)]:
+            del self.jobs[job_id]
+
+    def follow(self, job_id: str, offset: int = 0) -> Tuple[List[Dict], bool]:
+        """第 offset 个之后新完成的结果（完成顺序）以及任务是否仍在运行"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return [], False
+            return job['arrivals'][offset:], job['status'] == 'running'
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """任务状态；结果只在任务结束后返回"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = {key: value for key, value in job.items() if key not in self.INTERNAL_FIELDS}
+            if job['status'] != 'running':
+                results = [None] * job['total']
+                for result in job['arrivals']:
+                    results[result['index']] = result
+                status['results'] = results
+            return status
+
+
+def shutdown():
+    """关闭进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+# 进程内共享的后台分析任务
+jobs = AnalysisJobs(Config.ANALYSIS_JOB_LIMIT)
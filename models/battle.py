@@ -1,56 +1,79 @@
 import time
+import uuid
 from typing import List, Dict, Optional
-from .chess_game import ChessGame
+from config import Config
+from .adjudication import Adjudicator
+from .chess_game import ChessGame, PGN_RESULTS
+from .clock import ChessClock
 from .llm_player import LLMPlayer
+from .replay import GameReplay
+from .reasoning_store import ReasoningStore
+from .log import get_logger
+
+logger = get_logger('battle')
 
 class ChessBattle:
     """象棋对战管理类"""
     
-    def __init__(self, red_player: LLMPlayer, black_player: LLMPlayer):
+    def __init__(self, red_player: LLMPlayer, black_player: LLMPlayer, battle_id: Optional[str] = None):
+        self.battle_id = battle_id or uuid.uuid4().hex[:12]
         self.game = ChessGame()
         self.red_player = red_player
         self.black_player = black_player
         self.battle_log = []
+        self.replay = GameReplay()  # 棋步加周期快照，按步数重建局面
+        self.reasoning = ReasoningStore(self.battle_id)  # 思考过程，按步数读取
+        self.channel = None  # 观战推送通道（BattleChannel），对战开始运行时创建
+        self.adjudicator = Adjudicator(self.game)  # 步数上限、重复局面、无吃子和长将/长捉裁决
+        self.adjudication = None  # 裁决结果，对局未被裁决结束时为 None
+        self.clock = ChessClock()
+        self.checkpoint = None  # BattleCheckpoint，未启用检查点时为 None
+        self.resumed_response = None  # 从检查点继续时，崩溃前已完成但未落子的模型结果
+        self.reasoning_ply = None  # 思考文本已由 record_response 写入存储的步数，落子时不再重复写入
+        self.suspended = False  # 进程退出时停止：不写结束记录，重启后可继续
         self.start_time = time.time()
-        self.status = "waiting"  # waiting, playing, finished, error
+        self.status = "waiting"  # waiting, playing, paused, finished, error, stopped
         
     def start_battle(self) -> Dict:
         """开始对战（同步版本，用于测试）"""
         self.status = "playing"
         self.start_time = time.time()
         
-        move_count = 0
-        max_moves = 200  # 最大步数限制
-        
-        while not self.game.is_game_over() and move_count < max_moves:
+        while not self.is_game_over():
             try:
                 # 获取当前玩家
                 current_player = (self.red_player 
                                 if self.game.current_player == "red" 
                                 else self.black_player)
                 
-                print(f"轮到 {current_player.display_name} 下棋...")
+                logger.info("轮到 %s 下棋", current_player.display_name)
                 
-                # 获取模型的下一步棋
+                # 获取模型的下一步棋（本步截止时刻之前）
+                color = self.game.current_player
+                self.clock.start(color)
+                deadline = self.clock.turn_deadline(color)
                 move_result = current_player.get_move(
                     self.game.get_board_state(),
-                    self.game.move_history
+                    self.game.move_history,
+                    deadline=deadline
                 )
                 
+                if self.time_expired(color, deadline):
+                    break
+                
                 if move_result and self.game.make_move(move_result['move']):
+                    self.clock.stop()
                     # 记录棋步
                     self.log_move(current_player.display_name, move_result)
-                    move_count += 1
                     
-                    print(f"{current_player.display_name} 走了: {move_result['move']}")
-                    if move_result.get('thinking'):
-                        print(f"思考过程: {move_result['thinking'][:100]}...")
+                    logger.info("%s 走了: %s", current_player.display_name, move_result['move'])
+                    logger.debug("思考过程: %s", move_result.get('thinking', ''))
                     
                 else:
                     # 无效棋步，结束游戏
                     self.status = "error"
                     error_msg = f"{current_player.display_name} 产生了无效棋步"
-                    print(error_msg)
+                    logger.error(error_msg)
                     self.battle_log.append({
                         'type': 'error',
                         'message': error_msg,
@@ -61,7 +84,7 @@ class ChessBattle:
             except Exception as e:
                 self.status = "error"
                 error_msg = f"对战出错: {str(e)}"
-                print(error_msg)
+                logger.error(error_msg)
                 self.battle_log.append({
                     'type': 'error',
                     'message': error_msg,
@@ -72,6 +95,7 @@ class ChessBattle:
         # 游戏结束
         self.status = "finished"
         result = self.get_battle_result()
+        self.close_checkpoint()
         
         return {
             'result': result,
@@ -79,30 +103,162 @@ class ChessBattle:
             'duration': time.time() - self.start_time,
             'battle_log': self.battle_log,
             'final_board': self.game.get_board_unicode(),
-            'pgn': self.game.get_pgn()
+            'pgn': self.get_pgn()
         }
     
     def log_move(self, player_name: str, move_result: Dict):
-        """记录棋步到对战日志"""
+        """记录棋步到对战日志
+
+        日志只保留紧凑的棋步索引：局面由 replay 按步数重建，
+        思考过程写入 reasoning 存储，通过 get_reasoning(ply) 读取。
+        """
+        ply = len(self.game.move_history)
+        self.replay.record(self.game)
+        if self.reasoning_ply != ply:
+            self.reasoning.append(ply, move_result)
+        self.reasoning_ply = None
         log_entry = {
             'type': 'move',
             'player': player_name,
             'move': move_result['move'],
-            'thinking': move_result.get('thinking', ''),
-            'analysis': move_result.get('analysis', ''),
-            'strategy': move_result.get('strategy', ''),
+            'ply': ply,
+            'move_count': ply,
             'thinking_time': move_result.get('thinking_time', 0),
-            'board_state': self.game.get_board_state(),
-            'move_count': len(self.game.move_history),
+            'thinking_chars': len(move_result.get('raw_response') or move_result.get('thinking', '')),
             'timestamp': time.time(),
             'evaluation': self.game.get_position_evaluation()
         }
         
         self.battle_log.append(log_entry)
+        if self.checkpoint:
+            last = self.game.move_history[-1]
+            self.checkpoint.record_move(ply, self.replay.moves[-1], last.player, dict(self.clock.remaining), log_entry)
+        self.adjudicate()
+    
+    def record_response(self, color: str, move_result: Dict):
+        """模型调用完成、落子之前写入检查点，崩溃后继续时不必重新调用模型
+
+        思考文本先写入思考记录（即将走出的这一步），检查点只记棋步和解析信息。
+        """
+        if self.checkpoint:
+            ply = len(self.game.move_history)
+            self.reasoning.append(ply + 1, move_result)
+            self.reasoning_ply = ply + 1
+            self.checkpoint.record_response(ply, color, move_result)
+    
+    def take_resumed_response(self) -> Optional[Dict]:
+        """取出检查点中属于当前这一步的模型结果（只取一次）"""
+        resumed, self.resumed_response = self.resumed_response, None
+        if resumed and resumed['ply'] == len(self.game.move_history):
+            # 思考文本从思考记录中取回，记录缺失时只用棋步继续
+            reasoning = self.reasoning.get(resumed['reasoning']) if resumed.get('reasoning') else None
+            if reasoning is not None:
+                self.reasoning_ply = resumed['reasoning']
+            return {**resumed['result'], **(reasoning or {})}
+        return None
+    
+    def restore_move(self, record: Dict):
+        """从检查点继续时重放一步：落子、恢复时钟和对战日志，思考过程沿用已有的记录文件"""
+        if not self.game.make_move(record['move']):
+            raise ValueError(f"检查点中的棋步无法执行: 第 {record['ply']} 步 {record['move']}")
+        player = self.red_player if record['color'] == "red" else self.black_player
+        player.move_count += 1
+        player.total_thinking_time += record['log']['thinking_time']
+        self.clock.remaining = dict(record['clock'])
+        self.replay.record(self.game)
+        self.battle_log.append({
+            'type': 'move',
+            'player': player.display_name,
+            'move': record['move'],
+            'ply': record['ply'],
+            'move_count': record['ply'],
+            **record['log'],
+            'evaluation': self.game.get_position_evaluation()
+        })
+        self.adjudicate()
+    
+    def close_checkpoint(self):
+        """对战任务结束时调用：写入结束记录（因进程退出而停止的对局除外）并关闭检查点"""
+        if self.checkpoint is None:
+            return
+        if not (self.status == "stopped" and self.suspended):
+            self.checkpoint.record_end(self.status, self.get_battle_result())
+        self.checkpoint.close()
+    
+    def adjudicate(self):
+        """每步之后更新裁决计数"""
+        verdict = self.adjudicator.record(self.game)
+        if verdict:
+            self.set_verdict(verdict)
+    
+    def time_expired(self, color: str, deadline: Optional[float]) -> bool:
+        """本步已过截止时刻时判 color 方超时负，返回是否超时"""
+        if deadline is None or time.monotonic() < deadline:
+            return False
+        time_left = self.clock.time_left(color)
+        self.flag_fall(color, move_time_exceeded=time_left is None or time_left > 0)
+        return True
+    
+    def flag_fall(self, color: str, move_time_exceeded: bool = False):
+        """color 方超时判负：总用时耗尽，或本步思考超过 MAX_THINKING_TIME"""
+        loser, winner = ("红方", "黑方") if color == "red" else ("黑方", "红方")
+        self.clock.stop()
+        if move_time_exceeded:
+            message = f"{loser}单步思考超过{Config.MAX_THINKING_TIME:g}秒，{winner}获胜"
+        else:
+            message = f"{loser}用时耗尽，{winner}获胜"
+        self.set_verdict({'result': 'black' if color == "red" else 'red',
+                          'winner': 'black' if color == "red" else 'red',
+                          'reason': 'move_time' if move_time_exceeded else 'flag_fall',
+                          'message': message})
+    
+    def set_verdict(self, verdict: Dict):
+        """结束对局（裁决或超时）并记录到对战日志"""
+        if self.adjudication is None:
+            self.adjudication = verdict
+            logger.info("对局裁决: %s", verdict['message'])
+            self.battle_log.append({
+                'type': 'adjudication',
+                'message': verdict['message'],
+                'reason': verdict['reason'],
+                'timestamp': time.time()
+            })
+    
+    def is_game_over(self) -> bool:
+        """将帅被吃或已被裁决结束"""
+        return self.adjudication is not None or self.game.is_game_over()
+    
+    def get_reasoning(self, ply: int) -> Optional[Dict]:
+        """读取第 ply 步的思考过程"""
+        return self.reasoning.get(ply)
+    
+    def get_game_over_summary(self) -> Dict:
+        """game_over 事件的精简负载：结果与统计，不含完整日志和思考过程"""
+        return {
+            'battle_id': self.battle_id,
+            'result': self.get_battle_result(),
+            'total_moves': len(self.game.move_history),
+            'duration': time.time() - self.start_time,
+            'clock': self.clock.to_dict(),
+            'players': {
+                'red': {'name': self.red_player.display_name, 'moves': self.red_player.move_count,
+                        'thinking_time': self.red_player.total_thinking_time},
+                'black': {'name': self.black_player.display_name, 'moves': self.black_player.move_count,
+                          'thinking_time': self.black_player.total_thinking_time}
+            },
+            'errors': [entry['message'] for entry in self.battle_log if entry.get('type') == 'error']
+        }
     
     def get_battle_result(self) -> Dict:
         """获取对战结果"""
-        if not self.game.is_game_over() and self.status != "error":
+        if self.status == "stopped" and not self.is_game_over():
+            return {
+                'status': 'stopped',
+                'message': '对局已停止',
+                'winner': None
+            }
+        
+        if not self.is_game_over() and self.status != "error":
             return {
                 'status': 'ongoing',
                 'message': '对局进行中',
@@ -116,38 +272,55 @@ class ChessBattle:
                 'winner': None
             }
         
-        game_result = self.game.get_game_result()
+        adjudication = self.adjudication
+        game_result = adjudication['message'] if adjudication else self.game.get_game_result()
+        winner_color = adjudication['winner'] if adjudication else (
+            'red' if "红方获胜" in game_result else 'black' if "黑方获胜" in game_result else None)
         
-        if "白方获胜" in game_result:
+        if winner_color == 'red':
             winner = self.red_player.display_name
-            message = f"{winner} 获胜（白方）"
-        elif "黑方获胜" in game_result:
+            message = f"{winner} 获胜（红方）"
+        elif winner_color == 'black':
             winner = self.black_player.display_name
             message = f"{winner} 获胜（黑方）"
         else:
             winner = None
             message = "平局"
+        if adjudication:
+            message = f"{message}：{adjudication['message']}"
         
         return {
             'status': 'finished',
             'message': message,
             'winner': winner,
             'game_result': game_result,
+            'reason': adjudication['reason'] if adjudication else ('king_captured' if winner else None),
             'total_moves': len(self.game.move_history),
             'duration': time.time() - self.start_time
         }
     
+    def get_pgn(self) -> str:
+        """导出本局的PGN，裁决结束（超时、重复局面等）时按裁决结果记录"""
+        headers = {'Red': self.red_player.display_name, 'Black': self.black_player.display_name}
+        if self.status == "error":
+            return self.game.get_pgn(headers, '*')
+        if self.adjudication:
+            return self.game.get_pgn(headers, PGN_RESULTS[self.adjudication['winner']])
+        return self.game.get_pgn(headers)
+    
     def get_current_status(self) -> Dict:
         """获取当前对战状态"""
+        last_move = self.game.get_last_move()
         return {
             'status': self.status,
             'board_state': self.game.get_board_state(),
             'board_unicode': self.game.get_board_unicode(),
             'current_player': self.game.current_player,
             'move_count': len(self.game.move_history),
-            'is_game_over': self.game.is_game_over(),
-            'last_move': self.game.get_last_move(),
+            'is_game_over': self.is_game_over(),
+            'last_move': last_move.to_dict() if last_move else None,
             'legal_moves': self.game.get_legal_moves(),
+            'legal_move_cache': dict(self.game.legal_move_stats),
             'evaluation': self.game.get_position_evaluation(),
             'red_player': self.red_player.display_name,
             'black_player': self.black_player.display_name
@@ -163,16 +336,17 @@ class ChessBattle:
                 'start_time': self.start_time,
                 'duration': time.time() - self.start_time,
                 'total_moves': len(self.game.move_history),
-                'status': self.status
+                'status': self.status,
+                'legal_move_cache': dict(self.game.legal_move_stats)
             },
             'players': {
                 'red': red_stats,
                 'black': black_stats
             },
             'result': self.get_battle_result(),
-            'move_history': self.game.move_history,
+            'move_history': [record.to_dict() for record in self.game.move_history],
             'battle_log': self.battle_log,
-            'pgn': self.game.get_pgn()
+            'pgn': self.get_pgn()
         }
     
     def pause_battle(self):
@@ -185,17 +359,37 @@ class ChessBattle:
         if self.status == "paused":
             self.status = "playing"
     
-    def stop_battle(self):
-        """停止对战"""
+    def stop_battle(self, suspend: bool = False):
+        """停止对战；suspend=True 表示进程即将退出，检查点保留为可继续"""
+        self.suspended = suspend
         self.status = "stopped"
     
+    def release(self):
+        """从内存中移除对战时调用，删除磁盘上的思考记录和检查点"""
+        self.reasoning.close(delete=True)
+        if self.checkpoint:
+            self.checkpoint.close(delete=True)
+    
     def reset_battle(self):
         """重置对战"""
         self.game.reset()
+        self.adjudicator.reset(self.game)
+        self.adjudication = None
+        self.clock.reset()
         self.battle_log = []
+        self.replay = GameReplay()
+        self.reasoning.close(delete=True)
+        if self.checkpoint:
+            # 重置后的对局不再有可继续的前序棋步
+            self.checkpoint.close(delete=True)
+            self.checkpoint = None
+        self.reasoning = ReasoningStore(self.battle_id)
+        self.reasoning_ply = None
         self.start_time = time.time()
         self.status = "waiting"
         self.red_player.move_count = 0
         self.red_player.total_thinking_time = 0
+        self.red_player.hedge_count = 0
         self.black_player.move_count = 0
-        self.black_player.total_thinking_time = 0
\ No newline at end of file
+        self.black_player.total_thinking_time = 0
+        self.black_player.hedge_count = 0
\ No newline at end of file
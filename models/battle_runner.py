@@ -0,0 +1,374 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+from config import Config
+from .battle import ChessBattle
+from .checkpoint import BattleCheckpoint, load_checkpoint, resumable, with_api_keys
+from .event_loop import BufferedEmitter, offload
+from .llm_player import LLMPlayer
+from .ensemble_player import EnsemblePlayer
+from .rate_limiter import backoff_delay
+from .spectators import BattleChannel
+from .log import get_logger, log_context
+from .metrics import LEGAL_MOVE_CACHE, LEGAL_MOVES_SECONDS, MOVE_RETRIES, MOVES_TOTAL, BATTLES_ACTIVE
+
+logger = get_logger('battle_runner')
+
+# 对战任务的状态
+AWAITING_MODEL = "awaiting_model"  # 模型调用在线程池中进行，轮询结果并推送流式内容
+VALIDATING = "validating"          # 校验并执行棋步，失败时安排重试
+EMITTING = "emitting"              # 推送棋步更新
+IDLE = "idle"                      # 退避或步间停顿，到时后进入 next_state
+DONE = "done"
+
+MAX_MOVE_ATTEMPTS = 3  # 每步最多尝试次数
+
+
+def build_player(config: Dict, emitter, default_base_url: Optional[str] = None):
+    """由玩家配置构建玩家；配置中带 ensemble 成员列表时构建集成玩家"""
+    if config.get('ensemble'):
+        members = [build_player(member, emitter, default_base_url) for member in config['ensemble']]
+        return EnsemblePlayer(
+            members,
+            display_name=config.get('display_name', ''),
+            socketio=emitter,
+            selection=config.get('selection'),
+            weights=[member.get('weight', 1.0) for member in config['ensemble']],
+            timeout=config.get('timeout')
+        )
+    return LLMPlayer(
+        model_name=config['model_name'],
+        api_key=config['api_key'],
+        base_url=config.get('base_url', default_base_url),
+        display_name=config.get('display_name', config['model_name']),
+        socketio=emitter,
+        samples=config.get('samples'),
+        sample_selection=config.get('sample_selection')
+    )
+
+
+def create_battle(data: Dict, emitter, battle_id: Optional[str] = None, checkpoint: bool = True) -> ChessBattle:
+    """根据 /api/start_battle 的请求体创建对战（玩家的流式输出经 emitter 推送）"""
+    # 红方使用前端选择的模型，默认通过SiliconFlow API
+    red_player = build_player(data.get('red_player'), emitter, "https://api.siliconflow.cn/v1")
+    black_player = build_player(data.get('black_player'), emitter)
+    
+    battle = ChessBattle(red_player, black_player, battle_id)
+    if checkpoint and Config.CHECKPOINT_ENABLED:
+        battle.checkpoint = BattleCheckpoint.create(
+            battle.battle_id,
+            {'red': data.get('red_player'), 'black': data.get('black_player')},
+            {'base_time': battle.clock.base_time, 'increment': battle.clock.increment},
+            battle.start_time
+        )
+    return battle
+
+
+def resume_battle(battle_id: str, emitter, overrides: Optional[Dict] = None) -> ChessBattle:
+    """从检查点恢复对战：重放已走的棋步，恢复时钟和日志，接着写同一个检查点
+    
+    overrides 可按 red_player / black_player 传入玩家配置（如API密钥），覆盖检查点中的字段。
+    崩溃前已完成但未落子的模型结果会直接用于下一步，不重新调用模型。
+    
+    Raises:
+        ValueError: 检查点不存在、对局已结束或缺少API密钥
+    """
+    state = load_checkpoint(battle_id)
+    if state is None:
+        raise ValueError(f"对战 {battle_id} 没有检查点")
+    if not resumable(state):
+        raise ValueError(f"对战 {battle_id} 已结束（{state['end']['status']}），无法继续")
+    overrides = overrides or {}
+    start = state['start']
+    data = {side: with_api_keys(start['players'][color], overrides.get(side))
+            for side, color in (('red_player', 'red'), ('black_player', 'black'))}
+    
+    battle = create_battle(data, emitter, battle_id, checkpoint=False)
+    battle.start_time = start['start_time']
+    battle.clock.base_time = start['clock']['base_time']
+    battle.clock.increment = start['clock']['increment']
+    battle.clock.reset()
+    battle.reasoning.recover()
+    for record in state['moves']:
+        battle.restore_move(record)
+    battle.resumed_response = state['response']
+    
+    battle.checkpoint = BattleCheckpoint.reopen(battle_id)
+    battle.checkpoint.record_resume(len(state['moves']))
+    logger.info("从检查点继续对战 %s：已走 %d 步%s", battle_id, len(state['moves']),
+                "，沿用崩溃前已完成的模型结果" if state['response'] else "")
+    return battle
+
+
+def run_battle(battle: ChessBattle, emitter, on_move: Optional[Callable[[ChessBattle], None]] = None):
+    """运行对战（后台任务）
+    
+    emitter 需提供 emit(event, data, to=房间) 和 sleep(seconds)：单进程模式下为 socketio 实例，
+    多进程模式下为经消息队列广播的 QueueEmitter。事件只发往本局的观战房间。
+    on_move 在每步走完和对局结束时调用。
+    """
+    with log_context(battle_id=battle.battle_id):
+        logger.info("开始运行对战")
+        battle.status = "playing"
+        BATTLES_ACTIVE.inc()
+        try:
+            BattleRunner(battle, emitter, on_move).run()
+        finally:
+            BATTLES_ACTIVE.dec()
+            if battle.status in ("playing", "paused"):
+                battle.status = "finished"
+            battle.close_checkpoint()
+
+
+class BattleRunner:
+    """协作式的对战状态机
+    
+    每个状态处理函数都很快返回下一个状态；所有等待都经 emitter.sleep 让出，
+    阻塞的模型调用交给线程池，因此同一事件循环上的其他对战和观众不会被卡住。
+    模型调用期间的流式事件先进入 BufferedEmitter，由本任务在轮询时推送。
+    """
+    
+    def __init__(self, battle: ChessBattle, emitter, on_move: Optional[Callable[[ChessBattle], None]] = None):
+        self.battle = battle
+        self.emitter = BattleChannel(battle, emitter, (lambda: on_move(battle)) if on_move else None)
+        battle.channel = self.emitter
+        self.outbox = BufferedEmitter(self.emitter)
+        for player in (battle.red_player, battle.black_player):
+            player.socketio = self.outbox
+        
+        self.state = AWAITING_MODEL
+        self.player = None        # 当前行棋的玩家
+        self.color = None         # 当前行棋方
+        self.deadline = None      # 本步截止时刻（time.monotonic），重试共用
+        self.legal_moves = None   # 当前局面的合法棋步（同一步的重试间复用）
+        self.legal_stats_seen = {}  # 已计入 LEGAL_MOVE_CACHE 的合法棋步缓存统计
+        self.pending = None       # 进行中的模型调用
+        self.completed_at = None  # 模型调用结束的时刻（time.monotonic），判断结果是否在截止时刻前给出
+        self.cancel_event = None  # 当前模型调用的取消事件，超时判负后关闭仍在进行的请求
+        self.move_result = None
+        self.attempt = 0
+        self.idle_until = 0.0
+        self.next_state = None
+        self.handlers = {
+            AWAITING_MODEL: self.await_model,
+            VALIDATING: self.validate,
+            EMITTING: self.emit_move,
+            IDLE: self.idle
+        }
+    
+    def run(self):
+        while self.state != DONE:
+            if self.battle.status == "stopped":
+                # 停止同样经 finish() 推送结束事件，观众和前端不会一直停在思考中
+                logger.info("对战已被停止")
+                if self.cancel_event is not None:
+                    self.cancel_event.set()
+                self.pending = None
+                self.outbox.drain()
+                break
+            if self.battle.status == "paused" and self.turn_boundary():
+                # 暂停只在两步之间生效，时钟不在走
+                self.emitter.sleep(0.5)
+                continue
+            try:
+                self.state = self.handlers[self.state]()
+            except Exception as e:
+                logger.exception("对战过程中出现异常: %s", e)
+                self.battle.status = "error"
+                self.outbox.drain()
+                self.emitter.emit('game_error', {'battle_id': self.battle.battle_id, 'message': f'对战出错: {str(e)}'})
+                break
+        self.finish()
+    
+    def turn_boundary(self) -> bool:
+        """上一步已走完、下一步尚未开始"""
+        return self.state == AWAITING_MODEL and self.pending is None and self.attempt == 0
+    
+    def sleep_until(self, deadline: float, next_state: str) -> str:
+        """进入 IDLE 状态，到 deadline 后转入 next_state"""
+        self.idle_until = deadline
+        self.next_state = next_state
+        return IDLE
+    
+    def start_turn(self) -> str:
+        """新的一步：选出行棋方，推送思考状态，并把模型调用交给线程池"""
+        battle = self.battle
+        if self.attempt == 0:
+            if battle.is_game_over():
+                return DONE
+            self.color = battle.game.current_player
+            self.player = battle.red_player if self.color == "red" else battle.black_player
+            logger.info("当前轮到: %s", self.player.display_name)
+            
+            # 开始计时，本步（含重试）须在截止时刻前走出
+            battle.clock.start(self.color)
+            self.deadline = battle.clock.turn_deadline(self.color)
+            
+            # 发送思考状态
+            self.emitter.emit('thinking', {
+                'player': self.player.display_name,
+                'message': f'{self.player.display_name} 正在思考...',
+                'clock': battle.clock.to_dict()
+            })
+            
+            # 获取当前棋盘状态和合法棋步
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("当前棋盘状态:\n%s", battle.game.get_board_unicode())
+            with LEGAL_MOVES_SECONDS.time():
+                self.legal_moves = battle.game.get_legal_moves()
+            logger.debug("当前合法棋步数量: %d", len(self.legal_moves))
+            
+            # 从检查点继续：崩溃前已完成的模型结果直接进入校验
+            resumed = battle.take_resumed_response()
+            if resumed:
+                logger.info("使用检查点中 %s 已完成的模型结果: %s", self.player.display_name, resumed.get('move'))
+                self.move_result = resumed
+                return VALIDATING
+        else:
+            MOVE_RETRIES.inc(model=self.player.model_name)
+        
+        logger.debug("第 %d 次尝试获取 %s 的棋步", self.attempt + 1, self.player.display_name)
+        self.completed_at = None
+        self.cancel_event = threading.Event()
+        self.pending = offload(self.player.get_move, battle.game.get_board_state(),
+                               battle.game.move_history, self.legal_moves, self.deadline, self.cancel_event)
+        self.pending.add_done_callback(self.mark_completed)
+        return AWAITING_MODEL
+    
+    def mark_completed(self, future):
+        """模型调用结束时在线程池中回调，记下结束时刻"""
+        self.completed_at = time.monotonic()
+    
+    def await_model(self) -> str:
+        # 截止时刻之后才结束的调用不再采用；在截止前结束、只是尚未轮询到的结果仍然有效
+        in_time = self.pending is not None and self.pending.done() and \
+            (self.deadline is None or (self.completed_at or 0) < self.deadline)
+        if not in_time and self.time_expired():
+            return DONE
+        if self.pending is None:
+            return self.start_turn()
+        self.outbox.drain()
+        if not self.pending.done():
+            # 等待不越过截止时刻，超时判负不延后
+            wait = Config.BATTLE_POLL_INTERVAL if self.deadline is None else \
+                max(0.0, min(Config.BATTLE_POLL_INTERVAL, self.deadline - time.monotonic()))
+            self.emitter.sleep(wait)
+            return AWAITING_MODEL
+        
+        future, self.pending = self.pending, None
+        self.outbox.drain()
+        try:
+            self.move_result = future.result()
+        except Exception as e:
+            logger.warning("第 %d 次尝试时发生异常: %s", self.attempt + 1, e)
+            return self.retry(backoff_delay(self.attempt + 1))
+        logger.debug("AI返回的棋步结果: %s", self.move_result)
+        if self.move_result and self.move_result.get('move'):
+            self.battle.record_response(self.color, self.move_result)
+        return VALIDATING
+    
+    def validate(self) -> str:
+        move_result = self.move_result
+        if not move_result or not move_result.get('move'):
+            logger.warning("第 %d 次尝试：AI未返回有效棋步结果", self.attempt + 1)
+            return self.retry(backoff_delay(self.attempt))
+        if not self.battle.game.make_move(move_result['move']):
+            # 解析器只返回合法棋步，走到这里说明局面已变化，无需等待直接重试
+            logger.warning("第 %d 次尝试：无效棋步 %s", self.attempt + 1, move_result['move'])
+            return self.retry(0)
+        
+        # 棋步有效，停止计时并记录
+        self.battle.clock.stop()
+        self.battle.log_move(self.player.display_name, move_result)
+        MOVES_TOTAL.inc(model=self.player.model_name)
+        self.record_legal_cache()
+        return EMITTING
+    
+    def record_legal_cache(self):
+        """把本局合法棋步缓存的新增命中/生成次数计入 /metrics"""
+        stats = self.battle.game.legal_move_stats
+        for result, count in stats.items():
+            if count > self.legal_stats_seen.get(result, 0):
+                LEGAL_MOVE_CACHE.inc(count - self.legal_stats_seen.get(result, 0), result=result)
+        self.legal_stats_seen = dict(stats)
+    
+    def retry(self, delay: float) -> str:
+        """本次尝试失败：还有机会则等待 delay 秒后重试，否则报错结束对战"""
+        self.attempt += 1
+        if self.attempt >= MAX_MOVE_ATTEMPTS:
+            error_msg = f'{self.player.display_name} 在 {MAX_MOVE_ATTEMPTS} 次尝试后仍无法产生有效棋步'
+            logger.error(error_msg)
+            self.battle.status = "error"
+            self.emitter.emit('game_error', {'battle_id': self.battle.battle_id, 'message': error_msg})
+            return DONE
+        if delay > 0:
+            logger.info("等待%.1f秒后进行第 %d 次尝试", delay, self.attempt + 1)
+        return self.sleep_until(time.monotonic() + delay, AWAITING_MODEL)
+    
+    def emit_move(self) -> str:
+        battle = self.battle
+        move = self.move_result['move']
+        
+        # 发送棋步更新事件
+        move_data = {
+            'battle_id': battle.battle_id,
+            'player': self.player.display_name,
+            'player_color': battle.game.current_player,  # 注意：这里是下一个玩家的颜色
+            'move': move,
+            'board_state': battle.game.get_board_state(),
+            'board_unicode': battle.game.get_board_unicode(),
+            'move_count': len(battle.game.move_history),
+            'history': battle.battle_log[-10:],  # 最近10步
+            'current_player': battle.game.current_player,
+            'is_game_over': battle.is_game_over(),
+            'clock': battle.clock.to_dict(),  # 双方剩余用时（秒）
+            'timestamp': time.time()  # 发送时刻，供压测统计推送延迟
+        }
+        
+        logger.debug("发送move_made事件: %s", move_data)
+        self.emitter.emit('move_made', move_data)
+        logger.info("%s 走了: %s", self.player.display_name, move)
+        
+        self.attempt = 0
+        self.deadline = None
+        self.move_result = None
+        # 步间停顿，便于观察
+        return self.sleep_until(time.monotonic() + Config.MOVE_DELAY, AWAITING_MODEL)
+    
+    def time_expired(self) -> bool:
+        """本步超过截止时刻时判当前行棋方超时负，并取消仍在进行的请求，不再等待"""
+        if self.color is None or not self.battle.time_expired(self.color, self.deadline):
+            return False
+        logger.warning("%s 超时: %s", self.player.display_name, self.battle.adjudication['message'])
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.outbox.drain()
+        self.pending = None
+        return True
+    
+    def idle(self) -> str:
+        # 重试前的退避期间也会到达截止时刻，到时立即判负
+        if self.deadline is not None and self.time_expired():
+            return DONE
+        remaining = self.idle_until - time.monotonic()
+        if remaining > 0:
+            # 分段等待，使停止对战能及时生效；不越过本步截止时刻
+            wait = min(remaining, 0.5)
+            if self.deadline is not None:
+                wait = max(0.0, min(wait, self.deadline - time.monotonic()))
+            self.emitter.sleep(wait)
+            return IDLE
+        # 即使无需等待也让出一次，避免对战任务连续占用事件循环
+        self.emitter.sleep(0)
+        return self.next_state
+    
+    def finish(self):
+        """游戏结束，发送结果"""
+        try:
+            # 只发送结果摘要；完整棋步和思考过程通过回放接口按需获取
+            summary = self.battle.get_game_over_summary()
+            self.emitter.emit('game_over', summary)
+            logger.info("游戏结束: %s", summary['result'])
+        except Exception as e:
+            logger.exception("发送游戏结束信息时出错: %s", e)
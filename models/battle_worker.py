@@ -0,0 +1,223 @@
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+from config import Config
+from .battle import ChessBattle
+from .battle_runner import create_battle, resume_battle, run_battle
+from .message_queue import QueueEmitter, create_client_manager
+from .replay import GameReplay
+from .spectators import battle_snapshot
+from .log import get_logger, log_context
+
+logger = get_logger('battle_worker')
+
+# 已结束的对战状态
+FINISHED_STATUSES = ("finished", "error", "stopped")
+
+
+def battle_entry(battle: ChessBattle, worker_id: int) -> Dict:
+    """写入共享登记表的对战状态（只含可序列化的基本类型）
+
+    每步都会整体写入一次，只放大小固定的字段；快照和完整棋步由Web进程按需经 query 命令取得。
+    """
+    game = battle.game
+    return {
+        'battle_id': battle.battle_id,
+        'worker': worker_id,
+        'status': battle.status,
+        'move_count': len(game.move_history),
+        'red_player': battle.red_player.display_name,
+        'black_player': battle.black_player.display_name,
+        'start_time': battle.start_time,
+        'board_state': game.get_board_state(),
+        'current_player': game.current_player,
+        'is_game_over': battle.is_game_over(),
+        'legal_move_cache': dict(game.legal_move_stats),
+        'last_move': battle.replay.moves[-1] if len(battle.replay) else None
+    }
+
+
+def battle_query(battle: ChessBattle, kind: str):
+    """响应Web进程的按需查询：'snapshot' 为观众加入时的快照，'moves' 为完整棋步"""
+    if kind == 'snapshot':
+        return battle.channel.snapshot_data() if battle.channel else battle_snapshot(battle)
+    if kind == 'moves':
+        return list(battle.replay.moves)
+    raise ValueError(f"未知的查询: {kind}")
+
+
+def worker_main(worker_id: int, commands, registry, replies):
+    """对战工作进程入口
+
+    从 commands 队列接收 ('start', battle_id, data) / ('resume', battle_id, overrides) /
+    ('stop', battle_id) / ('release', battle_id) / ('query', battle_id, kind, reply_id) /
+    ('shutdown',) 命令，每局对战在独立线程中运行，Socket.IO 事件经消息队列广播给所有 Web 前端，
+    对战状态写入共享的 registry，查询结果写入共享的 replies[reply_id]。
+    """
+    emitter = QueueEmitter(create_client_manager(write_only=True))
+    battles = {}
+
+    def publish(battle: ChessBattle):
+        registry[battle.battle_id] = battle_entry(battle, worker_id)
+
+    def run(battle: ChessBattle):
+        try:
+            run_battle(battle, emitter, on_move=publish)
+        finally:
+            publish(battle)
+
+    logger.info("对战工作进程 %d 已启动", worker_id)
+    while True:
+        command = commands.get()
+        action = command[0]
+        if action == 'shutdown':
+            # 进程退出：进行中的对战保留检查点，重启后继续
+            for battle in battles.values():
+                battle.stop_battle(suspend=True)
+            break
+        battle_id = command[1]
+        if action in ('start', 'resume'):
+            with log_context(battle_id=battle_id):
+                try:
+                    if action == 'start':
+                        battle = create_battle(command[2], emitter, battle_id)
+                    else:
+                        if battle_id in battles and battles[battle_id].status not in FINISHED_STATUSES:
+                            logger.warning("对战仍在进行，忽略继续请求")
+                            continue
+                        battle = resume_battle(battle_id, emitter, command[2])
+                except Exception as e:
+                    logger.exception("创建对战失败: %s", e)
+                    registry[battle_id] = {**registry.get(battle_id, {}), 'status': 'error', 'message': str(e)}
+                    continue
+            previous = battles.get(battle_id)
+            if previous:
+                # 继续的是本进程中出错结束的对局，文件已由新对象接管，只关闭旧对象的句柄
+                previous.reasoning.close()
+            battles[battle_id] = battle
+            publish(battle)
+            threading.Thread(target=run, args=(battle,), name=f'battle-{battle_id}', daemon=True).start()
+        elif action == 'stop':
+            if battle_id in battles:
+                battles[battle_id].stop_battle()
+        elif action == 'release':
+            battle = battles.pop(battle_id, None)
+            if battle:
+                battle.release()
+        elif action == 'query':
+            battle = battles.get(battle_id)
+            try:
+                replies[command[3]] = battle_query(battle, command[2]) if battle else None
+            except Exception as e:
+                logger.exception("查询对战 %s 失败: %s", battle_id, e)
+                replies[command[3]] = None
+    logger.info("对战工作进程 %d 已退出", worker_id)
+
+
+class WorkerPool:
+    """Web 前端进程侧的对战调度：按负载把新对战分配给工作进程，并读取共享登记表
+
+    registry、replies 和 lock 由 multiprocessing.Manager 创建，所有前端进程共享，
+    因此任一前端都能查询、停止其他前端发起的对战。快照和完整棋步不在登记表中，
+    需要时向对战所在的工作进程发 query 命令，轮询 replies 等待结果；sleep 为轮询时的等待函数
+    （Web进程传入 socketio.sleep，不阻塞事件循环）。
+    """
+
+    def __init__(self, commands: List, registry, lock, replies, sleep: Callable[[float], None] = time.sleep):
+        self.commands = commands
+        self.registry = registry
+        self.lock = lock
+        self.replies = replies
+        self.sleep = sleep
+
+    def _load(self) -> List[int]:
+        """每个工作进程上进行中的对战数"""
+        load = [0] * len(self.commands)
+        for entry in self.registry.values():
+            if entry.get('status') not in FINISHED_STATUSES and entry.get('worker') is not None:
+                load[entry['worker']] += 1
+        return load
+
+    def _prune(self):
+        """超出保留上限时丢弃最早结束的对战，并通知所在工作进程释放资源"""
+        finished = sorted((e for e in self.registry.values() if e.get('status') in FINISHED_STATUSES),
+                          key=lambda e: e.get('start_time', 0))
+        for entry in finished[:max(0, len(finished) - Config.BATTLE_HISTORY_LIMIT)]:
+            self.registry.pop(entry['battle_id'], None)
+            self.commands[entry['worker']].put(('release', entry['battle_id']))
+
+    def start_battle(self, data: Dict) -> str:
+        """把对战分配给当前负载最低的工作进程，返回 battle_id"""
+        return self._assign('start', uuid.uuid4().hex[:12], data)
+
+    def resume_battle(self, battle_id: str, overrides: Optional[Dict] = None) -> str:
+        """从检查点继续对战（分配方式与新对战相同）"""
+        entry = self.get(battle_id)
+        if entry and entry.get('status') not in FINISHED_STATUSES:
+            raise ValueError(f"对战 {battle_id} 正在进行")
+        return self._assign('resume', battle_id, overrides or {})
+
+    def _assign(self, action: str, battle_id: str, data: Dict) -> str:
+        with self.lock:
+            load = self._load()
+            worker = load.index(min(load))
+            # 先占位，使并发的分配请求能看到这局对战
+            self.registry[battle_id] = {'battle_id': battle_id, 'worker': worker, 'status': 'waiting',
+                                        'start_time': time.time(), 'move_count': 0}
+            self.registry['__last__'] = {'battle_id': battle_id}
+            self._prune()
+        self.commands[worker].put((action, battle_id, data))
+        logger.info("对战 %s 分配到工作进程 %d（当前负载 %s）", battle_id, worker, load)
+        return battle_id
+
+    def stop_battle(self, battle_id: Optional[str] = None):
+        entry = self.get(battle_id or self.last_battle_id())
+        if entry:
+            self.commands[entry['worker']].put(('stop', entry['battle_id']))
+
+    def get(self, battle_id: Optional[str]) -> Optional[Dict]:
+        if not battle_id or battle_id == '__last__':
+            return None
+        return self.registry.get(battle_id)
+
+    def last_battle_id(self) -> Optional[str]:
+        """最近开始的一局（供前端状态接口使用）"""
+        return self.registry.get('__last__', {}).get('battle_id')
+
+    def list_battles(self) -> List[Dict]:
+        return [{key: entry.get(key) for key in
+                 ('battle_id', 'status', 'move_count', 'red_player', 'black_player', 'start_time', 'worker')}
+                for battle_id, entry in self.registry.items() if battle_id != '__last__']
+
+    def query(self, battle_id: Optional[str], kind: str):
+        """向对战所在的工作进程查询（见 battle_query），对战不存在或超时返回None"""
+        entry = self.get(battle_id)
+        if entry is None or entry.get('worker') is None:
+            return None
+        reply_id = uuid.uuid4().hex
+        self.commands[entry['worker']].put(('query', battle_id, kind, reply_id))
+        deadline = time.monotonic() + Config.WORKER_QUERY_TIMEOUT
+        while time.monotonic() < deadline:
+            if reply_id in self.replies:
+                return self.replies.pop(reply_id)
+            self.sleep(Config.WORKER_QUERY_POLL_INTERVAL)
+        # 工作进程卡住时才会超时；之后迟到的结果不会再被读取（reply_id 唯一，不影响其他查询）
+        self.replies.pop(reply_id, None)
+        logger.warning("查询对战 %s 的 %s 超时", battle_id, kind)
+        return None
+
+    def snapshot(self, battle_id: Optional[str]) -> Optional[Dict]:
+        """观众加入时的局面快照"""
+        return self.query(battle_id, 'snapshot')
+
+    def replay(self, battle_id: Optional[str]) -> Optional[GameReplay]:
+        """由工作进程返回的棋步重建回放"""
+        moves = self.query(battle_id, 'moves')
+        if moves is None:
+            return None
+        return GameReplay.from_moves(moves)
+
+    def shutdown(self):
+        for commands in self.commands:
+            commands.put(('shutdown',))
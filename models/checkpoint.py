@@ -0,0 +1,305 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from config import Config
+from .chess_game import json_default
+from .log import get_logger
+from .reasoning_store import REASONING_FIELDS
+
+logger = get_logger('checkpoint')
+
+# 玩家配置中不写入检查点的字段
+SECRET_FIELDS = ('api_key',)
+# 检查点中没有密钥时，按模型名从这些环境变量读取（玩家配置也可以用 api_key_env 指定变量名）
+PROVIDER_KEY_ENV = (
+    ('deepseek', 'DEEPSEEK_API_KEY'),
+    ('gemini', 'GEMINI_API_KEY'),
+    ('claude', 'ANTHROPIC_API_KEY'),
+    ('gpt', 'OPENAI_API_KEY'),
+    ('openai', 'OPENAI_API_KEY'),
+)
+# 可以继续的结束状态：出错结束的对战（如服务商故障）允许经接口手动继续
+RESUMABLE_END_STATUSES = ("error",)
+
+
+def public_config(config: Dict) -> Dict:
+    """去掉密钥后的玩家配置（集成玩家逐个成员处理）"""
+    cleaned = {key: value for key, value in config.items() if key not in SECRET_FIELDS}
+    if config.get('ensemble'):
+        cleaned['ensemble'] = [public_config(member) for member in config['ensemble']]
+    return cleaned
+
+
+def env_api_key(config: Dict) -> Optional[str]:
+    """由 api_key_env 或模型名对应的环境变量取得密钥"""
+    if config.get('api_key_env'):
+        return os.environ.get(config['api_key_env'])
+    model_name = config.get('model_name', '').lower()
+    for keyword, variable in PROVIDER_KEY_ENV:
+        if keyword in model_name:
+            return os.environ.get(variable)
+    return None
+
+
+def with_api_keys(config: Dict, override: Optional[Dict] = None) -> Dict:
+    """补回密钥：优先使用 override（继续对战请求中传入的玩家配置），其次环境变量
+
+    Raises:
+        ValueError: 某个玩家（或集成成员）取不到密钥
+    """
+    override = override or {}
+    merged = {**config, **{key: value for key, value in override.items() if key != 'ensemble'}}
+    if config.get('ensemble'):
+        members = override.get('ensemble') or []
+        merged['ensemble'] = [with_api_keys(member, members[index] if index < len(members) else None)
+                              for index, member in enumerate(config['ensemble'])]
+        return merged
+    merged['api_key'] = merged.get('api_key') or env_api_key(merged)
+    if not merged['api_key']:
+        raise ValueError(f"缺少 {merged.get('display_name') or merged.get('model_name')} 的API密钥")
+    return merged
+
+
+class FsyncBatcher:
+    """检查点的批量 fsync
+
+    写入只经 write/flush 进入页缓存（进程崩溃不会丢失），后台线程每隔 interval 秒
+    对有新写入的文件统一 fsync 一次，对战任务不等待磁盘。interval 为0时每次写入都同步 fsync。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.dirty = set()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {'records': 0, 'batches': 0, 'fsyncs': 0}
+
+    def mark(self, checkpoint: "BattleCheckpoint"):
+        if self.interval <= 0:
+            checkpoint.sync()
+            with self.lock:
+                self.stats['records'] += 1
+                self.stats['fsyncs'] += 1
+            return
+        with self.lock:
+            self.stats['records'] += 1
+            self.dirty.add(checkpoint)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='checkpoint-fsync', daemon=True)
+                self.thread.start()
+
+    def discard(self, checkpoint: "BattleCheckpoint"):
+        with self.lock:
+            self.dirty.discard(checkpoint)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """对积累的文件执行 fsync"""
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+        if not dirty:
+            return
+        for checkpoint in dirty:
+            checkpoint.sync()
+        with self.lock:
+            self.stats['batches'] += 1
+            self.stats['fsyncs'] += len(dirty)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, pending=len(self.dirty))
+
+
+class BattleCheckpoint:
+    """每局对战的检查点文件
+
+    追加写入的 JSON 行，记录类型：
+        start     玩家配置（不含密钥）、时钟设置和开始时间
+        response  模型调用完成、尚未落子时的结果（最后一次完成的模型响应）：棋步和解析信息，
+                  思考文本已写入思考记录，reasoning 为其中的步数
+        move      落子后的棋步、双方剩余用时和日志字段
+        resume    一次从检查点继续
+        end       对局结束（用户停止、终局或出错）
+    进程崩溃时只有最后一行可能不完整，读取时丢弃。
+    """
+
+    def __init__(self, battle_id: str, directory: Optional[str] = None):
+        self.battle_id = battle_id
+        self.directory = directory or Config.CHECKPOINT_DIR
+        self.path = os.path.join(self.directory, f"{battle_id}.ckpt")
+        self.file = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, battle_id: str, players: Dict[str, Dict], clock: Dict, start_time: float,
+               directory: Optional[str] = None) -> "BattleCheckpoint":
+        """新建检查点并写入 start 记录；players 为 {'red': 配置, 'black': 配置}"""
+        checkpoint = cls(battle_id, directory)
+        checkpoint.open('wb')
+        checkpoint.append({
+            'type': 'start',
+            'battle_id': battle_id,
+            'players': {color: public_config(config) for color, config in players.items()},
+            'clock': clock,
+            'start_time': start_time
+        })
+        return checkpoint
+
+    @classmethod
+    def reopen(cls, battle_id: str, directory: Optional[str] = None) -> "BattleCheckpoint":
+        """继续对战时打开已有的检查点，截掉崩溃时写了一半的末行"""
+        checkpoint = cls(battle_id, directory)
+        with open(checkpoint.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        checkpoint.open('ab')
+        return checkpoint
+
+    def open(self, mode: str):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.file = open(self.path, mode)
+        except OSError as e:
+            logger.warning("检查点目录不可写（%s），本局不记录检查点: %s", self.directory, e)
+            self.file = None
+
+    def append(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=json_default)
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line.encode('utf-8') + b"\n")
+            self.file.flush()
+        checkpoints.mark(self)
+
+    def record_response(self, ply: int, color: str, move_result: Dict):
+        result = {key: value for key, value in move_result.items() if key not in REASONING_FIELDS}
+        self.append({'type': 'response', 'ply': ply, 'color': color, 'result': result, 'reasoning': ply + 1})
+
+    def record_move(self, ply: int, move: str, color: str, clock: Dict, log_entry: Dict):
+        self.append({'type': 'move', 'ply': ply, 'move': move, 'color': color, 'clock': clock,
+                     'log': {key: log_entry[key] for key in ('thinking_time', 'thinking_chars', 'timestamp')}})
+
+    def record_resume(self, ply: int):
+        self.append({'type': 'resume', 'ply': ply, 'timestamp': time.time()})
+
+    def record_end(self, status: str, result: Dict):
+        self.append({'type': 'end', 'status': status, 'result': result, 'timestamp': time.time()})
+
+    def sync(self):
+        with self.lock:
+            if self.file is not None:
+                os.fsync(self.file.fileno())
+
+    def close(self, delete: bool = False):
+        """fsync 后关闭；delete=True 时删除文件"""
+        checkpoints.discard(self)
+        with self.lock:
+            if self.file is not None:
+                try:
+                    os.fsync(self.file.fileno())
+                finally:
+                    self.file.close()
+                    self.file = None
+        if delete:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def load_checkpoint(battle_id: str, directory: Optional[str] = None) -> Optional[Dict]:
+    """读取检查点，返回 {'start', 'moves', 'response', 'end', 'resumes'}；文件不存在或没有 start 记录时返回None
+
+    response 只在它属于尚未走出的那一步时保留（崩溃发生在模型返回之后、落子之前）。
+    """
+    path = os.path.join(directory or Config.CHECKPOINT_DIR, f"{battle_id}.ckpt")
+    state = {'start': None, 'moves': [], 'response': None, 'end': None, 'resumes': 0}
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # 崩溃时写了一半的末行
+                kind = record.get('type')
+                if kind == 'start':
+                    state['start'] = record
+                elif kind == 'move':
+                    state['moves'].append(record)
+                    state['response'] = None
+                elif kind == 'response':
+                    state['response'] = record
+                elif kind == 'resume':
+                    state['resumes'] += 1
+                    state['end'] = None
+                elif kind == 'end':
+                    state['end'] = record
+    except OSError:
+        return None
+    if state['start'] is None:
+        return None
+    if state['response'] and state['response']['ply'] != len(state['moves']):
+        state['response'] = None
+    return state
+
+
+def resumable(state: Dict) -> bool:
+    return state['end'] is None or state['end']['status'] in RESUMABLE_END_STATUSES
+
+
+def list_checkpoints(directory: Optional[str] = None) -> List[Dict]:
+    """目录中所有检查点的摘要，按最后写入时间排序"""
+    directory = directory or Config.CHECKPOINT_DIR
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.ckpt')]
+    except OSError:
+        return []
+    summaries = []
+    for name in names:
+        battle_id = name[:-len('.ckpt')]
+        state = load_checkpoint(battle_id, directory)
+        if state is None:
+            continue
+        players = state['start']['players']
+        keys_available = True
+        try:
+            for config in players.values():
+                with_api_keys(config)
+        except ValueError:
+            keys_available = False
+        summaries.append({
+            'battle_id': battle_id,
+            'move_count': len(state['moves']),
+            'red_player': players['red'].get('display_name'),
+            'black_player': players['black'].get('display_name'),
+            'start_time': state['start']['start_time'],
+            'updated': os.path.getmtime(os.path.join(directory, name)),
+            'ended': state['end']['status'] if state['end'] else None,
+            'resumable': resumable(state),
+            'pending_response': state['response'] is not None,
+            'resumes': state['resumes'],
+            'keys_available': keys_available  # 为False时需在继续请求中传入密钥，启动时不会自动继续
+        })
+    summaries.sort(key=lambda summary: summary['updated'])
+    return summaries
+
+
+def startup_resume_ids(directory: Optional[str] = None) -> List[str]:
+    """启动时自动继续的对战：没有结束记录且密钥可从环境变量取得"""
+    if not (Config.CHECKPOINT_ENABLED and Config.CHECKPOINT_RESUME_ON_START):
+        return []
+    return [summary['battle_id'] for summary in list_checkpoints(directory)
+            if summary['ended'] is None and summary['keys_available']]
+
+
+# 进程内共享的批量 fsync
+checkpoints = FsyncBatcher(Config.CHECKPOINT_FSYNC_INTERVAL)
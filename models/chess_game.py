@@ -1,6 +1,144 @@
-from typing import List, Optional, Dict, Tuple
+from typing import FrozenSet, List, Optional, Dict, Tuple
+import re
 import time
 import copy
+from collections import deque
+from .log import get_logger
+
+logger = get_logger('chess_game')
+
+# 坐标棋步格式，如 "h2e2"
+COORD_MOVE_RE = re.compile(r'^[a-i][0-9][a-i][0-9]$')
+
+# 悔棋时可直接恢复合法棋步缓存的最大步数，更早的局面悔棋后重新生成
+LEGAL_CACHE_DEPTH = 64
+
+# 记谱数字：红方用中文数字，黑方用阿拉伯数字
+RED_NUMERALS = ['一', '二', '三', '四', '五', '六', '七', '八', '九']
+BLACK_NUMERALS = ['1', '2', '3', '4', '5', '6', '7', '8', '9']
+
+# 记谱规范化映射：棋子名（含繁体与红黑异字）统一为棋子类型，各种数字统一为阿拉伯数字
+_NOTATION_PIECES = {
+    '帅': 'k', '帥': 'k', '将': 'k', '將': 'k',
+    '仕': 'a', '士': 'a',
+    '相': 'b', '象': 'b',
+    '马': 'n', '馬': 'n', '傌': 'n',
+    '车': 'r', '車': 'r', '俥': 'r',
+    '炮': 'c', '砲': 'c', '包': 'c',
+    '兵': 'p', '卒': 'p',
+}
+_NOTATION_DIGITS = {}
+for _i, _ch in enumerate(RED_NUMERALS):
+    _NOTATION_DIGITS[_ch] = str(_i + 1)
+    _NOTATION_DIGITS[str(_i + 1)] = str(_i + 1)
+    _NOTATION_DIGITS[chr(ord('１') + _i)] = str(_i + 1)
+_NOTATION_ACTIONS = {'进': '进', '進': '进', '退': '退', '平': '平', '前': '前', '后': '后', '後': '后', '中': '中'}
+
+
+def canonical_notation(notation: str) -> str:
+    """将中文记谱规范化，便于不同写法之间比较（如 "炮二平五" 与 "砲2平5"）"""
+    result = []
+    for ch in notation:
+        if ch in _NOTATION_PIECES:
+            result.append(_NOTATION_PIECES[ch])
+        elif ch in _NOTATION_DIGITS:
+            result.append(_NOTATION_DIGITS[ch])
+        elif ch in _NOTATION_ACTIONS:
+            result.append(_NOTATION_ACTIONS[ch])
+    return "".join(result)
+
+
+# PGN 结果标记
+PGN_RESULTS = {'red': '1-0', 'black': '0-1', None: '1/2-1/2'}
+
+
+# 棋子中文名
+PIECE_NAMES = {
+    'K': '帅', 'A': '仕', 'B': '相', 'N': '马', 'R': '车', 'C': '炮', 'P': '兵',
+    'k': '将', 'a': '士', 'b': '象', 'n': '马', 'r': '车', 'c': '炮', 'p': '卒'
+}
+
+
+def format_notation(from_pos: Tuple[int, int], to_pos: Tuple[int, int], piece: str, prefix: str = "") -> str:
+    """生成中文记谱
+    
+    红方纵线从己方右侧起用中文数字“一”到“九”，黑方用阿拉伯数字“1”到“9”。
+    车、炮、兵、帅直行时记步数，马、相、仕记到达的纵线。
+    prefix 为同一纵线上有相同棋子时的前/中/后，替代起始纵线编号。
+    """
+    piece_name = PIECE_NAMES.get(piece, piece)
+    is_red = piece.isupper()
+    numerals = RED_NUMERALS if is_red else BLACK_NUMERALS
+    from_file = 9 - from_pos[1] if is_red else from_pos[1] + 1
+    to_file = 9 - to_pos[1] if is_red else to_pos[1] + 1
+    head = f"{prefix}{piece_name}" if prefix else f"{piece_name}{numerals[from_file - 1]}"
+    
+    if from_pos[0] == to_pos[0]:  # 平移
+        return f"{head}平{numerals[to_file - 1]}"
+    
+    forward = to_pos[0] < from_pos[0] if is_red else to_pos[0] > from_pos[0]
+    action = '进' if forward else '退'
+    if piece.lower() in ('n', 'b', 'a'):  # 斜行棋子记到达纵线
+        return f"{head}{action}{numerals[to_file - 1]}"
+    steps = abs(to_pos[0] - from_pos[0])
+    return f"{head}{action}{numerals[steps - 1]}"
+
+
+class MoveRecord:
+    """move_history 中的一步棋
+    
+    使用 __slots__ 减少每步的内存分配；中文记谱在首次访问时才生成并缓存
+    （走子时只记录前/中/后前缀，因为它依赖走子前的局面）。
+    兼容原先的字典访问方式（record['piece']、record.get('notation')），
+    序列化时使用 to_dict()。
+    """
+    
+    __slots__ = ('move', 'from_pos', 'to_pos', 'piece', 'captured', 'player', 'timestamp', 'prefix', '_notation')
+    
+    FIELDS = ('move', 'from_pos', 'to_pos', 'piece', 'captured', 'player', 'timestamp', 'notation')
+    
+    def __init__(self, move: str, from_pos: Tuple[int, int], to_pos: Tuple[int, int], piece: str,
+                 captured: str, player: str, timestamp: float, prefix: str = ""):
+        self.move = move
+        self.from_pos = from_pos
+        self.to_pos = to_pos
+        self.piece = piece
+        self.captured = captured
+        self.player = player
+        self.timestamp = timestamp
+        self.prefix = prefix
+        self._notation = None
+    
+    @property
+    def notation(self) -> str:
+        if self._notation is None:
+            self._notation = format_notation(self.from_pos, self.to_pos, self.piece, self.prefix)
+        return self._notation
+    
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+    
+    def keys(self):
+        return self.FIELDS
+    
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+    
+    def __repr__(self) -> str:
+        return f"MoveRecord({self.to_dict()!r})"
+
+
+def json_default(obj):
+    """json.dumps 的 default 回调：MoveRecord 等带 to_dict 的对象转为字典"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
 
 class ChessGame:
     """中国象棋游戏核心逻辑类"""
@@ -11,12 +149,11 @@ class ChessGame:
         self.current_player = "red"  # red=红方, black=黑方
         self.start_time = time.time()
         self.move_times = []
+        self.clear_legal_cache()
+        self.legal_move_stats = {'generated': 0, 'reused': 0}  # 走法生成次数 / 命中缓存省去的生成次数
         
         # 棋子名称映射
-        self.piece_names = {
-            'K': '帅', 'A': '仕', 'B': '相', 'N': '马', 'R': '车', 'C': '炮', 'P': '兵',
-            'k': '将', 'a': '士', 'b': '象', 'n': '马', 'r': '车', 'c': '炮', 'p': '卒'
-        }
+        self.piece_names = PIECE_NAMES
         
     def init_board(self) -> List[List[str]]:
         """初始化中国象棋棋盘"""
@@ -45,7 +182,7 @@ class ChessGame:
         """
         try:
             # 解析棋步
-            if len(move_str) == 4 and move_str[0].isalpha():
+            if COORD_MOVE_RE.match(move_str):
                 # 坐标格式：如 "a0a1"
                 from_pos = self.coord_to_pos(move_str[:2])
                 to_pos = self.coord_to_pos(move_str[2:])
@@ -56,26 +193,25 @@ class ChessGame:
             if from_pos is None or to_pos is None:
                 return False
                 
-            # 检查是否为合法棋步
-            if self.is_valid_move(from_pos, to_pos):
+            # 检查是否为合法棋步（查本局面缓存的合法棋步集合）
+            if self.pos_to_coord(from_pos) + self.pos_to_coord(to_pos) in self.get_legal_move_set():
                 # 执行移动
                 piece = self.board[from_pos[0]][from_pos[1]]
                 captured_piece = self.board[to_pos[0]][to_pos[1]]
+                # 记谱延迟到读取时生成，这里只记录依赖走子前局面的前/中/后前缀
+                prefix = self._tandem_prefix(from_pos, piece)
                 
                 self.board[to_pos[0]][to_pos[1]] = piece
                 self.board[from_pos[0]][from_pos[1]] = '.'
+                # 走子前局面的缓存留给悔棋时恢复
+                self.legal_cache_stack.append(self.legal_cache)
+                self.legal_cache = None
                 
                 # 记录棋步
-                self.move_history.append({
-                    'move': move_str,
-                    'from_pos': from_pos,
-                    'to_pos': to_pos,
-                    'piece': piece,
-                    'captured': captured_piece,
-                    'player': self.current_player,
-                    'timestamp': time.time(),
-                    'notation': self.pos_to_chinese_notation(from_pos, to_pos, piece)
-                })
+                self.move_history.append(MoveRecord(
+                    move_str, from_pos, to_pos, piece, captured_piece,
+                    self.current_player, time.time(), prefix
+                ))
                 
                 self.switch_player()
                 return True
@@ -83,7 +219,7 @@ class ChessGame:
                 return False
                 
         except Exception as e:
-            print(f"棋步解析错误: {e}")
+            logger.warning("棋步解析错误: %s", e)
             return False
     
     def coord_to_pos(self, coord: str) -> Optional[Tuple[int, int]]:
@@ -102,27 +238,42 @@ class ChessGame:
         return chr(ord('a') + col) + str(row)
     
     def parse_chinese_notation(self, notation: str) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
-        """解析中文记谱法"""
-        # 这里简化处理，实际需要复杂的中文记谱解析
-        # 暂时返回None，让系统使用坐标格式
+        """解析中文记谱法
+        
+        将当前局面下每个合法棋步生成标准记谱，与输入做规范化比较。
+        兼容繁体棋子名（車、馬、砲等）、红黑用字（兵/卒、仕/士）以及
+        中文数字、阿拉伯数字和全角数字。
+        """
+        target = canonical_notation(notation)
+        if len(target) != 4:
+            return None, None
+        
+        for move in self.get_legal_moves():
+            from_pos = self.coord_to_pos(move[:2])
+            to_pos = self.coord_to_pos(move[2:])
+            piece = self.board[from_pos[0]][from_pos[1]]
+            if canonical_notation(self.pos_to_chinese_notation(from_pos, to_pos, piece)) == target:
+                return from_pos, to_pos
         return None, None
     
     def pos_to_chinese_notation(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int], piece: str) -> str:
-        """将移动转换为中文记谱法"""
-        piece_name = self.piece_names.get(piece, piece)
-        from_col = ['一', '二', '三', '四', '五', '六', '七', '八', '九'][from_pos[1]]
-        to_col = ['一', '二', '三', '四', '五', '六', '七', '八', '九'][to_pos[1]]
-        
-        if from_pos[1] == to_pos[1]:  # 直进直退
-            if from_pos[0] > to_pos[0]:
-                action = '进'
-                steps = from_pos[0] - to_pos[0]
-            else:
-                action = '退'
-                steps = to_pos[0] - from_pos[0]
-            return f"{piece_name}{from_col}{action}{['一', '二', '三', '四', '五', '六', '七', '八', '九'][steps-1]}"
-        else:  # 平移
-            return f"{piece_name}{from_col}平{to_col}"
+        """将移动转换为中文记谱法（需要在走子之前调用，以便判断同一纵线上的前/后棋子）"""
+        return format_notation(from_pos, to_pos, piece, self._tandem_prefix(from_pos, piece))
+    
+    def _tandem_prefix(self, pos: Tuple[int, int], piece: str) -> str:
+        """同一纵线上存在相同棋子时返回前/中/后，否则返回空字符串"""
+        row, col = pos
+        rows = [r for r in range(10) if self.board[r][col] == piece]
+        if len(rows) < 2:
+            return ""
+        # 按前进方向排序：红方行号越小越靠前，黑方行号越大越靠前
+        rows.sort(reverse=piece.islower())
+        index = rows.index(row)
+        if index == 0:
+            return '前'
+        if index == len(rows) - 1:
+            return '后'
+        return '中'
     
     def is_valid_move(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> bool:
         """检查移动是否合法"""
@@ -263,6 +414,51 @@ class ChessGame:
         
         return False
     
+    def reaches(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> bool:
+        """from_pos 上的棋子按走法规则能否到达 to_pos（不论轮到哪一方、目标格上是什么棋子）
+
+        用于判断攻击与保护，不改变走法生成（get_legal_moves 仍使用 is_valid_move）。
+        """
+        piece = self.board[from_pos[0]][from_pos[1]]
+        if piece == '.' or from_pos == to_pos:
+            return False
+        # check_piece_move_rules 按 current_player 判断九宫、过河，这里临时切换为棋子所属方
+        mover = self.current_player
+        self.current_player = "red" if piece.isupper() else "black"
+        try:
+            return self.check_piece_move_rules(piece.lower(), from_pos, to_pos)
+        finally:
+            self.current_player = mover
+
+    def find_king(self, color: str) -> Optional[Tuple[int, int]]:
+        """返回 color 方将/帅的位置，已被吃时返回 None"""
+        king = 'K' if color == "red" else 'k'
+        rows = range(7, 10) if color == "red" else range(0, 3)
+        for row in rows:
+            for col in range(3, 6):
+                if self.board[row][col] == king:
+                    return (row, col)
+        return None
+
+    def is_in_check(self, color: str) -> bool:
+        """color 方是否被将军（含将帅照面）"""
+        king_pos = self.find_king(color)
+        if king_pos is None:
+            return False
+        for row in range(10):
+            for col in range(9):
+                piece = self.board[row][col]
+                if piece == '.' or piece.isupper() == (color == "red"):
+                    continue
+                if piece.lower() == 'k':
+                    # 将帅照面：同一纵线且中间无子
+                    if col == king_pos[1] and all(self.board[r][col] == '.'
+                                                  for r in range(min(row, king_pos[0]) + 1, max(row, king_pos[0]))):
+                        return True
+                elif self.reaches((row, col), king_pos):
+                    return True
+        return False
+
     def switch_player(self):
         """切换当前玩家"""
         self.current_player = "black" if self.current_player == "red" else "red"
@@ -318,8 +514,33 @@ class ChessGame:
         else:
             return "平局"
     
+    def clear_legal_cache(self):
+        """清空合法棋步缓存（局面被整体替换时调用）"""
+        self.legal_cache = None       # 当前局面的 (合法棋步列表, 合法棋步集合)
+        self.legal_cache_stack = deque(maxlen=LEGAL_CACHE_DEPTH)  # 与最近的 move_history 对应，每步走子前局面的缓存
+
     def get_legal_moves(self) -> List[str]:
-        """获取当前所有合法棋步"""
+        """获取当前所有合法棋步
+        
+        同一局面只生成一次，由 make_move/undo_last_move 维护；返回的列表在各调用方之间共享，不要修改。
+        """
+        return self._legal_entry()[0]
+
+    def get_legal_move_set(self) -> FrozenSet[str]:
+        """当前所有合法棋步的集合，用于快速判断棋步是否合法"""
+        return self._legal_entry()[1]
+
+    def _legal_entry(self) -> Tuple[List[str], FrozenSet[str]]:
+        if self.legal_cache is None:
+            legal_moves = self.generate_legal_moves()
+            self.legal_cache = (legal_moves, frozenset(legal_moves))
+            self.legal_move_stats['generated'] += 1
+        else:
+            self.legal_move_stats['reused'] += 1
+        return self.legal_cache
+
+    def generate_legal_moves(self) -> List[str]:
+        """逐格生成当前所有合法棋步（不使用缓存）"""
         legal_moves = []
         for from_row in range(10):
             for from_col in range(9):
@@ -342,11 +563,32 @@ class ChessGame:
         
         return legal_moves
     
+    def get_pgn(self, headers: Optional[Dict] = None, result: Optional[str] = None) -> str:
+        """导出ICCS格式的PGN（棋步如 "H2-E2"）
+        
+        Args:
+            headers: 附加的标签，如 {'Red': ..., 'Black': ...}
+            result: 结果标记（1-0 / 0-1 / 1/2-1/2 / *），缺省时按将帅是否被吃判断
+        """
+        if result is None:
+            game_result = self.get_game_result()
+            result = ('*' if not self.is_game_over() else
+                      PGN_RESULTS['red'] if game_result == "红方获胜" else
+                      PGN_RESULTS['black'] if game_result == "黑方获胜" else PGN_RESULTS[None])
+        tags = {'Game': 'Chinese Chess', **(headers or {}), 'Result': result, 'Format': 'ICCS'}
+        lines = [f'[{key} "{value}"]' for key, value in tags.items()]
+        moves = []
+        for index, record in enumerate(self.move_history):
+            text = f"{self.pos_to_coord(record.from_pos)}-{self.pos_to_coord(record.to_pos)}".upper()
+            moves.append(f"{index // 2 + 1}. {text}" if index % 2 == 0 else text)
+        moves.append(result)
+        return "\n".join(lines) + "\n\n" + " ".join(moves) + "\n"
+
     def get_move_count(self) -> int:
         """获取总步数"""
         return len(self.move_history)
     
-    def get_last_move(self) -> Optional[Dict]:
+    def get_last_move(self) -> Optional[MoveRecord]:
         """获取最后一步棋"""
         if self.move_history:
             return self.move_history[-1]
@@ -359,7 +601,52 @@ class ChessGame:
         self.current_player = "red"
         self.start_time = time.time()
         self.move_times = []
-    
+        self.clear_legal_cache()
+
+    def set_board_state(self, board_state: str, current_player: str = "red"):
+        """从 get_board_state 格式的字符串恢复局面（清空历史棋步）"""
+        rows = board_state.strip().split('/')
+        if len(rows) != 10 or any(len(row) != 9 for row in rows):
+            raise ValueError(f"无效的棋盘状态: {board_state}")
+        self.board = [list(row) for row in rows]
+        self.move_history = []
+        self.current_player = current_player
+        self.move_times = []
+        self.clear_legal_cache()
+
+    def get_fen(self) -> str:
+        """导出象棋FEN（行从黑方底线开始，空格数字压缩，w 为红方行棋）"""
+        rows = []
+        for row in self.board:
+            text, empty = "", 0
+            for piece in row:
+                if piece == '.':
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += piece
+            rows.append(text + (str(empty) if empty else ""))
+        side = 'w' if self.current_player == "red" else 'b'
+        return f"{'/'.join(rows)} {side} - - 0 {len(self.move_history) // 2 + 1}"
+
+    def set_fen(self, fen: str):
+        """从象棋FEN恢复局面；行棋方 w/r 为红方，b 为黑方，缺省为红方"""
+        fields = fen.strip().split()
+        if not fields:
+            raise ValueError("FEN为空")
+        rows = []
+        for text in fields[0].split('/'):
+            row = ""
+            for ch in text:
+                row += '.' * int(ch) if ch.isdigit() else ch
+            rows.append(row)
+        side = fields[1].lower() if len(fields) > 1 else 'w'
+        if side not in ('w', 'r', 'b'):
+            raise ValueError(f"无效的行棋方: {side}")
+        self.set_board_state("/".join(rows), "black" if side == 'b' else "red")
+
     def get_position_evaluation(self) -> float:
         """简单的局面评估（基于材料价值）"""
         piece_values = {
@@ -387,14 +674,15 @@ class ChessGame:
             return False
             
         last_move = self.move_history.pop()
-        from_pos = last_move['from_pos']
-        to_pos = last_move['to_pos']
-        piece = last_move['piece']
-        captured = last_move['captured']
+        from_pos = last_move.from_pos
+        to_pos = last_move.to_pos
+        piece = last_move.piece
+        captured = last_move.captured
         
         # 恢复棋盘状态
         self.board[from_pos[0]][from_pos[1]] = piece
         self.board[to_pos[0]][to_pos[1]] = captured
+        self.legal_cache = self.legal_cache_stack.pop() if self.legal_cache_stack else None
         
         self.switch_player()
         return True
\ No newline at end of file
@@ -0,0 +1,114 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from config import Config
+
+# 当前这一步的截止时刻（time.monotonic），由 LLMPlayer.get_move 设置；
+# 对冲请求等线程池任务经 contextvars.copy_context() 继承
+_move_deadline = contextvars.ContextVar('move_deadline', default=None)
+# 本步的取消事件（如集成玩家已做出决定、不再需要的成员），继承方式与截止时刻相同
+_move_cancel = contextvars.ContextVar('move_cancel', default=None)
+
+
+@contextmanager
+def move_deadline(deadline: Optional[float], cancel_event: Optional[threading.Event] = None):
+    """在此范围内的模型请求都受 deadline 约束，cancel_event 被设置时尽快结束"""
+    token = _move_deadline.set(deadline)
+    cancel_token = _move_cancel.set(cancel_event)
+    try:
+        yield
+    finally:
+        _move_cancel.reset(cancel_token)
+        _move_deadline.reset(token)
+
+
+def move_cancel_event() -> Optional[threading.Event]:
+    return _move_cancel.get()
+
+
+def move_cancelled() -> bool:
+    event = _move_cancel.get()
+    return event is not None and event.is_set()
+
+
+def remaining_time() -> Optional[float]:
+    """距本步截止的秒数，无截止时刻时返回 None"""
+    deadline = _move_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def time_left(default: float) -> float:
+    """距本步截止的秒数（用作HTTP超时），不超过 default；无截止时刻时返回 default"""
+    remaining = remaining_time()
+    return default if remaining is None else min(default, remaining)
+
+
+def deadline_passed() -> bool:
+    deadline = _move_deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class ChessClock:
+    """对局时钟：每方基础用时加每步加秒，使用单调时钟计时
+
+    行棋方开始思考时 start()，走出合法棋步后 stop()，步间停顿不计入用时。
+    base_time 为0时不限总用时，只受每步思考上限约束。
+    """
+
+    def __init__(self, base_time: Optional[float] = None, increment: Optional[float] = None):
+        self.base_time = Config.CLOCK_BASE_TIME if base_time is None else base_time
+        self.increment = Config.CLOCK_INCREMENT if increment is None else increment
+        self.reset()
+
+    def reset(self):
+        self.remaining = {'red': float(self.base_time), 'black': float(self.base_time)}
+        self.running = None
+        self.started_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.base_time > 0
+
+    def start(self, color: str):
+        self.running = color
+        self.started_at = time.monotonic()
+
+    def stop(self) -> float:
+        """停止计时并加秒，返回本步用时"""
+        if self.running is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        if self.enabled:
+            self.remaining[self.running] += self.increment - elapsed
+        self.running = None
+        return elapsed
+
+    def time_left(self, color: str) -> Optional[float]:
+        """color 方的剩余用时（含正在走的这一步），不限总用时时返回 None"""
+        if not self.enabled:
+            return None
+        remaining = self.remaining[color]
+        if self.running == color:
+            remaining -= time.monotonic() - self.started_at
+        return remaining
+
+    def turn_deadline(self, color: str, move_limit: Optional[float] = None) -> Optional[float]:
+        """本步的截止时刻：剩余用时与每步思考上限中较早的一个"""
+        move_limit = Config.MAX_THINKING_TIME if move_limit is None else move_limit
+        limits = [limit for limit in (self.time_left(color), move_limit or None) if limit is not None]
+        if not limits:
+            return None
+        return time.monotonic() + max(0.0, min(limits))
+
+    def to_dict(self) -> Dict:
+        """推送给前端的剩余时间（秒）"""
+        return {
+            'red': None if not self.enabled else round(self.time_left('red'), 1),
+            'black': None if not self.enabled else round(self.time_left('black'), 1),
+            'running': self.running,
+            'increment': self.increment
+        }
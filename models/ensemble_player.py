@@ -0,0 +1,296 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
+from config import Config
+from .llm_player import LLMPlayer
+from .log import get_logger
+
+logger = get_logger('ensemble_player')
+
+# 解析来源对应的置信度：追问得到的棋步不如模型直接给出的可靠
+SOURCE_CONFIDENCE = {'coord': 1.0, 'notation': 1.0, 'followup': 0.5}
+
+# 当前这一步的思考内容合并器，经 contextvars 传入成员的线程；
+# 超过截止时刻仍未结束的成员，其后续输出只会进入已关闭的旧合并器
+_current_merger = contextvars.ContextVar('ensemble_merger', default=None)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """惰性创建成员调用线程池（与模型调用线程池分开，避免嵌套提交时互相等待）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.ENSEMBLE_MAX_WORKERS, thread_name_prefix='ensemble')
+        return _executor
+
+
+class ThinkingMerger:
+    """把多个成员并发的 thinking_stream 合并成前端可读的一路输出
+
+    最先开始输出的成员实时转发，其余成员的内容先缓存，当前成员完成后再依次推送，
+    每段以成员名开头；每条事件附带 source 字段，前端也可以按成员分开显示。
+    """
+
+    def __init__(self, emitter, player_color: str, names: List[str]):
+        self.emitter = emitter
+        self.player_color = player_color
+        self.names = names
+        self.buffers = {index: "" for index in range(len(names))}
+        self.done = set()
+        self.streamed = set()
+        self.live = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def send(self, index: int, content: str):
+        self.emitter.emit('thinking_stream', {
+            'player': self.player_color,
+            'content': content,
+            'is_complete': False,
+            'source': self.names[index]
+        })
+
+    def header(self, index: int) -> str:
+        return f"\n【{self.names[index]}】\n"
+
+    def append(self, index: int, content: str):
+        with self.lock:
+            if self.closed:
+                return
+            self.streamed.add(index)
+            if self.live is None:
+                self.live = index
+                self.send(index, self.header(index) + self.buffers[index] + content)
+                self.buffers[index] = ""
+            elif self.live == index:
+                self.send(index, content)
+            else:
+                self.buffers[index] += content
+
+    def complete(self, index: int):
+        with self.lock:
+            if self.closed:
+                return
+            self.done.add(index)
+            if self.live != index:
+                return
+            self.live = None
+            # 已完成的成员整段推送，遇到仍在输出的成员则改为实时转发它
+            for other in range(len(self.names)):
+                if not self.buffers[other]:
+                    continue
+                self.send(other, self.header(other) + self.buffers[other])
+                self.buffers[other] = ""
+                if other not in self.done:
+                    self.live = other
+                    break
+
+    def add_response(self, index: int, response: str):
+        """非流式接口的成员没有推送过内容，收到结果后整段补发"""
+        if response and index not in self.streamed:
+            self.append(index, response)
+            self.complete(index)
+
+    def close(self):
+        """推送剩余的缓存内容和完成信号，之后到达的内容全部丢弃"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for index in range(len(self.names)):
+                if self.buffers[index]:
+                    self.send(index, self.header(index) + self.buffers[index])
+                    self.buffers[index] = ""
+            self.emitter.emit('thinking_stream', {'player': self.player_color, 'content': '', 'is_complete': True})
+
+
+class MemberEmitter:
+    """成员玩家使用的推送器：thinking_stream 交给本步的合并器，其他事件直接转发"""
+
+    def __init__(self, ensemble: "EnsemblePlayer", index: int):
+        self.ensemble = ensemble
+        self.index = index
+
+    def emit(self, event: str, data=None, **kwargs):
+        if event != 'thinking_stream':
+            self.ensemble.socketio.emit(event, data, **kwargs)
+            return
+        merger = _current_merger.get()
+        if merger is None:
+            return
+        if data.get('content'):
+            merger.append(self.index, data['content'])
+        if data.get('is_complete'):
+            merger.complete(self.index)
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class EnsemblePlayer:
+    """多模型集成玩家
+
+    同一局面并发询问多个 LLMPlayer，按投票（vote）或按权重与解析置信度加权（weighted）
+    选出棋步。等待以截止时刻为界：到时只用已经返回的棋步，慢的成员不会拖慢整步；
+    票数已不可能被剩余成员改变时提前返回。接口与 LLMPlayer 相同，ChessBattle 和
+    run_battle 无需改动。
+    """
+
+    def __init__(self, members: List[LLMPlayer], display_name: str = "", socketio=None,
+                 selection: Optional[str] = None, weights: Optional[List[float]] = None,
+                 timeout: Optional[float] = None):
+        if not members:
+            raise ValueError("集成玩家至少需要一个成员")
+        self.members = members
+        self.weights = list(weights) if weights else [1.0] * len(members)
+        self.selection = selection or Config.ENSEMBLE_SELECTION
+        self.timeout = timeout or Config.ENSEMBLE_TIMEOUT
+        self.model_name = "ensemble:" + "+".join(member.model_name for member in members)
+        self.display_name = display_name or " + ".join(member.display_name for member in members)
+        self.move_count = 0
+        self.total_thinking_time = 0
+        self.hedge_count = 0
+        self.ensemble_stats = {'moves': 0, 'timeouts': 0, 'early_decisions': 0, 'unanimous': 0, 'cancelled': 0}
+        self.socketio = socketio
+
+    @property
+    def socketio(self):
+        return self._socketio
+
+    @socketio.setter
+    def socketio(self, emitter):
+        """对战任务替换推送器时，成员改用经合并器转发的推送器"""
+        self._socketio = emitter
+        for index, member in enumerate(self.members):
+            member.socketio = MemberEmitter(self, index) if emitter else None
+
+    def get_move(self, board_state: str, move_history: List[dict], legal_moves: List[str] = None,
+                 deadline: Optional[float] = None, cancel_event: Optional[threading.Event] = None) -> Optional[Dict]:
+        """并发获取各成员的棋步并汇总（参数与 LLMPlayer.get_move 相同）
+
+        每个成员有自己的取消事件；提前决定、到达截止时刻或 cancel_event 被设置时，
+        取消仍在进行的成员，使其尽快关闭请求、让出成员线程池。
+        """
+        start_time = time.time()
+        player_color = "red" if len(move_history) % 2 == 0 else "black"
+        ensemble_deadline = time.monotonic() + self.timeout
+        if deadline is not None:
+            ensemble_deadline = min(ensemble_deadline, deadline)
+
+        merger = ThinkingMerger(self.socketio, player_color, [member.display_name for member in self.members]) \
+            if self.socketio else None
+        futures = {}
+        cancel_events = [threading.Event() for _ in self.members]
+        for index, member in enumerate(self.members):
+            context = contextvars.copy_context()
+            context.run(_current_merger.set, merger)
+            future = get_executor().submit(context.run, member.get_move, board_state, move_history,
+                                           legal_moves, ensemble_deadline, cancel_events[index])
+            futures[future] = index
+
+        results = {}
+        pending = set(futures)
+        while pending:
+            timeout = ensemble_deadline - time.monotonic()
+            if timeout <= 0 or (cancel_event is not None and cancel_event.is_set()):
+                break
+            # 分段等待，使外部取消能及时生效
+            done, pending = wait(pending, timeout=min(timeout, 0.5) if cancel_event is not None else timeout,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.warning("%s 获取棋步异常: %s", self.members[index].display_name, e)
+                    results[index] = None
+                if merger and results[index]:
+                    merger.add_response(index, results[index].get('raw_response', ''))
+            if pending and self.decided(results, [futures[future] for future in pending]):
+                self.ensemble_stats['early_decisions'] += 1
+                break
+        if pending and time.monotonic() >= ensemble_deadline:
+            self.ensemble_stats['timeouts'] += 1
+            logger.warning("%s 有 %d 个成员未在截止时刻前给出棋步", self.display_name, len(pending))
+        for future in pending:
+            cancel_events[futures[future]].set()
+            future.cancel()
+        self.ensemble_stats['cancelled'] += len(pending)
+        if merger:
+            merger.close()
+
+        thinking_time = time.time() - start_time
+        self.total_thinking_time += thinking_time
+        self.move_count += 1
+        self.ensemble_stats['moves'] += 1
+
+        move_info = self.select_move(results, len(self.members))
+        if move_info is None:
+            logger.warning("%s 的成员都没有给出有效棋步", self.display_name)
+            return None
+        move_info['thinking_time'] = thinking_time
+        move_info['player'] = self.display_name
+        logger.info("%s 选择棋步: %s（%s）", self.display_name, move_info['move'], move_info['ensemble']['scores'])
+        return move_info
+
+    def member_score(self, index: int, move_info: Dict) -> float:
+        """一个成员的票数：vote 为成员权重，weighted 再乘以解析置信度"""
+        if self.selection == 'weighted':
+            return self.weights[index] * SOURCE_CONFIDENCE.get(move_info.get('move_source'), 1.0)
+        return self.weights[index]
+
+    def tally(self, results: Dict[int, Optional[Dict]]) -> Dict[str, float]:
+        scores = {}
+        for index in sorted(results):
+            move_info = results[index]
+            if move_info and move_info.get('move'):
+                scores[move_info['move']] = scores.get(move_info['move'], 0.0) + self.member_score(index, move_info)
+        return scores
+
+    def decided(self, results: Dict[int, Optional[Dict]], pending: List[int]) -> bool:
+        """剩余成员即使全部投给第二名也无法反超时，结果已定"""
+        scores = sorted(self.tally(results).values(), reverse=True)
+        if not scores:
+            return False
+        runner_up = scores[1] if len(scores) > 1 else 0.0
+        return scores[0] > runner_up + sum(self.weights[index] for index in pending)
+
+    def select_move(self, results: Dict[int, Optional[Dict]], total: int) -> Optional[Dict]:
+        """得分最高的棋步，平票时取成员顺序靠前者给出的；思考内容取该成员的回复"""
+        scores = self.tally(results)
+        if not scores:
+            return None
+        best = max(scores.values())
+        voters = [index for index in sorted(results) if results[index] and scores.get(results[index]['move']) == best]
+        chosen = results[voters[0]]
+        if len(scores) == 1 and len(results) == total:
+            self.ensemble_stats['unanimous'] += 1
+
+        move_info = dict(chosen)
+        move_info['ensemble'] = {
+            'scores': scores,
+            'members': {self.members[index].display_name: (results[index] or {}).get('move')
+                        for index in sorted(results)},
+            'responded': sum(1 for result in results.values() if result),
+            'total': total,
+            'selected_by': self.members[voters[0]].display_name
+        }
+        return move_info
+
+    def get_stats(self) -> Dict:
+        """获取玩家统计信息（含各成员的统计）"""
+        avg_thinking_time = self.total_thinking_time / self.move_count if self.move_count > 0 else 0
+        return {
+            'display_name': self.display_name,
+            'model_name': self.model_name,
+            'move_count': self.move_count,
+            'total_thinking_time': self.total_thinking_time,
+            'avg_thinking_time': avg_thinking_time,
+            'ensemble_stats': dict(self.ensemble_stats, selection=self.selection),
+            'members': [member.get_stats() for member in self.members]
+        }
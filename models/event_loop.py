@@ -0,0 +1,101 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+from config import Config
+from .log import get_logger
+from .metrics import EVENT_LOOP_LAG_SECONDS, MODEL_CALLS_INFLIGHT
+
+logger = get_logger('event_loop')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """惰性创建模型调用线程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.MODEL_CALL_WORKERS, thread_name_prefix='model-call')
+        return _executor
+
+
+def offload(fn: Callable, *args) -> Future:
+    """在线程池中执行阻塞调用（SDK、requests 流式读取等），沿用调用方的日志上下文
+
+    调用方应轮询 future.done() 并在两次轮询之间用 socketio.sleep 让出，
+    而不是调用 future.result() 阻塞等待。
+    """
+    MODEL_CALLS_INFLIGHT.inc()
+
+    def call():
+        try:
+            return fn(*args)
+        finally:
+            MODEL_CALLS_INFLIGHT.dec()
+
+    return get_executor().submit(contextvars.copy_context().run, call)
+
+
+class BufferedEmitter:
+    """线程池中的模型调用使用的推送器
+
+    eventlet 下从系统线程直接调用 socketio.emit 并不安全，这里只把事件放进队列，
+    由对战任务在事件循环中调用 drain() 统一发出。sleep 在调用线程中执行。
+    """
+
+    def __init__(self, emitter):
+        self.emitter = emitter
+        self.pending = deque()
+
+    def emit(self, event: str, data=None, **kwargs):
+        self.pending.append((event, data, kwargs))
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def drain(self) -> int:
+        """发出队列中的全部事件，返回发出的个数"""
+        count = 0
+        while self.pending:
+            event, data, kwargs = self.pending.popleft()
+            self.emitter.emit(event, data, **kwargs)
+            count += 1
+        return count
+
+
+class LoopLagMonitor:
+    """事件循环延迟监测
+
+    周期性地 sleep 固定间隔，实际经过的时间超出间隔的部分即为事件循环（eventlet hub
+    或线程调度）的延迟。有任务长时间不让出时延迟会明显增大并记录警告。
+    """
+
+    def __init__(self, emitter, interval: Optional[float] = None, threshold: Optional[float] = None):
+        self.emitter = emitter
+        self.interval = interval or Config.LOOP_LAG_INTERVAL
+        self.threshold = threshold or Config.LOOP_LAG_WARN
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.running = False
+
+    def run(self):
+        self.running = True
+        while self.running:
+            start = time.monotonic()
+            self.emitter.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.threshold:
+                logger.warning("事件循环延迟 %.3f 秒，可能有任务在阻塞调用中未让出", lag)
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self) -> dict:
+        return {'last_lag': self.last_lag, 'max_lag': self.max_lag}
@@ -1,15 +1,136 @@
-import openai
-import requests
-import json
+import os
+import threading
 import time
 import re
-from typing import Dict, Optional, List, Generator
-from google import genai
+from urllib.parse import urlparse
+from collections import Counter
+from itertools import chain
+from typing import Callable, Dict, Optional, List, Generator, Tuple
+from config import Config
+from .chess_game import ChessGame
+from .clock import move_deadline, move_cancel_event, move_cancelled, deadline_passed, remaining_time, time_left
+from .move_parser import MoveParser
+from .sse import SSEParser, DONE, parse_json
+from .request_scheduler import mark_admitted, request_scheduler
+from .rate_limiter import AcquireAbortedError, RateLimitedError, rate_limiters, parse_retry_after, backoff_delay, estimate_tokens
+from .log import get_logger
+from .metrics import (metrics, LLM_REQUEST_SECONDS, LLM_TTFT_SECONDS, LLM_TOKENS_PER_SECOND,
+                      LLM_OUTPUT_TOKENS, LLM_PROMPT_TOKENS, MOVE_PARSE_SECONDS, MOVE_PARSE_OUTCOMES)
+
+logger = get_logger('llm_player')
+
+# 各服务商的SDK（openai、google-genai、requests）在首次调用对应接口时才导入，
+# 只用一种模型的进程和命令行工具无需承担全部SDK的导入耗时
+
+# 系统提示词
+SYSTEM_PROMPT = "你是一位专业的中国象棋大师，擅长分析局面和制定策略。"
+GENERIC_SYSTEM_PROMPT = "你是一位专业的中国象棋大师。"
+
+# Gemini 模拟流式输出时的分句
+SENTENCE_SPLIT_RE = re.compile(r'([。！？\n])')
+
+# 对局规则与回复格式：每步都相同，作为系统提示词放在请求最前面。
+# DeepSeek、OpenAI 兼容接口和 Gemini 按请求前缀自动缓存，Claude 需要 cache_control 标记；
+# 每步变化的棋盘、合法棋步和历史都放在最后的用户消息中，前缀保持逐字节不变
+CHESS_RULES_PROMPT = """你是一位中国象棋大师，正在进行一场中国象棋对局。每一步都会收到当前棋盘、合法棋步列表和最近的棋步历史。
+
+棋盘格式说明：
+- 大写字母代表红方棋子：K=帅, A=仕, B=相, N=马, R=车, C=炮, P=兵
+- 小写字母代表黑方棋子：k=将, a=士, b=象, n=马, r=车, c=炮, p=卒
+- '.' 代表空位
+- 坐标系统：列用a-i表示(从左到右)，行用0-9表示(从上到下)
+
+【重要规则 - 必须严格遵守】：
+1. 你必须从提供的合法棋步列表中选择！
+2. 绝对不能移动到己方棋子占据的位置！
+3. 只能移动到空位（'.'）或吃掉对方棋子的位置
+4. 必须遵守各棋子的移动规则
+5. 兵/卒过河前只能向前，过河后可以左右移动
+6. 炮吃子需要跳过一个棋子，不吃子时路径必须畅通
+
+【棋步选择步骤】：
+1. 仔细查看提供的合法棋步列表
+2. 分析当前局面的优劣势和每个合法棋步的战术价值
+3. 考虑可能的战术和战略
+4. 从合法棋步中选择最佳的一个
+5. 确保你选择的棋步在合法列表中！
+
+中国象棋规则提醒：
+- 帅/将只能在九宫格内移动，一次一格
+- 士/仕只能在九宫格内斜走
+- 相/象不能过河，走田字，不能被塞象眼
+- 马走日字，但可能被蹩腿
+- 车走直线，路径必须畅通
+- 炮走直线，吃子需要跳过一个棋子，不吃子时路径必须畅通
+- 兵/卒过河前只能向前，过河后可以左右移动
+
+请按以下格式回复：
+分析：[你对当前局面的分析，包括棋子位置观察]
+策略：[你的下棋策略和从合法棋步中的选择理由]
+棋步：[从合法棋步列表中选择的棋步，如a0a1]
+
+重要提醒：你必须从提供的合法棋步列表中选择！选择其他棋步将导致游戏中断！"""
+
+CHESS_SYSTEM_PROMPT = f"{SYSTEM_PROMPT}\n\n{CHESS_RULES_PROMPT}"
+GENERIC_CHESS_SYSTEM_PROMPT = f"{GENERIC_SYSTEM_PROMPT}\n\n{CHESS_RULES_PROMPT}"
+
+LEGAL_MOVES_TEMPLATE = """
+【当前所有合法棋步】：
+你必须从以下合法棋步中选择一个：
+{moves}  # 显示前50个合法棋步
+总共有 {count} 个合法棋步可选择。
+"""
+
+# 每步变化的部分
+CHESS_PROMPT_TEMPLATE = """当前棋盘状态（带坐标）：
+{board_display}
+{legal_moves}
+当前局面信息：
+- 当前轮次: {current_turn}
+- 总步数: {move_count}
+
+最近棋步历史：
+{history}
+
+请分析当前局面，从合法棋步列表中选择你的下一步棋，按规定格式回复。
+"""
+
+
+def prompt_cache_usage(usage: Dict) -> Tuple[int, int]:
+    """从各服务商的 usage 字段取出 (输入token数, 其中命中缓存的token数)"""
+    if 'prompt_cache_hit_tokens' in usage:
+        # DeepSeek
+        hit = usage.get('prompt_cache_hit_tokens') or 0
+        return hit + (usage.get('prompt_cache_miss_tokens') or 0), hit
+    if 'input_tokens' in usage:
+        # Anthropic：input_tokens 不含读取和写入缓存的部分
+        hit = usage.get('cache_read_input_tokens') or 0
+        return (usage.get('input_tokens') or 0) + hit + (usage.get('cache_creation_input_tokens') or 0), hit
+    if 'prompt_token_count' in usage:
+        # Gemini
+        return usage.get('prompt_token_count') or 0, usage.get('cached_content_token_count') or 0
+    # OpenAI 兼容
+    details = usage.get('prompt_tokens_details') or {}
+    return usage.get('prompt_tokens') or 0, details.get('cached_tokens') or 0
+
+
+def stream_socket(response):
+    """流式响应底层的 socket（urllib3 2.x），取不到时返回None"""
+    connection = getattr(response.raw, 'connection', None)
+    return getattr(connection, 'sock', None)
+
+
+def set_read_timeout(sock, default: float = 90):
+    """把下一次读取的超时设为本步剩余思考时间（不超过 default）"""
+    if sock is not None:
+        sock.settimeout(max(0.01, time_left(default)))
+
 
 class LLMPlayer:
     """大语言模型中国象棋玩家类"""
     
-    def __init__(self, model_name: str, api_key: str, base_url: Optional[str] = None, display_name: str = "", socketio=None):
+    def __init__(self, model_name: str, api_key: str, base_url: Optional[str] = None, display_name: str = "", socketio=None,
+                 samples: Optional[int] = None, sample_selection: Optional[str] = None):
         self.model_name = model_name
         self.api_key = api_key
         self.base_url = base_url
@@ -17,18 +138,37 @@ class LLMPlayer:
         self.move_count = 0
         self.total_thinking_time = 0
         self.socketio = socketio
+        self.move_parser = MoveParser()
+        self.hedge_count = 0
+        # 多采样：每步请求 samples 个回复，按 sample_selection（first_legal / majority）选择
+        self.samples = max(1, samples or Config.MOVE_SAMPLES)
+        self.sample_selection = sample_selection or Config.MOVE_SAMPLE_SELECTION
+        self.sample_stats = {'moves': 0, 'requests': 0, 'rescued': 0, 'unanimous': 0}
+        # 服务商返回的输入token数与命中前缀缓存的token数；多采样、对冲的临时玩家共用同一份（见 helper_player）
+        self.prompt_stats = {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0}
+        self.stats_lock = threading.Lock()
+        # 上一次拼好的合法棋步段落：(合法棋步列表, 文本)，同一步重试时传入的是同一个列表
+        self.legal_moves_text = (None, "")
     
-    def get_move(self, board_state: str, move_history: List[dict], legal_moves: List[str] = None) -> Optional[Dict]:
+    def get_move(self, board_state: str, move_history: List[dict], legal_moves: List[str] = None,
+                 deadline: Optional[float] = None, cancel_event: Optional[threading.Event] = None) -> Optional[Dict]:
         """获取模型的下一步棋（支持流式输出）
         
         Args:
             board_state: 当前棋盘状态
             move_history: 历史棋步列表
             legal_moves: 当前所有合法棋步列表
+            deadline: 本步截止时刻（time.monotonic），模型请求在此之前结束，流式请求中途关闭
+            cancel_event: 被设置时不再发起新请求，流式请求中途关闭（调用方已不需要结果）
             
         Returns:
             Dict: 包含棋步和思考过程的字典
         """
+        request_deadline = deadline - Config.CLOCK_MARGIN if deadline is not None else None
+        with move_deadline(request_deadline, cancel_event):
+            return self._get_move(board_state, move_history, legal_moves)
+    
+    def _get_move(self, board_state: str, move_history: List[dict], legal_moves: List[str] = None) -> Optional[Dict]:
         start_time = time.time()
         
         try:
@@ -38,32 +178,28 @@ class LLMPlayer:
             # 确定玩家颜色
             player_color = "red" if len(move_history) % 2 == 0 else "black"
             
-            print(f"开始获取 {self.display_name} 的棋步...")
+            logger.info("开始获取 %s 的棋步", self.display_name)
             
-            # 调用相应的流式API
-            response = ""
-            if "deepseek" in self.model_name.lower():
-                response = self.call_deepseek_stream(prompt, player_color)
-            elif "gemini" in self.model_name.lower():
-                response = self.call_gemini_stream(prompt, player_color)
+            # 中文记谱映射需要当前局面
+            game = self.build_position(board_state, player_color) if legal_moves else None
+            if self.samples > 1:
+                response = self.call_model_sampled(prompt, player_color, legal_moves, game)
             else:
-                # 回退到非流式API
-                if "openai" in self.model_name.lower() or "gpt" in self.model_name.lower():
-                    response = self.call_openai_api(prompt)
-                elif "claude" in self.model_name.lower():
-                    response = self.call_claude_api(prompt)
-                else:
-                    response = self.call_generic_api(prompt)
+                response = self.call_model_hedged(prompt, player_color, legal_moves, game)
             
-            print(f"API调用完成，响应长度: {len(response) if response else 0}")
+            logger.debug("API调用完成，响应长度: %d", len(response) if response else 0)
             
             # 检查响应是否为空
             if not response or response.strip() == "":
-                print(f"{self.display_name} API返回空响应")
+                logger.warning("%s API返回空响应", self.display_name)
                 return None
             
-            # 解析响应
-            move_info = self.parse_response(response)
+            # 解析响应：只在合法棋步中选择
+            move_info = self.parse_response(response, legal_moves, game)
+            
+            # 没有合法候选时，用简短的追问代替整轮重试
+            if move_info is None and legal_moves and Config.MOVE_FOLLOWUP_ENABLED and not move_cancelled():
+                move_info = self.request_move_followup(response, legal_moves, player_color, game)
             
             # 记录思考时间
             thinking_time = time.time() - start_time
@@ -73,26 +209,282 @@ class LLMPlayer:
             if move_info:
                 move_info['thinking_time'] = thinking_time
                 move_info['player'] = self.display_name
-                print(f"{self.display_name} 成功获取棋步: {move_info.get('move')}")
+                logger.info("%s 成功获取棋步: %s", self.display_name, move_info.get('move'))
                 return move_info
             else:
-                print(f"{self.display_name} 无法解析出有效棋步")
+                logger.warning("%s 无法解析出有效棋步", self.display_name)
                 return None
             
         except Exception as e:
-            print(f"获取{self.display_name}棋步时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("获取%s棋步时出错: %s", self.display_name, e)
             return None
     
-    def call_deepseek_stream(self, prompt: str, player_color: str) -> str:
+    def call_model(self, prompt: str, player_color: str, cancel_event: Optional[threading.Event] = None) -> str:
+        """在限流器约束下调用模型，返回完整响应文本
+        
+        同一 (base_url, api_key) 的请求共享每分钟请求数/token数和并发额度；
+        收到429时遵守 Retry-After，并按带抖动的指数退避重试。
+        cancel_event 被设置时，流式请求会中途关闭连接并返回已收到的内容。
+        """
+        return self.rate_limited(estimate_tokens(CHESS_SYSTEM_PROMPT + prompt), lambda: self.dispatch_model(prompt, player_color, cancel_event),
+                                 "", cancel_event)
+    
+    def rate_limited(self, tokens: int, call: Callable, empty, cancel_event: Optional[threading.Event] = None):
+        """在限流器约束下执行 call()，被限流时退避重试，放弃时返回 empty"""
+        limiter = rate_limiters.get(self.base_url or self.model_name, self.api_key)
+        
+        for attempt in range(Config.RATE_LIMIT_MAX_RETRIES + 1):
+            if deadline_passed():
+                logger.warning("%s 已到本步思考时限，不再发起请求", self.display_name)
+                return empty
+            if move_cancelled():
+                return empty
+            try:
+                if not Config.RATE_LIMIT_ENABLED:
+                    mark_admitted()
+                    return call()
+                # 排队等待额度同样受本步截止时刻和取消约束
+                remaining = remaining_time()
+                with limiter.acquire(tokens, None if remaining is None else time.monotonic() + remaining,
+                                     cancel_event or move_cancel_event()):
+                    mark_admitted()
+                    return call()
+            except AcquireAbortedError:
+                logger.warning("%s 等待限流额度时到达本步思考时限或被取消，放弃本次请求", self.display_name)
+                return empty
+            except RateLimitedError as e:
+                limiter.penalize(e.retry_after)
+                if attempt >= Config.RATE_LIMIT_MAX_RETRIES:
+                    logger.error("%s 多次被限流，放弃本次请求", self.display_name)
+                    return empty
+                delay = max(e.retry_after or 0, backoff_delay(attempt))
+                remaining = remaining_time()
+                if remaining is not None and delay >= remaining:
+                    logger.warning("%s 被限流，等待将超过本步思考时限，放弃本次请求", self.display_name)
+                    return empty
+                logger.warning("%s 被限流，%.1f秒后重试", self.display_name, delay)
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        return empty
+                else:
+                    time.sleep(delay)
+        return empty
+    
+    def dispatch_model(self, prompt: str, player_color: str, cancel_event: Optional[threading.Event] = None) -> str:
+        """根据模型名称调用相应的API，并记录请求总耗时"""
+        with LLM_REQUEST_SECONDS.time(model=self.model_name):
+            return self._dispatch_model(prompt, player_color, cancel_event)
+    
+    def _dispatch_model(self, prompt: str, player_color: str, cancel_event: Optional[threading.Event] = None) -> str:
+        if "deepseek" in self.model_name.lower():
+            return self.call_deepseek_stream(prompt, player_color, cancel_event)
+        elif "gemini" in self.model_name.lower():
+            return self.call_gemini_stream(prompt, player_color, cancel_event)
+        # 回退到非流式API
+        if "openai" in self.model_name.lower() or "gpt" in self.model_name.lower():
+            return self.call_openai_api(prompt)
+        elif "claude" in self.model_name.lower():
+            return self.call_claude_api(prompt)
+        return self.call_generic_api(prompt)
+    
+    def latency_key(self) -> tuple:
+        """延迟统计使用的 (provider, model) 键，provider 取端点主机名"""
+        provider = urlparse(self.base_url).netloc if self.base_url else ""
+        return (provider or self.model_name.split('/')[0].lower(), self.model_name)
+    
+    def helper_player(self, model_name: Optional[str] = None, api_key: Optional[str] = None,
+                      base_url: Optional[str] = None) -> "LLMPlayer":
+        """构建只发请求的临时玩家（多采样、对冲），不推送流式内容，用量统计计入本玩家"""
+        player = LLMPlayer(model_name or self.model_name, api_key or self.api_key,
+                           base_url or self.base_url, self.display_name)
+        player.prompt_stats = self.prompt_stats
+        player.stats_lock = self.stats_lock
+        return player
+    
+    def build_hedge_player(self) -> "LLMPlayer":
+        """构建对冲请求使用的玩家：优先使用配置的备用端点"""
+        alternate = Config.HEDGE_ALTERNATES.get(self.model_name)
+        if alternate:
+            return self.helper_player(
+                model_name=alternate.get('model_name'),
+                api_key=os.environ.get(alternate.get('api_key_env', ''), self.api_key),
+                base_url=alternate.get('base_url')
+            )
+        return self.helper_player()
+    
+    def call_model_hedged(self, prompt: str, player_color: str, legal_moves: List[str] = None,
+                          game: Optional[ChessGame] = None) -> str:
+        """调用模型，超过观测到的 p95 延迟时发出对冲请求，采用先给出合法棋步的响应"""
+        hedge_player = None
+        if Config.HEDGE_ENABLED and self.hedge_count < Config.HEDGE_MAX_PER_GAME:
+            hedge_player = self.build_hedge_player()
+        
+        def has_legal_move(text: str) -> bool:
+            if not legal_moves:
+                return bool(text and text.strip())
+            return self.move_parser.select_move(text, legal_moves, game)[0] is not None
+        
+        response, info = request_scheduler.run(
+            self.latency_key(),
+            lambda cancel_event: self.call_model(prompt, player_color, cancel_event),
+            hedge=(lambda cancel_event: hedge_player.call_model(prompt, player_color, cancel_event)) if hedge_player else None,
+            hedge_key=hedge_player.latency_key() if hedge_player else None,
+            accept=has_legal_move
+        )
+        
+        if info['hedged']:
+            self.hedge_count += 1
+        if info['winner'] == 'hedge' and self.socketio:
+            # 对冲请求不推送流式内容，胜出后一次性补发
+            self.socketio.emit('thinking_stream', {'player': player_color, 'content': response, 'is_complete': False})
+            self.socketio.emit('thinking_stream', {'player': player_color, 'content': '', 'is_complete': True})
+        return response
+    
+    def supports_native_samples(self) -> bool:
+        """是否可以在一次请求中取回多个回复（OpenAI 兼容接口的 n 参数）
+        
+        DeepSeek 不支持 n，Gemini、Claude 走各自的接口，这些模型改为并发发出多个请求。
+        """
+        name = self.model_name.lower()
+        return not any(provider in name for provider in ('deepseek', 'gemini', 'claude'))
+    
+    def call_native_samples(self, prompt: str, n: int) -> List[str]:
+        """一次请求取回 n 个回复"""
+        name = self.model_name.lower()
+        with LLM_REQUEST_SECONDS.time(model=self.model_name):
+            if "openai" in name or "gpt" in name:
+                return self.call_openai_choices(prompt, n)
+            return self.call_generic_choices(prompt, n)
+    
+    def call_model_sampled(self, prompt: str, player_color: str, legal_moves: List[str] = None,
+                           game: Optional[ChessGame] = None) -> str:
+        """多采样：每步取 samples 个回复，按 sample_selection 选出一个
+        
+        接口支持时一次请求取回全部回复，否则并发发出 samples 个请求（只有第一个推送流式内容）。
+        first_legal 在第一个含合法棋步的回复到达时取消其余请求；majority 按棋步投票。
+        """
+        n = self.samples
+        if self.supports_native_samples():
+            # 输出 token 随回复数增长，按 n 个回复预估限流额度
+            tokens = estimate_tokens(CHESS_SYSTEM_PROMPT + prompt) + (n - 1) * Config.RATE_LIMIT_EST_OUTPUT_TOKENS
+            texts = self.rate_limited(tokens, lambda: self.call_native_samples(prompt, n), [])
+            responses = list(enumerate(texts))
+            self.sample_stats['requests'] += 1
+        else:
+            players = [self] + [self.helper_player() for _ in range(n - 1)]
+            
+            def enough(results: List[Tuple[int, str]]) -> bool:
+                moves = [self.sample_move(text, legal_moves, game) for _, text in results]
+                if self.sample_selection == 'first_legal':
+                    return any(moves)
+                # 已有棋步过半数时剩余回复不会改变结果
+                votes = Counter(move for move in moves if move)
+                return bool(votes) and votes.most_common(1)[0][1] > n // 2
+            
+            responses = request_scheduler.run_parallel(
+                self.latency_key(),
+                [lambda cancel_event, player=player: player.call_model(prompt, player_color, cancel_event)
+                 for player in players],
+                enough=enough,
+                accept=lambda text: self.sample_move(text, legal_moves, game) is not None
+            )
+            self.sample_stats['requests'] += len(responses)
+        
+        self.sample_stats['moves'] += 1
+        index, response = self.select_sample(responses, legal_moves, game, player_color)
+        if index != 0 and response and self.socketio:
+            # 选中的回复没有推送过流式内容，一次性补发
+            self.socketio.emit('thinking_stream', {'player': player_color, 'content': response, 'is_complete': False})
+            self.socketio.emit('thinking_stream', {'player': player_color, 'content': '', 'is_complete': True})
+        return response
+    
+    def sample_move(self, response: str, legal_moves: List[str] = None,
+                    game: Optional[ChessGame] = None) -> Optional[str]:
+        """回复中选出的棋步（不计入解析统计），没有时返回None"""
+        if not response or not response.strip():
+            return None
+        best, _ = self.move_parser.select_move(response, legal_moves, game)
+        return best['move'] if best else None
+    
+    def select_sample(self, responses: List[Tuple[int, str]], legal_moves: List[str] = None,
+                      game: Optional[ChessGame] = None, player_color: str = "red") -> Tuple[int, str]:
+        """从 [(序号, 回复)] 中选出一个回复，返回 (序号, 回复)
+        
+        first_legal 取最先到达的含合法棋步的回复；majority 取得票最多的棋步，
+        平票时比较走子后的局面评估，再按到达顺序。都没有合法棋步时返回第一个非空回复。
+        """
+        candidates = [(index, text, self.sample_move(text, legal_moves, game)) for index, text in responses]
+        legal = [candidate for candidate in candidates if candidate[2]]
+        if not legal:
+            return next(((index, text) for index, text, _ in candidates if text and text.strip()), (0, ""))
+        
+        if any(index == 0 and not move for index, _, move in candidates):
+            # 第一个采样没有合法棋步，由其他采样补救（以往需要整轮重试）
+            self.sample_stats['rescued'] += 1
+        
+        votes = Counter(move for _, _, move in legal)
+        if len(votes) == 1 and len(legal) == self.samples:
+            self.sample_stats['unanimous'] += 1
+        if self.sample_selection == 'first_legal':
+            index, text, _ = legal[0]
+            return index, text
+        
+        top = max(votes.values())
+        tied = [move for move in votes if votes[move] == top]
+        if len(tied) > 1 and game is not None:
+            # sorted 是稳定排序，评估相同的棋步保持到达顺序
+            tied = sorted(tied, key=lambda move: self.evaluate_move(game, move, player_color), reverse=True)
+        index, text, _ = next(candidate for candidate in legal if candidate[2] == tied[0])
+        return index, text
+    
+    def evaluate_move(self, game: ChessGame, move: str, player_color: str) -> float:
+        """走子后的局面评估（行棋方视角）"""
+        if not game.make_move(move):
+            return float('-inf')
+        try:
+            evaluation = game.get_position_evaluation()
+        finally:
+            game.undo_last_move()
+        return evaluation if player_color == "red" else -evaluation
+    
+    def build_position(self, board_state: str, player_color: str) -> Optional[ChessGame]:
+        """由棋盘状态重建局面，用于中文记谱映射"""
+        try:
+            game = ChessGame()
+            game.set_board_state(board_state, player_color)
+            return game
+        except ValueError:
+            return None
+    
+    def request_move_followup(self, response: str, legal_moves: List[str], player_color: str,
+                              game: Optional[ChessGame]) -> Optional[Dict]:
+        """响应中没有合法棋步时，发出只包含少量候选的追问"""
+        rejected = self.move_parser.rejected_moves(response, legal_moves)
+        options = self.move_parser.shortlist(legal_moves, rejected, Config.MOVE_FOLLOWUP_MAX_CANDIDATES)
+        prompt = self.build_followup_prompt(options, rejected)
+        
+        logger.info("%s 未给出合法棋步（候选: %s），发起追问", self.display_name, rejected)
+        followup = self.call_model(prompt, player_color)
+        return self.move_parser.parse_followup(followup, response, options, game)
+    
+    def build_followup_prompt(self, options: List[str], rejected: List[str]) -> str:
+        """构建追问提示词：只要求从给定的合法棋步中选择一个"""
+        rejected_str = f"你刚才给出的棋步 {', '.join(rejected)} 不合法。" if rejected else "你刚才没有给出可识别的棋步。"
+        return f"""{rejected_str}
+请只从以下 {len(options)} 个合法棋步中选择一个：
+{', '.join(options)}
+
+只回复一行，格式为：
+棋步：[棋步，如a0a1]
+"""
+    
+    def call_deepseek_stream(self, prompt: str, player_color: str, cancel_event: Optional[threading.Event] = None) -> str:
         """调用DeepSeek流式API - 使用requests直接调用避免OpenAI客户端问题"""
         try:
-            print(f"开始调用DeepSeek流式API，玩家颜色: {player_color}")
+            logger.debug("开始调用DeepSeek流式API，玩家颜色: %s", player_color)
             
             # 使用 requests 直接调用流式API，避免 OpenAI 客户端的兼容性问题
             import requests
-            import json
             
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -102,104 +494,128 @@ class LLMPlayer:
             data = {
                 "model": self.model_name,
                 "messages": [
+                    {"role": "system", "content": CHESS_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                "stream": True
+                "stream": True,
+                # 最后一个数据块带上 usage，用于统计前缀缓存命中的token数
+                "stream_options": {"include_usage": True}
             }
             
-            print(f"发送请求到: https://api.siliconflow.cn/v1/chat/completions")
+            url = f"{(self.base_url or 'https://api.siliconflow.cn/v1').rstrip('/')}/chat/completions"
+            logger.debug("发送请求到: %s", url)
             
             response = requests.post(
-                "https://api.siliconflow.cn/v1/chat/completions",
+                url,
                 headers=headers,
                 json=data,
                 stream=True,
-                timeout=90  # 增加超时时间到90秒
+                timeout=time_left(90)  # 不超过本步剩余思考时间
             )
             
+            if response.status_code == 429:
+                raise RateLimitedError(parse_retry_after(response.headers.get('Retry-After')))
             if response.status_code != 200:
-                print(f"API请求失败，状态码: {response.status_code}")
-                print(f"响应内容: {response.text}")
+                logger.error("API请求失败，状态码: %s", response.status_code)
+                logger.debug("响应内容: %s", response.text)
                 return ""
             
-            print("开始接收流式响应...")
+            logger.debug("开始接收流式响应")
             
-            full_content = ""
+            request_start = time.perf_counter()
+            first_token_at = None
+            token_count = 0
+            parts = []  # 完整响应的文本片段，结束时一次拼接
             chunk_count = 0
-            buffer = ""  # 缓冲区，用于积累内容
+            buffer = []  # 待推送的片段
+            buffered = 0
             buffer_size = 5  # 每5个字符发送一次，更流畅的显示
-            
-            # 处理流式响应
-            for line in response.iter_lines():
-                if line:
-                    chunk_count += 1
-                    line_str = line.decode('utf-8')
-                    
-                    # 跳过非数据行
-                    if not line_str.startswith('data: '):
-                        continue
-                    
-                    # 移除 "data: " 前缀
-                    json_str = line_str[6:]
-                    
-                    # 跳过结束标记
-                    if json_str.strip() == '[DONE]':
+            parser = SSEParser()
+            finished = False
+            
+            # 处理流式响应：按网络读到的字节块增量解析，不逐行解码。
+            # 每次读取前按本步剩余时间设置 socket 超时，阻塞的读取也不会越过截止时刻
+            sock = stream_socket(response)
+            set_read_timeout(sock)
+            try:
+                # 末尾的 None 表示流已结束，取出解析器中剩余的事件（服务端省略了最后的空行时）
+                for chunk in chain(response.iter_content(chunk_size=None), (None,)):
+                    if (cancel_event is not None and cancel_event.is_set()) or move_cancelled():
+                        logger.info("%s 流式请求已取消", self.display_name)
+                        response.close()
+                        break
+                    if deadline_passed():
+                        # 到达本步思考时限：关闭连接，用已收到的内容解析棋步
+                        logger.info("%s 已到本步思考时限，中止流式响应", self.display_name)
+                        response.close()
                         break
+                    if chunk is None:
+                        events = parser.flush()
+                    else:
+                        chunk_count += 1
+                        events = parser.feed(chunk)
                     
-                    try:
-                        # 解析JSON数据
-                        chunk_data = json.loads(json_str)
+                    for event in events:
+                        # 结束标记
+                        if event == DONE:
+                            finished = True
+                            break
                         
-                        if 'choices' in chunk_data and chunk_data['choices']:
-                            delta = chunk_data['choices'][0].get('delta', {})
-                            
-                            # 处理普通内容
-                            if 'content' in delta and delta['content']:
-                                content = delta['content']
-                                full_content += content
-                                buffer += content
-                            
-                            # 处理推理内容（DeepSeek-R1特有）
-                            if 'reasoning_content' in delta and delta['reasoning_content']:
-                                reasoning_content = delta['reasoning_content']
-                                full_content += reasoning_content
-                                buffer += reasoning_content
-                            
-                            # 当缓冲区达到一定大小时发送
-                            if len(buffer) >= buffer_size:
-                                # print(f"发送缓冲内容 (长度{len(buffer)}): {repr(buffer[:50])}...")
-                                if self.socketio:
-                                    try:
-                                        # 使用Flask-SocketIO的正确方式发送事件
-                                        event_data = {
-                                            'player': player_color,
-                                            'content': buffer,
-                                            'is_complete': False
-                                        }
-                                        #print(f"准备发送事件数据: {event_data}")
-                                        
-                                        # 发送事件
-                                        self.socketio.emit('thinking_stream', event_data)
-                                        # print(f"成功发送thinking_stream事件到{player_color}")
-                                        
-                                        # 强制刷新Socket.IO
-                                        self.socketio.sleep(0.01)
-                                        
-                                    except Exception as e:
-                                        print(f"发送thinking_stream事件失败: {e}")
-                                        import traceback
-                                        traceback.print_exc()
-                                else:
-                                    print("警告: socketio实例为None")
-                                buffer = ""  # 清空缓冲区
-                    
-                    except json.JSONDecodeError as e:
-                        print(f"解析JSON失败: {e}, 原始数据: {json_str}")
-                        continue
+                        chunk_data = parse_json(event)
+                        if chunk_data is None:
+                            logger.debug("解析JSON失败，原始数据: %r", event[:200])
+                            continue
+                        if chunk_data.get('usage'):
+                            self.record_usage(chunk_data['usage'])
+                        
+                        choices = chunk_data.get('choices')
+                        if not choices:
+                            continue
+                        delta = choices[0].get('delta') or {}
+                        # reasoning_content 为推理内容（DeepSeek-R1特有）
+                        reasoning_content = delta.get('reasoning_content')
+                        content = delta.get('content')
+                        
+                        if first_token_at is None and (content or reasoning_content):
+                            first_token_at = time.perf_counter()
+                        token_count += 1
+                        
+                        for text in (content, reasoning_content):
+                            if text:
+                                parts.append(text)
+                                buffer.append(text)
+                                buffered += len(text)
+                        
+                        # 当缓冲区达到一定大小时发送
+                        if buffered >= buffer_size:
+                            if self.socketio:
+                                try:
+                                    # 发送事件（由对战任务统一推送，无需在此让出）
+                                    self.socketio.emit('thinking_stream', {
+                                        'player': player_color,
+                                        'content': "".join(buffer),
+                                        'is_complete': False
+                                    })
+                                except Exception as e:
+                                    logger.exception("发送thinking_stream事件失败: %s", e)
+                            buffer = []  # 清空缓冲区（未配置socketio时仅丢弃，如对冲请求）
+                            buffered = 0
+                    if finished:
+                        break
+                    set_read_timeout(sock)
+            except requests.exceptions.RequestException:
+                if not deadline_passed():
+                    raise
+                # 到达本步思考时限时读取超时：用已收到的内容解析棋步
+                logger.info("%s 已到本步思考时限，中止流式响应", self.display_name)
+                response.close()
+            
+            full_content = "".join(parts)
+            buffer = "".join(buffer)
             
             # 发送剩余的缓冲内容
             if buffer:
-                print(f"发送最后的缓冲内容 (长度{len(buffer)}): {repr(buffer[:50])}...")
+                logger.debug("发送最后的缓冲内容 (长度%d)", len(buffer))
                 if self.socketio:
                     try:
                         self.socketio.emit('thinking_stream', {
@@ -207,71 +623,103 @@ class LLMPlayer:
                             'content': buffer,
                             'is_complete': False
                         })
-                        print(f"成功发送最后的thinking_stream事件到{player_color}")
                     except Exception as e:
-                        print(f"发送最后的thinking_stream事件失败: {e}")
-                else:
-                    print("警告: socketio实例为None")
+                        logger.warning("发送最后的thinking_stream事件失败: %s", e)
             
-            print(f"流式响应完成，总块数: {chunk_count}, 总内容长度: {len(full_content)}")
+            logger.debug("流式响应完成，总块数: %d, 总内容长度: %d", chunk_count, len(full_content))
+            self.record_stream_metrics(request_start, first_token_at, token_count)
             
             # 发送完成信号
             if self.socketio:
                 try:
-                    print("发送流式完成信号")
                     self.socketio.emit('thinking_stream', {
                         'player': player_color,
                         'content': '',
                         'is_complete': True
                     })
-                    print(f"成功发送完成信号到{player_color}")
                 except Exception as e:
-                    print(f"发送完成信号失败: {e}")
-            else:
-                print("警告: socketio实例为None，无法发送完成信号")
+                    logger.warning("发送完成信号失败: %s", e)
             
             return full_content
                 
+        except RateLimitedError:
+            raise
         except requests.exceptions.ReadTimeout as e:
-            print(f"DeepSeek API读取超时: {e}")
+            logger.error("DeepSeek API读取超时: %s", e)
             return ""
         except requests.exceptions.ConnectionError as e:
-            print(f"DeepSeek API连接错误: {e}")
+            logger.error("DeepSeek API连接错误: %s", e)
             return ""
         except requests.exceptions.RequestException as e:
-            print(f"DeepSeek API请求异常: {e}")
+            logger.error("DeepSeek API请求异常: %s", e)
             return ""
         except Exception as e:
-            print(f"DeepSeek流式API调用失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("DeepSeek流式API调用失败: %s", e)
             return ""
     
-    def call_gemini_stream(self, prompt: str, player_color: str) -> str:
+    def record_usage(self, usage):
+        """记录一次请求的输入token数及其中命中前缀缓存的部分（usage 可以是字典或SDK对象）"""
+        if not usage:
+            return
+        if not isinstance(usage, dict):
+            usage = usage.model_dump() if hasattr(usage, 'model_dump') else vars(usage)
+        prompt_tokens, cached_tokens = prompt_cache_usage(usage)
+        if not prompt_tokens:
+            return
+        with self.stats_lock:
+            self.prompt_stats['requests'] += 1
+            self.prompt_stats['prompt_tokens'] += prompt_tokens
+            self.prompt_stats['cached_tokens'] += cached_tokens
+        LLM_PROMPT_TOKENS.inc(cached_tokens, model=self.model_name, cache='hit')
+        LLM_PROMPT_TOKENS.inc(prompt_tokens - cached_tokens, model=self.model_name, cache='miss')
+    
+    def record_stream_metrics(self, request_start: float, first_token_at: Optional[float], token_count: int):
+        """记录流式响应的首token时间和输出速率"""
+        if not metrics.enabled or first_token_at is None:
+            return
+        LLM_TTFT_SECONDS.observe(first_token_at - request_start, model=self.model_name)
+        LLM_OUTPUT_TOKENS.inc(token_count, model=self.model_name)
+        duration = time.perf_counter() - first_token_at
+        if duration > 0:
+            LLM_TOKENS_PER_SECOND.observe(token_count / duration, model=self.model_name)
+    
+    def call_gemini_stream(self, prompt: str, player_color: str, cancel_event: Optional[threading.Event] = None) -> str:
         """调用Gemini流式API"""
         try:
             from google import genai
             
-            # 创建客户端（API密钥从环境变量获取）
-            client = genai.Client(api_key=self.api_key)
+            # 创建客户端（API密钥从环境变量获取）；请求超时不超过本步剩余思考时间（毫秒）
+            http_options = {}
+            if Config.GEMINI_BASE_URL:
+                http_options['base_url'] = Config.GEMINI_BASE_URL
+            remaining = remaining_time()
+            if remaining is not None:
+                http_options['timeout'] = max(1, int(remaining * 1000))
+            client = genai.Client(api_key=self.api_key, http_options=http_options or None)
             
             # 构建完整的提示
-            full_prompt = f"你是一位专业的中国象棋大师，擅长分析局面和制定策略。\n\n{prompt}"
+            full_prompt = f"{CHESS_SYSTEM_PROMPT}\n\n{prompt}"
             
             # 生成内容
+            request_start = time.perf_counter()
             response = client.models.generate_content(
                 model="gemini-2.5-flash",
                 contents=full_prompt
             )
+            # 非流式接口：首token时间即整体响应时间
+            LLM_TTFT_SECONDS.observe(time.perf_counter() - request_start, model=self.model_name)
+            self.record_usage(response.usage_metadata)
             
             # Gemini API目前不支持真正的流式输出，我们模拟流式效果
             full_text = response.text
             
             # 按句子分割并逐步发送
-            sentences = re.split(r'([。！？\n])', full_text)
+            sentences = SENTENCE_SPLIT_RE.split(full_text)
             current_text = ""
             
             for i in range(0, len(sentences), 2):
+                if (cancel_event is not None and cancel_event.is_set()) or move_cancelled() or deadline_passed():
+                    break
                 if i < len(sentences):
                     sentence = sentences[i]
                     if i + 1 < len(sentences):
@@ -285,9 +733,8 @@ class LLMPlayer:
                             'content': sentence,
                             'is_complete': False
                         })
-                    
-                    # 短暂延迟模拟流式效果
-                    time.sleep(0.1)
+                        # 短暂延迟模拟流式效果；经推送器的 sleep 等待，无人观看（如对冲请求）时不等待
+                        self.socketio.sleep(0.1)
             
             # 发送完成信号
             if self.socketio:
@@ -300,9 +747,10 @@ class LLMPlayer:
             return full_text
             
         except Exception as e:
-            print(f"Gemini流式API调用失败: {e}")
-            import traceback
-            traceback.print_exc()
+            # google-genai 的 APIError 带有 code 属性
+            if getattr(e, 'code', None) == 429:
+                raise RateLimitedError(None) from e
+            logger.exception("Gemini流式API调用失败: %s", e)
             return ""
     
     def format_board_display(self, board_state: str) -> str:
@@ -327,11 +775,11 @@ class LLMPlayer:
             return display
             
         except Exception as e:
-            print(f"格式化棋盘显示时出错: {e}")
+            logger.warning("格式化棋盘显示时出错: %s", e)
             return board_state
 
     def build_chess_prompt(self, board_state: str, move_history: List[dict], legal_moves: List[str] = None) -> str:
-        """构建中国象棋提示词"""
+        """构建每步的用户消息：棋盘、合法棋步和历史（规则说明在系统提示词中）"""
         
         # 历史棋步字符串
         history_str = ""
@@ -350,101 +798,51 @@ class LLMPlayer:
         # 构建合法棋步列表字符串
         legal_moves_str = ""
         if legal_moves:
-            legal_moves_str = f"""
-【当前所有合法棋步】：
-你必须从以下合法棋步中选择一个：
-{', '.join(legal_moves[:50])}  # 显示前50个合法棋步
-总共有 {len(legal_moves)} 个合法棋步可选择。
-
-重要提醒：你只能选择上述列表中的棋步！选择其他棋步将导致游戏中断！
-"""
+            cached_moves, legal_moves_str = self.legal_moves_text
+            if cached_moves is not legal_moves:
+                legal_moves_str = LEGAL_MOVES_TEMPLATE.format(moves=', '.join(legal_moves[:50]), count=len(legal_moves))
+                self.legal_moves_text = (legal_moves, legal_moves_str)
         
-        # 棋盘说明
-        board_explanation = f"""
-棋盘格式说明：
-- 大写字母代表红方棋子：K=帅, A=仕, B=相, N=马, R=车, C=炮, P=兵
-- 小写字母代表黑方棋子：k=将, a=士, b=象, n=马, r=车, c=炮, p=卒
-- '.' 代表空位
-- 坐标系统：列用a-i表示(从左到右)，行用0-9表示(从上到下)
-
-当前棋盘状态（带坐标）：
-{board_display}
-
-{legal_moves_str}
-
-【重要规则 - 必须严格遵守】：
-1. 你必须从上面提供的合法棋步列表中选择！
-2. 绝对不能移动到己方棋子占据的位置！
-3. 只能移动到空位（'.'）或吃掉对方棋子的位置
-4. 必须遵守各棋子的移动规则
-5. 兵/卒过河前只能向前，过河后可以左右移动
-6. 炮吃子需要跳过一个棋子，不吃子时路径必须畅通
-
-【棋步选择步骤】：
-1. 仔细查看上面提供的合法棋步列表
-2. 分析每个合法棋步的战术价值
-3. 从合法棋步中选择最佳的一个
-4. 确保你选择的棋步在合法列表中！
-"""
-        
-        prompt = f"""你是一位中国象棋大师，正在进行一场中国象棋对局。
-
-{board_explanation}
-
-当前局面信息：
-- 当前轮次: {current_turn}
-- 总步数: {len(move_history)}
-
-最近棋步历史：
-{history_str if history_str else "游戏刚开始"}
-
-请分析当前局面并选择你的下一步棋。
-
-要求：
-1. 仔细查看上面提供的合法棋步列表
-2. 分析当前局面的优劣势
-3. 考虑可能的战术和战略
-4. 从合法棋步列表中选择最佳的一个棋步
-5. 确保你选择的棋步在合法列表中！
-
-中国象棋规则提醒：
-- 帅/将只能在九宫格内移动，一次一格
-- 士/仕只能在九宫格内斜走
-- 相/象不能过河，走田字，不能被塞象眼
-- 马走日字，但可能被蹩腿
-- 车走直线，路径必须畅通
-- 炮走直线，吃子需要跳过一个棋子，不吃子时路径必须畅通
-- 兵/卒过河前只能向前，过河后可以左右移动
-
-请按以下格式回复：
-分析：[你对当前局面的分析，包括棋子位置观察]
-策略：[你的下棋策略和从合法棋步中的选择理由]
-棋步：[从合法棋步列表中选择的棋步，如a0a1]
-
-重要提醒：你必须从上面提供的合法棋步列表中选择！选择其他棋步将导致游戏中断！
-"""
-        return prompt
+        return CHESS_PROMPT_TEMPLATE.format(
+            board_display=board_display,
+            legal_moves=legal_moves_str,
+            current_turn=current_turn,
+            move_count=len(move_history),
+            history=history_str if history_str else "游戏刚开始"
+        )
     
     def call_openai_api(self, prompt: str) -> str:
         """调用OpenAI API"""
+        choices = self.call_openai_choices(prompt)
+        return choices[0] if choices else ""
+    
+    def call_openai_choices(self, prompt: str, n: int = 1) -> List[str]:
+        """调用OpenAI API，一次请求返回 n 个回复"""
+        import openai
         try:
             client = openai.OpenAI(api_key=self.api_key)
             response = client.chat.completions.create(
                 model=self.model_name,
                 messages=[
-                    {"role": "system", "content": "你是一位专业的中国象棋大师，擅长分析局面和制定策略。"},
+                    {"role": "system", "content": CHESS_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=500,
-                temperature=0.7
+                temperature=0.7,
+                n=n,
+                timeout=time_left(30)
             )
-            return response.choices[0].message.content
+            self.record_usage(response.usage)
+            return [choice.message.content or "" for choice in response.choices]
+        except openai.RateLimitError as e:
+            raise RateLimitedError(parse_retry_after(e.response.headers.get('retry-after'))) from e
         except Exception as e:
-            print(f"OpenAI API调用失败: {e}")
-            return ""
+            logger.error("OpenAI API调用失败: %s", e)
+            return []
     
     def call_deepseek_api(self, prompt: str) -> str:
         """调用DeepSeek API"""
+        import requests
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -453,7 +851,7 @@ class LLMPlayer:
             data = {
                 "model": self.model_name,
                 "messages": [
-                    {"role": "system", "content": "你是一位专业的中国象棋大师，擅长分析局面和制定策略。"},
+                    {"role": "system", "content": CHESS_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 "max_tokens": 500,
@@ -464,54 +862,78 @@ class LLMPlayer:
                 f"{self.base_url}/chat/completions",
                 headers=headers,
                 json=data,
-                timeout=30
+                timeout=time_left(30)
             )
             
             if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
+                result = response.json()
+                self.record_usage(result.get("usage"))
+                return result["choices"][0]["message"]["content"]
+            elif response.status_code == 429:
+                raise RateLimitedError(parse_retry_after(response.headers.get('Retry-After')))
             else:
-                print(f"DeepSeek API错误: {response.status_code}")
+                logger.error("DeepSeek API错误: %s", response.status_code)
                 return ""
                 
+        except RateLimitedError:
+            raise
         except Exception as e:
-            print(f"DeepSeek API调用失败: {e}")
+            logger.error("DeepSeek API调用失败: %s", e)
             return ""
     
     def call_claude_api(self, prompt: str) -> str:
         """调用Claude API"""
+        import requests
         try:
             headers = {
                 "x-api-key": self.api_key,
                 "Content-Type": "application/json",
                 "anthropic-version": "2023-06-01"
             }
+            # 规则说明作为系统提示词，标记 cache_control 后后续请求直接读取缓存的前缀
+            system_block = {"type": "text", "text": CHESS_SYSTEM_PROMPT}
+            if Config.PROMPT_CACHE_CONTROL:
+                system_block["cache_control"] = {"type": "ephemeral"}
             data = {
                 "model": self.model_name,
                 "max_tokens": 500,
+                "system": [system_block],
                 "messages": [
                     {"role": "user", "content": prompt}
                 ]
             }
             
             response = requests.post(
-                "https://api.anthropic.com/v1/messages",
+                f"{Config.ANTHROPIC_BASE_URL.rstrip('/')}/messages",
                 headers=headers,
                 json=data,
-                timeout=30
+                timeout=time_left(30)
             )
             
             if response.status_code == 200:
-                return response.json()["content"][0]["text"]
+                result = response.json()
+                self.record_usage(result.get("usage"))
+                return result["content"][0]["text"]
+            elif response.status_code == 429:
+                raise RateLimitedError(parse_retry_after(response.headers.get('Retry-After')))
             else:
-                print(f"Claude API错误: {response.status_code}")
+                logger.error("Claude API错误: %s", response.status_code)
                 return ""
                 
+        except RateLimitedError:
+            raise
         except Exception as e:
-            print(f"Claude API调用失败: {e}")
+            logger.error("Claude API调用失败: %s", e)
             return ""
     
     def call_generic_api(self, prompt: str) -> str:
         """调用通用API（兼容OpenAI格式）"""
+        choices = self.call_generic_choices(prompt)
+        return choices[0] if choices else ""
+    
+    def call_generic_choices(self, prompt: str, n: int = 1) -> List[str]:
+        """调用通用API（兼容OpenAI格式），一次请求返回 n 个回复"""
+        import requests
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -520,80 +942,63 @@ class LLMPlayer:
             data = {
                 "model": self.model_name,
                 "messages": [
-                    {"role": "system", "content": "你是一位专业的中国象棋大师。"},
+                    {"role": "system", "content": GENERIC_CHESS_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 "max_tokens": 500,
                 "temperature": 0.7
             }
+            if n > 1:
+                data["n"] = n
             
             response = requests.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
                 json=data,
-                timeout=30
+                timeout=time_left(30)
             )
             
             if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
+                result = response.json()
+                self.record_usage(result.get("usage"))
+                return [choice["message"]["content"] or "" for choice in result["choices"]]
+            elif response.status_code == 429:
+                raise RateLimitedError(parse_retry_after(response.headers.get('Retry-After')))
             else:
-                return ""
+                logger.error("通用API错误: %s", response.status_code)
+                return []
                 
+        except RateLimitedError:
+            raise
         except Exception as e:
-            print(f"通用API调用失败: {e}")
-            return ""
+            logger.error("通用API调用失败: %s", e)
+            return []
     
-    def parse_response(self, response: str) -> Optional[Dict]:
-        """解析模型响应，提取棋步和思考过程"""
+    def parse_response(self, response: str, legal_moves: List[str] = None,
+                       game: Optional[ChessGame] = None) -> Optional[Dict]:
+        """解析模型响应，提取棋步和思考过程
+        
+        提供合法棋步列表时，只会在合法棋步中按位置和上下文选取最终陈述的棋步。
+        """
         if not response:
             return None
         
         try:
-            print(f"开始解析响应，响应长度: {len(response)}")
-            print(f"响应内容预览: {response[-500:]}")  # 显示最后500个字符
-            
-            # 提取分析内容
-            analysis_match = re.search(r'分析[：:]\s*(.+?)(?=策略|棋步|$)', response, re.DOTALL)
-            analysis = analysis_match.group(1).strip() if analysis_match else ""
-            
-            # 提取策略内容
-            strategy_match = re.search(r'策略[：:]\s*(.+?)(?=棋步|$)', response, re.DOTALL)
-            strategy = strategy_match.group(1).strip() if strategy_match else ""
-            
-            # 提取棋步（中国象棋坐标格式）- 更宽松的匹配
-            move_patterns = [
-                r'棋步[：:]\s*([a-i][0-9][a-i][0-9])',  # 标准格式：棋步：e6e7
-                r'([a-i][0-9][a-i][0-9])\s*$',          # 行末的坐标格式
-                r'([a-i][0-9][a-i][0-9])',              # 任何位置的坐标格式
-            ]
-            
-            move = None
-            for pattern in move_patterns:
-                move_match = re.search(pattern, response)
-                if move_match:
-                    move = move_match.group(1).lower()
-                    print(f"使用模式 '{pattern}' 找到棋步: {move}")
-                    break
+            logger.debug("开始解析响应，响应长度: %d", len(response))
             
-            if move:
-                result = {
-                    'move': move,
-                    'analysis': analysis,
-                    'strategy': strategy,
-                    'thinking': f"分析: {analysis}\n策略: {strategy}",
-                    'raw_response': response
-                }
-                print(f"成功解析棋步: {result}")
+            with MOVE_PARSE_SECONDS.time(model=self.model_name):
+                result = self.move_parser.parse(response, legal_moves, game)
+            MOVE_PARSE_OUTCOMES.inc(model=self.model_name, outcome=result['move_source'] if result else 'none')
+            if result:
+                logger.debug("成功解析棋步: %s（来源: %s）", result['move'], result['move_source'])
                 return result
             else:
-                print(f"无法从响应中提取有效棋步")
-                print(f"完整响应内容: {response}")
+                logger.info("无法从响应中提取有效棋步")
+                logger.debug("响应内容: %s", response)
                 return None
                 
         except Exception as e:
-            print(f"解析响应时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("解析响应时出错: %s", e)
             return None
     
     def get_stats(self) -> Dict:
@@ -604,5 +1009,10 @@ class LLMPlayer:
             'model_name': self.model_name,
             'move_count': self.move_count,
             'total_thinking_time': self.total_thinking_time,
-            'avg_thinking_time': avg_thinking_time
+            'avg_thinking_time': avg_thinking_time,
+            'parse_stats': self.move_parser.get_stats(),
+            'sample_stats': dict(self.sample_stats, samples=self.samples, selection=self.sample_selection),
+            'prompt_stats': dict(self.prompt_stats, cache_hit_ratio=(
+                self.prompt_stats['cached_tokens'] / self.prompt_stats['prompt_tokens']
+                if self.prompt_stats['prompt_tokens'] else 0.0))
         }
\ No newline at end of file
@@ -0,0 +1,108 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from typing import Optional
+from config import Config
+
+# 当前对战上下文（battle_id、player 等），随线程/协程隔离
+_log_context = contextvars.ContextVar('chess_log_context', default={})
+
+_listener = None
+
+
+class ContextFilter(logging.Filter):
+    """把当前对战上下文字段附加到日志记录上"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _log_context.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """人类可读格式，上下文字段以 key=value 附在行首"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = {**getattr(record, 'context', {}), **getattr(record, 'fields', {})}
+        prefix = " ".join(f"{k}={v}" for k, v in context.items())
+        timestamp = time.strftime('%H:%M:%S', time.localtime(record.created))
+        line = f"{timestamp} {record.levelname:<5} [{record.name}] {prefix + ' ' if prefix else ''}{record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(level: Optional[str] = None, log_format: Optional[str] = None):
+    """配置 chess 日志：记录先进入队列，由后台线程写出，日志I/O不阻塞对战循环
+
+    重复调用时会替换之前的配置。
+    """
+    global _listener
+
+    logger = logging.getLogger('chess')
+    logger.setLevel((level or Config.LOG_LEVEL).upper())
+    logger.propagate = False
+
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if (log_format or Config.LOG_FORMAT) == 'json' else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # 上下文字段需在入队前（调用方线程中）附加
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """获取 chess 下的子日志器，首次使用时自动完成配置"""
+    if _listener is None:
+        setup_logging()
+    return logging.getLogger(f'chess.{name}')
+
+
+@contextmanager
+def log_context(**fields):
+    """在当前上下文中附加日志字段，如 battle_id、player"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
@@ -0,0 +1,214 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+import socketio
+
+from config import Config
+from .chess_game import json_default
+from .log import get_logger
+
+logger = get_logger('message_queue')
+
+
+class PreEncoded:
+    """预先序列化好的事件负载
+
+    同一事件发往多个房间、写入快照缓存和统计字节数时共用这一份JSON文本，
+    不再为每个接收方或每个用途重复序列化。其他序列化器（消息队列、Flask）经 to_dict 取回原始数据。
+    """
+
+    __slots__ = ('data', 'text', '_size')
+
+    def __init__(self, data):
+        self.data = data
+        self.text = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=json_default)
+        self._size = None
+
+    @property
+    def size(self) -> int:
+        """UTF-8 编码后的字节数"""
+        if self._size is None:
+            self._size = len(self.text.encode('utf-8'))
+        return self._size
+
+    def to_dict(self):
+        return self.data
+
+
+class PayloadJSON:
+    """Socket.IO 负载序列化：支持 MoveRecord 等带 to_dict 的对象
+
+    Socket.IO 把事件编码为 [事件名, 负载...] 列表，其中的 PreEncoded 直接拼接已有文本。
+    """
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        kwargs.setdefault('default', json_default)
+        if isinstance(obj, list) and any(isinstance(item, PreEncoded) for item in obj):
+            return '[' + ','.join(item.text if isinstance(item, PreEncoded) else json.dumps(item, **kwargs)
+                                  for item in obj) + ']'
+        return json.dumps(obj, **kwargs)
+
+    loads = staticmethod(json.loads)
+
+
+def unix_socket_path(url: str) -> str:
+    """unix:///tmp/x.sock -> /tmp/x.sock"""
+    return urlparse(url).path
+
+
+class UnixSocketBroker:
+    """本地扇出代理：把任一发布者写入的每一行转发给所有订阅者
+
+    连接建立后第一行为 PUB 或 SUB。每个订阅者有独立的发送队列和线程，
+    慢订阅者不会阻塞其他进程。仅用于单机多进程部署和测试，生产多机部署请使用Redis。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(64)
+        threading.Thread(target=self._accept_loop, name='mq-broker', daemon=True).start()
+        logger.info("消息代理已启动: %s", self.path)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: socket.socket):
+        reader = conn.makefile('rb')
+        role = reader.readline().strip()
+        if role == b'SUB':
+            outbox = queue.SimpleQueue()
+            with self.lock:
+                self.subscribers.append(outbox)
+            try:
+                while True:
+                    line = outbox.get()
+                    conn.sendall(line)
+            except OSError:
+                pass
+            finally:
+                with self.lock:
+                    self.subscribers.remove(outbox)
+                conn.close()
+        elif role == b'PUB':
+            try:
+                for line in reader:
+                    with self.lock:
+                        subscribers = list(self.subscribers)
+                    for outbox in subscribers:
+                        outbox.put(line)
+            finally:
+                conn.close()
+        else:
+            conn.close()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UnixSocketManager(socketio.PubSubManager):
+    """基于 UnixSocketBroker 的 Socket.IO 客户端管理器
+
+    与 RedisManager 接口一致：多个 Web 进程通过它共享广播，
+    对战工作进程以 write_only=True 方式使用它推送事件。
+    """
+
+    name = 'unix'
+
+    def __init__(self, url: str, channel: str = 'socketio', write_only: bool = False, logger=None, json=None):
+        self.path = unix_socket_path(url)
+        self.publish_sock = None
+        self.publish_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+
+    def _connect(self, role: bytes) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        sock.sendall(role + b"\n")
+        return sock
+
+    def _publish(self, data):
+        line = (self.json.dumps(data, ensure_ascii=False) + "\n").encode('utf-8')
+        with self.publish_lock:
+            for attempt in range(2):
+                try:
+                    if self.publish_sock is None:
+                        self.publish_sock = self._connect(b'PUB')
+                    self.publish_sock.sendall(line)
+                    return
+                except OSError as e:
+                    if self.publish_sock is not None:
+                        self.publish_sock.close()
+                    self.publish_sock = None
+                    if attempt == 1:
+                        self._get_logger().error("无法发布到消息代理 %s: %s", self.path, e)
+
+    def _listen(self):
+        retry = 1.0
+        while True:
+            try:
+                sock = self._connect(b'SUB')
+                retry = 1.0
+                for line in sock.makefile('rb'):
+                    yield line.decode('utf-8')
+                sock.close()
+            except OSError as e:
+                self._get_logger().error("消息代理 %s 连接失败，%.0f秒后重试: %s", self.path, retry, e)
+            time.sleep(retry)
+            retry = min(retry * 2, 30.0)
+
+
+def create_client_manager(url: Optional[str] = None, write_only: bool = False):
+    """按URL创建 Socket.IO 客户端管理器；url 为空时返回None（单进程内存模式）
+
+    支持 redis://、rediss://（需要 redis 包）、amqp://（需要 kombu 包）和 unix://。
+    """
+    url = Config.MESSAGE_QUEUE if url is None else url
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme == 'unix':
+        return UnixSocketManager(url, write_only=write_only, json=PayloadJSON)
+    if scheme in ('redis', 'rediss'):
+        return socketio.RedisManager(url, write_only=write_only, json=PayloadJSON)
+    if scheme in ('amqp', 'kombu'):
+        return socketio.KombuManager(url, write_only=write_only, json=PayloadJSON)
+    raise ValueError(f"不支持的消息队列: {url}")
+
+
+class QueueEmitter:
+    """对战工作进程使用的推送器，接口与 socketio 实例的 emit/sleep 一致"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def emit(self, event: str, data=None, **kwargs):
+        self.manager.emit(event, data, namespace=kwargs.get('namespace', '/'),
+                          room=kwargs.get('to') or kwargs.get('room'))
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
@@ -0,0 +1,258 @@
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from config import Config
+
+# 默认直方图分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+RATE_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """指标基类，按标签值元组分别计数"""
+
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文，禁用时不调用计时器"""
+        if not self.registry.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self.values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Prometheus文本格式的指标注册表
+
+    禁用时各指标的记录方法直接返回，热路径上只多一次属性判断。
+    collectors 用于在导出时从其他模块（限流器、调度器等）拉取快照。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(self, name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(self, name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(self, name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """注册导出时调用的回调，返回Prometheus文本行"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f"# collector error: {_escape(e)}")
+        lines.extend(_process_metrics())
+        return "\n".join(lines) + "\n"
+
+
+def _process_metrics() -> List[str]:
+    """进程CPU时间与常驻内存"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss_bytes = usage.ru_maxrss * 1024
+    try:
+        with open('/proc/self/statm') as f:
+            rss_bytes = int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        pass
+    return [
+        "# HELP process_cpu_seconds_total Total user and system CPU time spent in seconds.",
+        "# TYPE process_cpu_seconds_total counter",
+        f"process_cpu_seconds_total {usage.ru_utime + usage.ru_stime}",
+        "# HELP process_resident_memory_bytes Resident memory size in bytes.",
+        "# TYPE process_resident_memory_bytes gauge",
+        f"process_resident_memory_bytes {rss_bytes}",
+    ]
+
+
+def stats_collector(prefix: str, snapshot: Callable[[], Dict], label: str) -> Callable[[], List[str]]:
+    """把 {名称: {字段: 数值}} 形式的统计快照转换为gauge行"""
+    def collect() -> List[str]:
+        lines = []
+        rows = {}
+        for owner, fields in snapshot().items():
+            if not isinstance(fields, dict):
+                continue
+            for field, value in fields.items():
+                if isinstance(value, (int, float)):
+                    rows.setdefault(field, []).append((owner, value))
+        for field, values in rows.items():
+            name = f"{prefix}_{field}"
+            lines.append(f"# TYPE {name} gauge")
+            for owner, value in values:
+                lines.append(f'{name}{{{label}="{_escape(owner)}"}} {value}')
+        return lines
+    return collect
+
+
+# 进程内共享的指标
+metrics = MetricsRegistry(enabled=Config.METRICS_ENABLED)
+
+LLM_REQUEST_SECONDS = metrics.histogram(
+    'llm_request_duration_seconds', 'Total model request latency.', ('model',))
+LLM_TTFT_SECONDS = metrics.histogram(
+    'llm_time_to_first_token_seconds', 'Time to first streamed token.', ('model',))
+LLM_TOKENS_PER_SECOND = metrics.histogram(
+    'llm_tokens_per_second', 'Streamed output tokens per second after the first token.', ('model',), RATE_BUCKETS)
+LLM_OUTPUT_TOKENS = metrics.counter(
+    'llm_output_tokens_total', 'Streamed output tokens (delta chunks).', ('model',))
+LLM_PROMPT_TOKENS = metrics.counter(
+    'llm_prompt_tokens_total', 'Input tokens reported by the provider, split by prefix cache hit/miss.', ('model', 'cache'))
+MOVE_PARSE_SECONDS = metrics.histogram(
+    'move_parse_duration_seconds', 'Time spent parsing a model response.', ('model',))
+MOVE_PARSE_OUTCOMES = metrics.counter(
+    'move_parse_outcomes_total', 'Parse results by move source.', ('model', 'outcome'))
+LEGAL_MOVES_SECONDS = metrics.histogram(
+    'legal_moves_generation_seconds', 'Time spent in ChessGame.get_legal_moves.')
+LEGAL_MOVE_CACHE = metrics.counter(
+    'legal_moves_cache_lookups_total', 'Legal move lookups by result: generated or reused from the per-position cache.', ('result',))
+SOCKETIO_EMITS = metrics.counter(
+    'socketio_emits_total', 'Socket.IO events emitted.', ('event',))
+SOCKETIO_EMIT_BYTES = metrics.counter(
+    'socketio_emit_bytes_total', 'JSON-encoded Socket.IO payload bytes emitted.', ('event',))
+MOVE_RETRIES = metrics.counter(
+    'battle_move_retries_total', 'Move attempts that had to be retried.', ('model',))
+MOVES_TOTAL = metrics.counter(
+    'battle_moves_total', 'Moves played.', ('model',))
+BATTLES_ACTIVE = metrics.gauge(
+    'battles_active', 'Battles currently running.')
+EVENT_LOOP_LAG_SECONDS = metrics.histogram(
+    'event_loop_lag_seconds', 'Extra delay observed by a periodic cooperative sleep.')
+MODEL_CALLS_INFLIGHT = metrics.gauge(
+    'model_calls_inflight', 'Model calls running in the offload thread pool.')
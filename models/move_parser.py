@@ -0,0 +1,201 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from .chess_game import ChessGame
+
+# 坐标棋步，允许 "h2e2"、"h2-e2"、"H2→E2" 等写法
+COORD_CANDIDATE_RE = re.compile(r'(?<![a-zA-Z0-9])([a-iA-I][0-9])\s*(?:-|→|->|到)?\s*([a-iA-I][0-9])(?![0-9])')
+
+# 中文记谱，如 "炮二平五"、"马8进7"、"前车进一"
+_PIECE_CHARS = '帅帥将將仕士相象马馬傌车車俥炮砲包兵卒'
+_NUM_CHARS = '一二三四五六七八九1-9１-９'
+CHINESE_CANDIDATE_RE = re.compile(
+    rf'(?:[前中后後][{_PIECE_CHARS}]|[{_PIECE_CHARS}][{_NUM_CHARS}])[进進退平][{_NUM_CHARS}]'
+)
+
+# 上下文标记
+FINAL_MARKER_RE = re.compile(r'(棋步|最终选择|最终决定|最佳棋步|我选择|我的选择)\s*[：:]?\s*[\[【「“"]*\s*$')
+CHOICE_HINT_RE = re.compile(r'(选择|决定|走|下)\s*$')
+NEGATION_RE = re.compile(r'(不能|不要|不走|避免|放弃|而不是|非法|不合法|无法|如果对方|对方可能)')
+SECTION_RE = re.compile(r'(分析|策略|棋步)[：:]')
+ANALYSIS_RE = re.compile(r'分析[：:]\s*(.+?)(?=策略|棋步|$)', re.DOTALL)
+STRATEGY_RE = re.compile(r'策略[：:]\s*(.+?)(?=棋步|$)', re.DOTALL)
+
+# 旧解析规则，仅用于统计对比
+LEGACY_MOVE_PATTERNS = [
+    re.compile(r'棋步[：:]\s*([a-i][0-9][a-i][0-9])'),
+    re.compile(r'([a-i][0-9][a-i][0-9])\s*$'),
+    re.compile(r'([a-i][0-9][a-i][0-9])'),
+]
+
+
+class MoveParser:
+    """基于合法棋步集合的棋步解析器
+
+    对响应中出现的每个候选棋步（坐标或中文记谱）按位置和上下文打分，
+    只在合法棋步中选取得分最高者。旧的做法是取第一个匹配的坐标，
+    经常会抓到分析中提到的棋步，导致一次无谓的重试。
+    """
+
+    def __init__(self):
+        self.stats = {
+            'responses': 0,           # 解析的响应数
+            'direct': 0,              # 旧规则解析结果本身就是所选合法棋步
+            'repaired': 0,            # 旧规则会选中非法棋步，经打分修复为合法棋步
+            'reranked': 0,            # 旧规则会选中其他合法棋步，按上下文改选最终陈述的棋步
+            'notation_mapped': 0,     # 通过中文记谱映射得到棋步
+            'no_legal_candidate': 0,  # 没有任何合法候选，需要追问
+            'followup_requests': 0,   # 发出的追问次数
+            'followup_success': 0,    # 追问后得到合法棋步的次数
+        }
+
+    def extract_candidates(self, response: str, game: Optional[ChessGame] = None) -> List[Dict]:
+        """提取响应中的全部候选棋步及其位置
+
+        Args:
+            response: 模型响应文本
+            game: 当前局面，用于把中文记谱映射为坐标；为None时忽略中文记谱
+        """
+        candidates = []
+        for match in COORD_CANDIDATE_RE.finditer(response):
+            candidates.append({
+                'move': (match.group(1) + match.group(2)).lower(),
+                'start': match.start(),
+                'end': match.end(),
+                'source': 'coord'
+            })
+
+        if game is not None:
+            for match in CHINESE_CANDIDATE_RE.finditer(response):
+                from_pos, to_pos = game.parse_chinese_notation(match.group(0))
+                if from_pos is None or to_pos is None:
+                    continue
+                candidates.append({
+                    'move': game.pos_to_coord(from_pos) + game.pos_to_coord(to_pos),
+                    'start': match.start(),
+                    'end': match.end(),
+                    'source': 'notation'
+                })
+
+        candidates.sort(key=lambda c: c['start'])
+        return candidates
+
+    def score_candidate(self, response: str, candidate: Dict) -> float:
+        """按位置和上下文给候选棋步打分，越靠后、越接近“棋步：”标记得分越高"""
+        length = max(len(response), 1)
+        score = candidate['start'] / length
+
+        prefix = response[max(0, candidate['start'] - 16):candidate['start']]
+        if FINAL_MARKER_RE.search(prefix):
+            score += 3.0
+        elif CHOICE_HINT_RE.search(prefix):
+            score += 1.0
+        if NEGATION_RE.search(prefix):
+            score -= 2.0
+
+        # 位于“分析：”段落中的棋步多为列举而非结论
+        sections = [m for m in SECTION_RE.finditer(response, 0, candidate['start'])]
+        if sections and sections[-1].group(1) == '分析':
+            score -= 0.5
+        return score
+
+    def select_move(self, response: str, legal_moves: Optional[List[str]] = None,
+                    game: Optional[ChessGame] = None) -> Tuple[Optional[Dict], List[Dict]]:
+        """从候选棋步中选出得分最高的合法棋步
+
+        Returns:
+            Tuple: (选中的候选, 全部候选)；没有合法候选时选中项为None
+        """
+        candidates = self.extract_candidates(response, game)
+        legal_set = set(legal_moves) if legal_moves else None
+
+        best = None
+        best_score = None
+        for candidate in candidates:
+            if legal_set is not None and candidate['move'] not in legal_set:
+                continue
+            score = self.score_candidate(response, candidate)
+            if best_score is None or score > best_score:
+                best, best_score = candidate, score
+        return best, candidates
+
+    def parse(self, response: str, legal_moves: Optional[List[str]] = None,
+              game: Optional[ChessGame] = None) -> Optional[Dict]:
+        """解析模型响应，返回棋步、分析和策略；无合法棋步时返回None"""
+        if not response:
+            return None
+
+        self.stats['responses'] += 1
+        best, candidates = self.select_move(response, legal_moves, game)
+
+        if best is None:
+            self.stats['no_legal_candidate'] += 1
+            return None
+
+        # 与旧规则对比，用于统计避免的重试
+        legacy = self.legacy_move(response)
+        if legacy == best['move']:
+            self.stats['direct'] += 1
+        elif legacy is None or (legal_moves and legacy not in legal_moves):
+            self.stats['repaired'] += 1
+        else:
+            self.stats['reranked'] += 1
+        if best['source'] == 'notation':
+            self.stats['notation_mapped'] += 1
+
+        return self.build_result(response, best['move'], best['source'])
+
+    def parse_followup(self, followup: str, original_response: str, options: List[str],
+                       game: Optional[ChessGame] = None) -> Optional[Dict]:
+        """解析追问的回复，分析与策略沿用原始响应"""
+        self.stats['followup_requests'] += 1
+        if not followup:
+            return None
+        best, _ = self.select_move(followup, options, game)
+        if best is None:
+            return None
+        self.stats['followup_success'] += 1
+        result = self.build_result(original_response, best['move'], 'followup')
+        result['raw_response'] = f"{original_response}\n\n[追问回复]\n{followup}"
+        return result
+
+    def build_result(self, response: str, move: str, source: str) -> Dict:
+        """组装解析结果"""
+        analysis_match = ANALYSIS_RE.search(response)
+        analysis = analysis_match.group(1).strip() if analysis_match else ""
+        strategy_match = STRATEGY_RE.search(response)
+        strategy = strategy_match.group(1).strip() if strategy_match else ""
+
+        return {
+            'move': move,
+            'analysis': analysis,
+            'strategy': strategy,
+            'thinking': f"分析: {analysis}\n策略: {strategy}",
+            'raw_response': response,
+            'move_source': source
+        }
+
+    def legacy_move(self, response: str) -> Optional[str]:
+        """旧规则解析出的棋步：依次尝试“棋步：”、行末坐标、任意位置的首个坐标"""
+        for pattern in LEGACY_MOVE_PATTERNS:
+            match = pattern.search(response)
+            if match:
+                return match.group(1).lower()
+        return None
+
+    def rejected_moves(self, response: str, legal_moves: List[str]) -> List[str]:
+        """响应中出现但不合法的坐标棋步（用于构建追问）"""
+        legal_set = set(legal_moves)
+        return [c['move'] for c in self.extract_candidates(response) if c['move'] not in legal_set]
+
+    def shortlist(self, legal_moves: List[str], rejected: List[str], limit: int) -> List[str]:
+        """为追问挑选候选棋步：优先与模型原意（起点或终点）相同的合法棋步"""
+        squares = {m[:2] for m in rejected} | {m[2:] for m in rejected}
+        related = [m for m in legal_moves if m[:2] in squares or m[2:] in squares]
+        others = [m for m in legal_moves if m not in related]
+        return (related + others)[:limit]
+
+    def get_stats(self) -> Dict:
+        """获取解析统计，retries_avoided 为按旧规则本应触发重试的次数"""
+        stats = dict(self.stats)
+        stats['retries_avoided'] = self.stats['repaired'] + self.stats['followup_success']
+        return stats
@@ -0,0 +1,229 @@
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from config import Config
+
+
+class RateLimitedError(Exception):
+    """服务端返回429（或等价错误），retry_after 为建议等待秒数"""
+
+    def __init__(self, retry_after: Optional[float] = None, message: str = "请求被限流"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AcquireAbortedError(Exception):
+    """等待限流额度时到达截止时刻或被取消，排队位置已让出"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和HTTP日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """指数退避（full jitter）：在 [0, min(cap, base * 2^attempt)] 内随机取值"""
+    base = Config.BACKOFF_BASE if base is None else base
+    cap = Config.BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_tokens(prompt: str) -> int:
+    """粗略估计一次请求消耗的token数（中文约每1.5字符一个token，加上预估输出）"""
+    return int(len(prompt) / 1.5) + Config.RATE_LIMIT_EST_OUTPUT_TOKENS
+
+
+class TokenBucket:
+    """令牌桶，capacity 为每分钟额度，按秒线性补充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """取走 amount 个令牌前还需等待的秒数；超过桶容量的请求按满桶处理"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class ProviderLimiter:
+    """单个 (base_url, api_key) 的限流器
+
+    同时限制每分钟请求数、每分钟token数和并发数；遇到 Retry-After 时整体暂停。
+    等待者按到达顺序排队（FIFO），多个对战共用同一个Key时不会有对战被饿死；
+    中途放弃的等待者记入 abandoned，轮到它时直接跳过。
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int, concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.active = 0
+        self.blocked_until = 0.0
+        self.cond = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+        self.abandoned = set()  # 已放弃、尚未轮到的排队号
+        self.stats = {
+            'queue_depth': 0,        # 当前排队数
+            'max_queue_depth': 0,
+            'acquired': 0,
+            'wait_seconds_total': 0.0,
+            'max_wait_seconds': 0.0,
+            'throttled': 0,          # 收到429的次数
+            'aborted': 0,            # 到达截止时刻或被取消而放弃排队的次数
+        }
+
+    def _time_until_ready(self, tokens: int) -> Optional[float]:
+        """距离可放行还需等待的秒数；并发已满时返回None（等待释放通知）"""
+        if self.active >= self.concurrency:
+            return None
+        return max(
+            self.blocked_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens)
+        )
+
+    @contextmanager
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None,
+                cancel_event: Optional[threading.Event] = None):
+        """按FIFO顺序获取一次请求额度，退出上下文时释放并发槽位
+
+        Args:
+            tokens: 本次请求预计消耗的token数
+            deadline: 最晚等到的时刻（time.monotonic）
+            cancel_event: 被设置时停止等待
+
+        Raises:
+            AcquireAbortedError: 到达 deadline 或 cancel_event 被设置时仍未获得额度
+        """
+        start = time.monotonic()
+        with self.cond:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.stats['queue_depth'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.stats['queue_depth'])
+            while True:
+                wait_for = None
+                if ticket == self.serving:
+                    wait_for = self._time_until_ready(tokens)
+                    if wait_for is not None and wait_for <= 0:
+                        break
+                if (cancel_event is not None and cancel_event.is_set()) or \
+                        (deadline is not None and time.monotonic() >= deadline):
+                    self._abandon(ticket)
+                    raise AcquireAbortedError(f"{self.name} 等待限流额度时放弃")
+                if deadline is not None:
+                    wait_for = deadline - time.monotonic() if wait_for is None else min(wait_for, deadline - time.monotonic())
+                if cancel_event is not None:
+                    # 取消事件无法唤醒条件变量，分段等待
+                    wait_for = Config.RATE_LIMIT_CANCEL_POLL if wait_for is None else min(wait_for, Config.RATE_LIMIT_CANCEL_POLL)
+                self.cond.wait(timeout=wait_for)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.active += 1
+            self._advance()
+            self.stats['queue_depth'] -= 1
+            self.stats['acquired'] += 1
+            waited = time.monotonic() - start
+            self.stats['wait_seconds_total'] += waited
+            self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], waited)
+            self.cond.notify_all()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cond.notify_all()
+
+    def _advance(self):
+        """轮到下一个仍在等待的排队号（需持有锁）"""
+        self.serving += 1
+        while self.serving in self.abandoned:
+            self.abandoned.remove(self.serving)
+            self.serving += 1
+
+    def _abandon(self, ticket: int):
+        """让出排队号（需持有锁）"""
+        if ticket == self.serving:
+            self._advance()
+        else:
+            self.abandoned.add(ticket)
+        self.stats['queue_depth'] -= 1
+        self.stats['aborted'] += 1
+        self.cond.notify_all()
+
+    def penalize(self, retry_after: Optional[float]):
+        """收到429后暂停放行：有 Retry-After 时按其等待，否则至少等待一个退避基数"""
+        with self.cond:
+            self.stats['throttled'] += 1
+            pause = retry_after if retry_after is not None else Config.BACKOFF_BASE
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            self.cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self.cond:
+            stats = dict(self.stats)
+            stats['active'] = self.active
+        return stats
+
+
+class RateLimiterRegistry:
+    """按 (base_url, api_key) 共享限流器，同一个Key的所有对战共用额度"""
+
+    def __init__(self):
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get(self, base_url: Optional[str], api_key: str) -> ProviderLimiter:
+        # 只保存Key的摘要，避免把密钥带入统计和日志
+        fingerprint = hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:8]
+        key = (base_url or "", fingerprint)
+        with self.lock:
+            if key not in self.limiters:
+                limits = dict(Config.RATE_LIMITS.get('default', {}))
+                limits.update(Config.RATE_LIMITS.get(base_url or "", {}))
+                self.limiters[key] = ProviderLimiter(
+                    name=f"{base_url or 'default'}#{fingerprint}",
+                    rpm=limits.get('rpm', 60),
+                    tpm=limits.get('tpm', 200000),
+                    concurrency=limits.get('concurrency', 4)
+                )
+            return self.limiters[key]
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            limiters = list(self.limiters.values())
+        return {limiter.name: limiter.get_stats() for limiter in limiters}
+
+
+# 进程内共享的限流器注册表
+rate_limiters = RateLimiterRegistry()
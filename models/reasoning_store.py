@@ -0,0 +1,140 @@
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Optional
+from config import Config
+from .log import get_logger
+
+logger = get_logger('reasoning_store')
+
+# 写入存储的字段（其余字段留在对战日志中）
+REASONING_FIELDS = ('thinking', 'analysis', 'strategy', 'raw_response')
+# 每条记录的头部：(ply, 压缩数据长度)，使文件可被其他进程独立扫描
+RECORD_HEADER = struct.Struct('>II')
+
+
+class ReasoningStore:
+    """每局对战的思考文本存储
+
+    每步的思考过程压缩后追加写入磁盘文件，内存中只保留 ply -> (偏移, 长度) 索引，
+    按步数读取时再解压。无论模型输出多长，单局常驻内存只与步数成正比。
+    目录不可写时退化为在内存中保存压缩数据。
+    """
+
+    def __init__(self, battle_id: str, directory: Optional[str] = None):
+        self.battle_id = battle_id
+        self.directory = directory or Config.REASONING_DIR
+        self.path = os.path.join(self.directory, f"{battle_id}.reasoning")
+        self.index = {}          # ply -> (offset, length)
+        self.memory = None       # 磁盘不可用时的后备存储：ply -> 压缩数据
+        self.file = None
+        self.size = 0
+        self.raw_bytes = 0       # 压缩前总字节数（统计用）
+        self.lock = threading.Lock()
+
+    def _open(self):
+        if self.file is None and self.memory is None:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self.file = open(self.path, 'ab+')
+                self.size = self.file.seek(0, os.SEEK_END)
+            except OSError as e:
+                logger.warning("思考记录目录不可写（%s），改为保存在内存中: %s", self.directory, e)
+                self.memory = {}
+
+    def append(self, ply: int, move_result: Dict):
+        """追加一步的思考文本"""
+        record = {field: move_result.get(field, '') for field in REASONING_FIELDS}
+        raw = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        data = zlib.compress(raw, Config.REASONING_COMPRESS_LEVEL)
+        with self.lock:
+            self._open()
+            self.raw_bytes += len(raw)
+            if self.memory is not None:
+                self.memory[ply] = data
+                return
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(RECORD_HEADER.pack(ply, len(data)) + data)
+            self.file.flush()
+            self.index[ply] = (self.size + RECORD_HEADER.size, len(data))
+            self.size += RECORD_HEADER.size + len(data)
+
+    @classmethod
+    def load(cls, battle_id: str, directory: Optional[str] = None) -> Optional["ReasoningStore"]:
+        """扫描已有的记录文件重建索引（供其他进程只读访问），文件不存在时返回None"""
+        store = cls(battle_id, directory)
+        if not os.path.exists(store.path):
+            return None
+        store.file = open(store.path, 'rb')
+        store._scan()
+        return store
+
+    def recover(self):
+        """从检查点继续对战时调用：重建已有记录的索引，截掉崩溃时写了一半的记录，之后继续追加"""
+        with self.lock:
+            if self.file is not None or self.memory is not None or not os.path.exists(self.path):
+                return
+            try:
+                self.file = open(self.path, 'rb+')
+            except OSError as e:
+                logger.warning("无法打开已有的思考记录 %s: %s", self.path, e)
+                return
+            self._scan()
+            self.file.truncate(self.size)
+
+    def _scan(self):
+        offset = 0
+        total = self.file.seek(0, os.SEEK_END)
+        self.file.seek(0)
+        while True:
+            header = self.file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            ply, length = RECORD_HEADER.unpack(header)
+            if offset + RECORD_HEADER.size + length > total:
+                break
+            self.index[ply] = (offset + RECORD_HEADER.size, length)
+            offset += RECORD_HEADER.size + length
+            self.file.seek(offset)
+        self.size = offset
+
+    def get(self, ply: int) -> Optional[Dict]:
+        """读取第 ply 步的思考文本，不存在时返回None"""
+        with self.lock:
+            if self.memory is not None:
+                data = self.memory.get(ply)
+            elif ply in self.index and self.file is not None:
+                offset, length = self.index[ply]
+                self.file.seek(offset)
+                data = self.file.read(length)
+            else:
+                data = None
+        if data is None:
+            return None
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            stored = self.size if self.memory is None else sum(len(d) for d in self.memory.values())
+            return {
+                'plies': len(self.index) if self.memory is None else len(self.memory),
+                'raw_bytes': self.raw_bytes,
+                'stored_bytes': stored,
+                'on_disk': self.memory is None
+            }
+
+    def close(self, delete: bool = False):
+        """关闭文件；delete=True 时同时删除磁盘上的记录"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                if delete:
+                    try:
+                        os.remove(self.path)
+                    except OSError:
+                        pass
+            self.index = {}
+            self.memory = None
@@ -0,0 +1,100 @@
+import threading
+from typing import Dict, List, Optional
+from config import Config
+from .chess_game import ChessGame
+
+# 初始局面（get_board_state 格式）
+START_BOARD_STATE = ChessGame().get_board_state()
+
+
+class GameReplay:
+    """对局回放：只保存棋步，每 K 步保存一次局面快照
+
+    任意步数的局面从不晚于它的最近快照出发，用 make_move 重放至多 K-1 步得到，
+    回看一局200步的棋不需要保存或传输200份棋盘。中文记谱不在走子时生成，
+    由重放得到的 MoveRecord 在读取时计算，get_moves 计算过的部分缓存下来。
+    """
+
+    def __init__(self, initial_board: str = START_BOARD_STATE, initial_player: str = "red",
+                 snapshot_interval: Optional[int] = None):
+        self.snapshot_interval = max(1, snapshot_interval or Config.REPLAY_SNAPSHOT_INTERVAL)
+        self.moves = []        # 坐标格式棋步，如 "h2e2"
+        self.notations = []    # 已计算的中文记谱（前若干步的缓存，由 get_moves 补齐）
+        self.snapshots = {0: (initial_board, initial_player)}  # ply -> (棋盘状态, 行棋方)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_moves(cls, moves: List[str], snapshot_interval: Optional[int] = None) -> "GameReplay":
+        """从初始局面起的坐标棋步列表重建回放（多进程模式下由对战状态恢复）"""
+        replay = cls(snapshot_interval=snapshot_interval)
+        game = ChessGame()
+        for move in moves:
+            if not game.make_move(move):
+                raise ValueError(f"无法执行棋步: {move}")
+            replay.record(game)
+        return replay
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+    def record(self, game: ChessGame):
+        """在 game 走完一步后调用，记录最后一步并按间隔保存快照"""
+        last = game.move_history[-1]
+        move = game.pos_to_coord(last.from_pos) + game.pos_to_coord(last.to_pos)
+        with self.lock:
+            self.moves.append(move)
+            if len(self.moves) % self.snapshot_interval == 0:
+                self.snapshots[len(self.moves)] = (game.get_board_state(), game.current_player)
+
+    def game_at(self, ply: int, replay_from: Optional[int] = None) -> ChessGame:
+        """重建第 ply 步之后的局面（0 为初始局面）
+
+        replay_from 给定时从不晚于该步的快照出发，使第 replay_from+1 步到第 ply 步留在 move_history 中
+        （用于读取这些步的记谱）。
+        """
+        with self.lock:
+            if not 0 <= ply <= len(self.moves):
+                raise ValueError(f"步数超出范围: {ply}（共 {len(self.moves)} 步）")
+            start = ply if replay_from is None else min(ply, replay_from)
+            base = start - start % self.snapshot_interval
+            board_state, player = self.snapshots[base]
+            pending = self.moves[base:ply]
+
+        game = ChessGame()
+        game.set_board_state(board_state, player)
+        for move in pending:
+            if not game.make_move(move):
+                raise RuntimeError(f"回放失败，第 {base + len(game.move_history) + 1} 步无法执行: {move}")
+        return game
+
+    def position(self, ply: Optional[int] = None) -> Dict:
+        """第 ply 步之后的局面，默认最新一步"""
+        if ply is None:
+            ply = len(self.moves)
+        game = self.game_at(ply, max(0, ply - 1))
+        return {
+            'ply': ply,
+            'total_plies': len(self.moves),
+            'board_state': game.get_board_state(),
+            'current_player': game.current_player,
+            'last_move': self.moves[ply - 1] if ply > 0 else None,
+            'last_notation': game.move_history[-1].notation if ply > 0 else None
+        }
+
+    def get_moves(self) -> List[Dict]:
+        """全部棋步（不含局面），供前端绘制可拖动的进度条
+
+        尚未计算记谱的棋步从最近的快照重放得到，结果缓存，之后只补算新增的棋步。
+        """
+        with self.lock:
+            computed, total = len(self.notations), len(self.moves)
+        if computed < total:
+            game = self.game_at(total, computed)
+            history = game.move_history
+            notations = [record.notation for record in history[len(history) - (total - computed):]]
+            with self.lock:
+                if len(self.notations) == computed:
+                    self.notations.extend(notations)
+        with self.lock:
+            return [{'ply': i + 1, 'move': move, 'notation': notation}
+                    for i, (move, notation) in enumerate(zip(self.moves, self.notations))]
@@ -0,0 +1,239 @@
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from .log import get_logger
+
+logger = get_logger('request_scheduler')
+
+# 当前请求的准入时刻（单元素列表），由调度器在执行请求前设置
+_admission = contextvars.ContextVar('request_admission', default=None)
+
+
+def mark_admitted():
+    """请求通过限流排队、即将发出时调用：延迟从此刻开始计算，排队等待不计入服务商延迟"""
+    admitted = _admission.get()
+    if admitted is not None:
+        admitted[0] = time.monotonic()
+
+
+class LatencyTracker:
+    """按 (provider, model) 统计滚动窗口内的请求延迟"""
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, key: Tuple[str, str], seconds: float):
+        """记录一次请求耗时（秒）"""
+        with self.lock:
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.window)
+            self.samples[key].append(seconds)
+
+    def count(self, key: Tuple[str, str]) -> int:
+        """窗口内的样本数"""
+        with self.lock:
+            return len(self.samples.get(key, ()))
+
+    def percentile(self, key: Tuple[str, str], q: float) -> Optional[float]:
+        """窗口内延迟的分位数（最近秩法），无样本时返回None"""
+        with self.lock:
+            values = sorted(self.samples.get(key, ()))
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))
+        return values[index]
+
+    def snapshot(self) -> Dict:
+        """各 (provider, model) 的 p50/p95 与样本数"""
+        with self.lock:
+            keys = list(self.samples.keys())
+        return {
+            f"{provider}/{model}": {
+                'p50': self.percentile((provider, model), 0.5),
+                'p95': self.percentile((provider, model), 0.95),
+                'samples': self.count((provider, model))
+            }
+            for provider, model in keys
+        }
+
+
+class HedgedRequestScheduler:
+    """对冲请求调度器
+
+    主请求耗时超过该 (provider, model) 观测到的 p95 时，再发出一个对冲请求
+    （相同端点或配置的备用端点），采用先返回合法结果的一方，并取消另一方。
+    请求函数接收一个 threading.Event，被取消时应尽快停止（流式请求会中途关闭连接）。
+    请求函数出错时通常返回空文本而不抛出，因此只有返回了可用结果的请求计入延迟统计，
+    耗时从 mark_admitted() 标记的限流准入时刻算起。
+    """
+
+    def __init__(self, tracker: Optional[LatencyTracker] = None, max_workers: int = 16):
+        self.tracker = tracker or LatencyTracker(Config.LATENCY_WINDOW)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-request')
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0,       # 经调度器发出的主请求数
+            'hedges': 0,         # 发出的对冲请求数
+            'hedge_wins': 0,     # 对冲请求胜出次数
+            'primary_wins': 0,   # 主请求胜出次数
+            'cancelled': 0,      # 被取消的落后请求数
+            'budget_denied': 0,  # 因成本上限未能对冲的次数
+        }
+
+    def hedge_delay(self, key: Tuple[str, str]) -> float:
+        """对冲前的等待时间：样本充足时取 p95，否则取默认值"""
+        p95 = self.tracker.percentile(key, 0.95)
+        if p95 is None or self.tracker.count(key) < Config.HEDGE_MIN_SAMPLES:
+            return Config.HEDGE_DEFAULT_DELAY
+        return max(Config.HEDGE_MIN_DELAY, p95)
+
+    def _take_hedge_budget(self) -> bool:
+        """按 HEDGE_MAX_RATIO 限制对冲请求占比"""
+        with self.lock:
+            if self.stats['hedges'] + 1 > Config.HEDGE_MAX_RATIO * self.stats['requests']:
+                self.stats['budget_denied'] += 1
+                return False
+            self.stats['hedges'] += 1
+            return True
+
+    def run(self, key: Tuple[str, str], primary: Callable[[threading.Event], str],
+            hedge: Optional[Callable[[threading.Event], str]] = None,
+            hedge_key: Optional[Tuple[str, str]] = None,
+            accept: Optional[Callable[[str], bool]] = None) -> Tuple[str, Dict]:
+        """执行请求，必要时对冲
+
+        Args:
+            key: 主请求的 (provider, model)
+            primary: 主请求函数
+            hedge: 对冲请求函数，为None时不对冲，直接在当前线程执行主请求
+            hedge_key: 对冲请求的 (provider, model)，默认与主请求相同
+            accept: 判断结果是否可用（如包含合法棋步）
+
+        Returns:
+            Tuple: (响应文本, {'hedged': bool, 'winner': 'primary'|'hedge'})
+        """
+        accept = accept or bool
+        if hedge is None:
+            result, seconds = self._timed(primary, threading.Event())
+            if result and accept(result):
+                self.tracker.record(key, seconds)
+            return result, {'hedged': False, 'winner': 'primary'}
+
+        with self.lock:
+            self.stats['requests'] += 1
+
+        keys = {'primary': key, 'hedge': hedge_key or key}
+        cancel_events = {'primary': threading.Event()}
+        # 在线程池中沿用调用方的日志上下文（对战ID等）
+        futures = {self.submit(primary, cancel_events['primary']): 'primary'}
+
+        hedged = False
+        done, _ = wait(futures, timeout=self.hedge_delay(key))
+        if not done and self._take_hedge_budget():
+            logger.info("%s 请求超过 p95 延迟，发出对冲请求", key[1])
+            hedged = True
+            cancel_events['hedge'] = threading.Event()
+            futures[self.submit(hedge, cancel_events['hedge'])] = 'hedge'
+
+        fallback, fallback_winner = "", 'primary'
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    logger.warning("%s 请求异常: %s", name, e)
+                    result = ""
+
+                if result and accept(result):
+                    self.tracker.record(keys[name], seconds)
+                    self._cancel_losers(pending, futures, cancel_events)
+                    with self.lock:
+                        self.stats['hedge_wins' if name == 'hedge' else 'primary_wins'] += 1
+                    return result, {'hedged': hedged, 'winner': name}
+                if result and not fallback:
+                    fallback, fallback_winner = result, name
+
+        return fallback, {'hedged': hedged, 'winner': fallback_winner}
+
+    def run_parallel(self, key: Tuple[str, str], requests: List[Callable[[threading.Event], str]],
+                     enough: Optional[Callable[[List[Tuple[int, str]]], bool]] = None,
+                     accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[int, str]]:
+        """并发执行多个同类请求（多采样），按完成顺序返回 [(序号, 响应文本)]
+
+        每完成一个请求调用一次 enough(已完成的结果)，返回True时取消其余请求并立即返回。
+        只有返回了可用结果（accept 为真）的请求计入延迟统计。
+        """
+        accept = accept or bool
+        cancel_events = [threading.Event() for _ in requests]
+        futures = {self.submit(request, cancel_events[index]): index
+                   for index, request in enumerate(requests)}
+
+        results = []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    logger.warning("第 %d 个采样请求异常: %s", index + 1, e)
+                    result = ""
+                if result and accept(result):
+                    self.tracker.record(key, seconds)
+                results.append((index, result))
+            if pending and enough is not None and enough(results):
+                for future in pending:
+                    cancel_events[futures[future]].set()
+                    future.cancel()
+                with self.lock:
+                    self.stats['cancelled'] += len(pending)
+                break
+        return results
+
+    def submit(self, request: Callable[[threading.Event], str], cancel_event: threading.Event):
+        """在线程池中执行请求，沿用调用方的上下文（日志字段、本步截止时刻）"""
+        return self.executor.submit(contextvars.copy_context().run, self._timed, request, cancel_event)
+
+    def _timed(self, request: Callable[[threading.Event], str], cancel_event: threading.Event) -> Tuple[str, float]:
+        """执行请求，返回 (响应文本, 从限流准入到返回的秒数)"""
+        admitted = [time.monotonic()]
+        token = _admission.set(admitted)
+        try:
+            result = request(cancel_event)
+        finally:
+            _admission.reset(token)
+        return result, time.monotonic() - admitted[0]
+
+    def _cancel_losers(self, pending, futures: Dict, cancel_events: Dict):
+        """取消仍在进行的请求
+
+        被取消请求的耗时只是延迟下界，计入统计会拉低 p95、使对冲越来越早，因此不记录。
+        """
+        for future in pending:
+            name = futures[future]
+            cancel_events[name].set()
+            future.cancel()
+            with self.lock:
+                self.stats['cancelled'] += 1
+
+    def get_stats(self) -> Dict:
+        """获取调度统计与各端点延迟分位数"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats['latency'] = self.tracker.snapshot()
+        return stats
+
+
+# 进程内共享的调度器，各对战的玩家共用延迟统计
+request_scheduler = HedgedRequestScheduler(max_workers=Config.HEDGE_MAX_WORKERS)
@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+from config import Config
+from .message_queue import PreEncoded
+
+
+def battle_room(battle_id: str) -> str:
+    """实时房间：收到全部事件"""
+    return f"battle:{battle_id}"
+
+
+def overflow_room(battle_id: str) -> str:
+    """溢出房间：实时房间满员后加入，思考内容按间隔合并推送"""
+    return f"battle:{battle_id}:overflow"
+
+
+def battle_snapshot(battle, thinking_player: Optional[str] = None, thinking: str = "") -> Dict:
+    """观众加入时的局面快照"""
+    game = battle.game
+    return {
+        'battle_id': battle.battle_id,
+        'status': battle.status,
+        'red_player': battle.red_player.display_name,
+        'black_player': battle.black_player.display_name,
+        'board_state': game.get_board_state(),
+        'current_player': game.current_player,
+        'move_count': len(game.move_history),
+        'last_move': battle.replay.moves[-1] if len(battle.replay) else None,
+        'recent_moves': battle.battle_log[-Config.SPECTATOR_RECENT_MOVES:],
+        'thinking': {'player': thinking_player, 'content': thinking},
+        'clock': battle.clock.to_dict(),
+        'start_time': battle.start_time
+    }
+
+
+class ChunkBuffer:
+    """只保留末尾 limit 个字符的文本缓冲
+
+    追加时只保存片段引用，不复制已有内容；超出上限时整段丢弃最早的片段，
+    读取时才拼接并截取末尾。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.chunks = deque()
+        self.size = 0
+
+    def append(self, text: str):
+        if not text:
+            return
+        self.chunks.append(text)
+        self.size += len(text)
+        while self.size - len(self.chunks[0]) >= self.limit:
+            self.size -= len(self.chunks.popleft())
+
+    def clear(self):
+        self.chunks.clear()
+        self.size = 0
+
+    def take(self) -> str:
+        """取出全部内容并清空"""
+        text = self.text()
+        self.clear()
+        return text
+
+    def text(self) -> str:
+        return "".join(self.chunks)[-self.limit:]
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+
+class BattleChannel:
+    """单局对战的推送通道
+
+    所有事件只发往本局的房间，每个事件序列化一次（PreEncoded），
+    实时房间和溢出房间共用同一份负载。同时维护观众加入时发送的局面快照
+    （棋盘、最近棋步、当前思考内容）：思考内容只追加到有上限的缓冲，
+    快照在有观众加入时才生成，状态未变化的加入者共用缓存的序列化结果。
+    """
+
+    def __init__(self, battle, emitter, on_update: Optional[Callable[[], None]] = None):
+        self.battle = battle
+        self.emitter = emitter
+        self.on_update = on_update  # 走子、终局时调用，多进程模式下用于同步到共享登记表
+        self.room = battle_room(battle.battle_id)
+        self.overflow = overflow_room(battle.battle_id)
+        self.thinking_player = None
+        self.thinking = ChunkBuffer(Config.SPECTATOR_THINKING_BUFFER)         # 当前一步的思考内容（快照用）
+        self.overflow_pending = ChunkBuffer(Config.SPECTATOR_THINKING_BUFFER)  # 尚未推送给溢出房间的思考内容
+        self.last_flush = time.monotonic()
+        self.version = 0  # 快照内容的版本：每个事件加一，快照缓存按版本判断是否过期
+        self.cached_snapshot = (None, None)  # (版本, PreEncoded)
+        self.lock = threading.Lock()
+
+    def emit(self, event: str, data=None, **kwargs):
+        payload = PreEncoded(data)
+        self.emitter.emit(event, payload, to=self.room)
+
+        overflow_payloads = []
+        updated = False
+        with self.lock:
+            self.version += 1
+            if event == 'thinking':
+                self.thinking_player = None
+                self.thinking.clear()
+            elif event == 'thinking_stream':
+                content = data.get('content', '')
+                self.thinking_player = data.get('player')
+                self.thinking.append(content)
+                self.overflow_pending.append(content)
+                # 溢出房间的思考内容合并后按间隔推送
+                if data.get('is_complete') or time.monotonic() - self.last_flush >= Config.SPECTATOR_OVERFLOW_INTERVAL:
+                    overflow_payloads.append(self._take_overflow(bool(data.get('is_complete'))))
+            else:
+                if event == 'move_made' and self.overflow_pending:
+                    overflow_payloads.append(self._take_overflow(True))
+                if event == 'move_made':
+                    self.thinking_player = None
+                    self.thinking.clear()
+                updated = event in ('move_made', 'game_over', 'game_error')
+
+        for overflow_payload in overflow_payloads:
+            self.emitter.emit('thinking_stream', overflow_payload, to=self.overflow)
+        if event != 'thinking_stream':
+            self.emitter.emit(event, payload, to=self.overflow)
+        if updated and self.on_update:
+            self.on_update()
+
+    def _take_overflow(self, is_complete: bool) -> PreEncoded:
+        """取出累积的思考内容，合并为一条 thinking_stream（需持有锁）
+
+        积压超过缓冲上限时只推送末尾部分。
+        """
+        payload = PreEncoded({
+            'player': self.thinking_player,
+            'content': self.overflow_pending.take(),
+            'is_complete': is_complete
+        })
+        self.last_flush = time.monotonic()
+        return payload
+
+    def sleep(self, seconds: float):
+        self.emitter.sleep(seconds)
+
+    def snapshot_data(self) -> Dict:
+        with self.lock:
+            thinking_player, thinking = self.thinking_player, self.thinking.text()
+        return battle_snapshot(self.battle, thinking_player, thinking)
+
+    def snapshot(self) -> PreEncoded:
+        """序列化后的快照，在观众加入时生成；状态未变化时所有加入者共用同一份"""
+        with self.lock:
+            version, cached = self.cached_snapshot
+            if version == self.version:
+                return cached
+            version = self.version
+        cached = PreEncoded(self.snapshot_data())
+        with self.lock:
+            self.cached_snapshot = (version, cached)
+        return cached
+
+
+class SpectatorRegistry:
+    """Web 进程内的观众登记：按对战统计实时房间人数，超出上限的观众进入溢出房间
+
+    实时房间有人离开时，把最早进入溢出房间的观众提升到实时房间。
+    多进程部署时每个Web进程各自计数，上限按进程生效。
+    """
+
+    def __init__(self, max_viewers: Optional[int] = None):
+        self.max_viewers = Config.SPECTATOR_MAX_VIEWERS if max_viewers is None else max_viewers
+        self.viewers = {}  # battle_id -> {'live': set(sid), 'overflow': [sid, ...]}
+        self.watching = {}  # sid -> battle_id
+        self.lock = threading.Lock()
+
+    def join(self, sid: str, battle_id: str) -> str:
+        """登记观众，返回 'live' 或 'overflow'；调用方负责实际加入对应房间"""
+        with self.lock:
+            rooms = self.viewers.setdefault(battle_id, {'live': set(), 'overflow': []})
+            self.watching[sid] = battle_id
+            if len(rooms['live']) < self.max_viewers:
+                rooms['live'].add(sid)
+                return 'live'
+            rooms['overflow'].append(sid)
+            return 'overflow'
+
+    def leave(self, sid: str) -> Optional[Dict]:
+        """注销观众，返回 {'battle_id', 'mode', 'promoted'}，promoted 为被提升到实时房间的观众"""
+        with self.lock:
+            battle_id = self.watching.pop(sid, None)
+            if battle_id is None:
+                return None
+            rooms = self.viewers[battle_id]
+            promoted = None
+            if sid in rooms['live']:
+                mode = 'live'
+                rooms['live'].discard(sid)
+                if rooms['overflow']:
+                    promoted = rooms['overflow'].pop(0)
+                    rooms['live'].add(promoted)
+            else:
+                mode = 'overflow'
+                rooms['overflow'].remove(sid)
+            if not rooms['live'] and not rooms['overflow']:
+                del self.viewers[battle_id]
+            return {'battle_id': battle_id, 'mode': mode, 'promoted': promoted}
+
+    def counts(self, battle_id: str) -> Dict:
+        with self.lock:
+            rooms = self.viewers.get(battle_id, {'live': (), 'overflow': ()})
+            return {'live': len(rooms['live']), 'overflow': len(rooms['overflow'])}
+
+    def get_stats(self) -> Dict:
+        """观众总数（供 /metrics，不按对战拆分以免标签过多）"""
+        with self.lock:
+            return {
+                'battles': len(self.viewers),
+                'live': sum(len(rooms['live']) for rooms in self.viewers.values()),
+                'overflow': sum(len(rooms['overflow']) for rooms in self.viewers.values())
+            }
@@ -0,0 +1,109 @@
+import json
+from typing import Iterable, Iterator, List, Optional
+
+# orjson 为可选依赖，安装后用于解析流式数据块；两者都直接接受 UTF-8 字节
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    _decoder = json.JSONDecoder()
+
+    def json_loads(data: bytes):
+        # json.loads 对字节每次都要探测编码，流里的数据块固定为 UTF-8，直接解码更快
+        return _decoder.decode(data.decode('utf-8'))
+    JSON_BACKEND = 'json'
+
+DONE = b'[DONE]'  # OpenAI 兼容接口的流结束标记
+
+
+class SSEParser:
+    """增量 SSE 解析器
+
+    直接处理网络读到的字节块，返回每个事件的 data（字节，未解码，交给 json_loads）。
+    行可以跨块，支持 \\n、\\r\\n、\\r 三种换行，多行 data 以 \\n 合并为一个事件，
+    注释行（以冒号开头，如保活心跳）以及 event/id/retry 字段忽略——模型接口的流只用 data。
+    """
+
+    def __init__(self):
+        self.buffer = b""  # 尚未处理的内容
+        self.data = []     # 当前事件已读到的 data 行
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """送入一块字节，返回其中完成的事件的 data"""
+        if not chunk:
+            return []
+        data = self.buffer + chunk if self.buffer else chunk
+        if b"\r" in data:
+            return self.feed_lines(data)
+
+        # 只用 \n 换行时按空行切出完整事件，剩余部分留到下一块
+        blocks = data.split(b"\n\n")
+        self.buffer = blocks.pop()
+        if not blocks:
+            return []
+        end = len(data) - len(self.buffer)
+        if (not self.data and data.startswith(b"data: ") and data.count(b"\n", 0, end) == 2 * len(blocks)
+                and data.count(b"\ndata: ", 0, end) == len(blocks) - 1):
+            # 常见情况：这一块里每个事件都是单行 data，整体校验后直接切出，不再逐行处理
+            return [block[6:] for block in blocks]
+
+        events = []
+        for block in blocks:
+            for line in block.split(b"\n"):
+                self.process_line(line, events)
+            self.process_line(b"", events)
+        return events
+
+    def feed_lines(self, data: bytes) -> List[bytes]:
+        """逐行处理，支持 \\r\\n 和 \\r 换行"""
+        events = []
+        lines = data.splitlines(keepends=True)
+        last = lines[-1]
+        # 最后一行没有换行符，或以 \r 结尾（可能与下一块开头的 \n 组成 \r\n），留到下一块
+        if last[-1:] == b"\r" or last[-1:] != b"\n":
+            self.buffer = lines.pop()
+        else:
+            self.buffer = b""
+        for line in lines:
+            self.process_line(line.rstrip(b"\r\n"), events)
+        return events
+
+    def flush(self) -> List[bytes]:
+        """流结束时处理剩余内容（服务端省略了最后的空行时也能取到最后一个事件）"""
+        events = []
+        if self.buffer:
+            for line in self.buffer.splitlines():
+                self.process_line(line, events)
+            self.buffer = b""
+        self.process_line(b"", events)
+        return events
+
+    def process_line(self, line: bytes, events: List[bytes]):
+        if not line:
+            # 空行：分发当前事件
+            if self.data:
+                events.append(self.data[0] if len(self.data) == 1 else b"\n".join(self.data))
+                self.data = []
+            return
+        if line[:1] == b":":
+            return
+        field, _, value = line.partition(b":")
+        if field == b"data":
+            self.data.append(value[1:] if value[:1] == b" " else value)
+
+
+def iter_events(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """把字节块序列解析为事件 data 序列"""
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.flush()
+
+
+def parse_json(data: bytes) -> Optional[dict]:
+    """解析事件数据，不是合法JSON时返回None"""
+    try:
+        return json_loads(data)
+    except ValueError:
+        return None
@@ -0,0 +1,139 @@
+"""多进程部署入口
+
+    python serve.py [--battle-workers 2] [--web-workers 2] [--port 5003] [--message-queue URL] [--nginx]
+
+对战在独立的工作进程中运行，Socket.IO 事件经消息队列广播，多个 Web 前端进程
+（端口从 --port 起依次递增）共享同一批对战。未指定消息队列时在本机启动一个
+Unix Socket 代理，无需Redis；多机部署请使用 redis:// 。
+
+Socket.IO 的长轮询要求同一客户端的请求落在同一进程上，前面需要一个粘性会话的
+负载均衡器，--nginx 输出一份可用的 nginx 配置。
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+from urllib.parse import urlparse
+
+DEFAULT_UNIX_QUEUE = 'unix:///tmp/aichess-mq.sock'
+
+NGINX_TEMPLATE = """# 粘性会话：按客户端IP哈希，保证同一浏览器的长轮询请求落在同一Web进程
+upstream aichess {{
+    ip_hash;
+{servers}
+}}
+
+server {{
+    listen 80;
+
+    location / {{
+        proxy_pass http://aichess;
+        proxy_set_header Host $host;
+    }}
+
+    location /socket.io {{
+        proxy_pass http://aichess/socket.io;
+        proxy_http_version 1.1;
+        proxy_buffering off;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "Upgrade";
+        proxy_read_timeout 3600s;
+    }}
+}}
+"""
+
+
+def nginx_config(ports) -> str:
+    return NGINX_TEMPLATE.format(servers="\n".join(f"    server 127.0.0.1:{port};" for port in ports))
+
+
+def battle_worker(worker_id: int, commands, registry, replies):
+    from models.battle_worker import worker_main
+    worker_main(worker_id, commands, registry, replies)
+
+
+def web_worker(port: int, commands, registry, lock, replies):
+    import app as web
+    from models.battle_worker import WorkerPool
+    web.worker_pool = WorkerPool(commands, registry, lock, replies, sleep=web.socketio.sleep)
+    web.start_background_services()
+    web.logger.info("Web前端已启动: http://0.0.0.0:%d", port)
+    web.socketio.run(web.app, debug=False, host='0.0.0.0', port=port, allow_unsafe_werkzeug=True)
+
+
+def main():
+    from config import Config
+    parser = argparse.ArgumentParser(description='AI象棋对战系统多进程部署')
+    parser.add_argument('--battle-workers', type=int, default=Config.BATTLE_WORKERS)
+    parser.add_argument('--web-workers', type=int, default=Config.WEB_WORKERS)
+    parser.add_argument('--port', type=int, default=Config.WEB_BASE_PORT, help='第一个Web进程的端口')
+    parser.add_argument('--message-queue', default=Config.MESSAGE_QUEUE or DEFAULT_UNIX_QUEUE,
+                        help='redis://host:6379/0、amqp://... 或 unix:///path.sock')
+    parser.add_argument('--nginx', action='store_true', help='输出粘性会话的nginx配置后退出')
+    args = parser.parse_args()
+
+    ports = [args.port + i for i in range(args.web_workers)]
+    if args.nginx:
+        print(nginx_config(ports))
+        return
+
+    # 子进程通过环境变量读取消息队列地址（spawn 时重新导入 config）
+    os.environ['MESSAGE_QUEUE'] = args.message_queue
+    from models.log import get_logger
+    from models.message_queue import UnixSocketBroker, unix_socket_path
+    logger = get_logger('serve')
+
+    broker = None
+    if urlparse(args.message_queue).scheme == 'unix':
+        broker = UnixSocketBroker(unix_socket_path(args.message_queue))
+        broker.start()
+
+    ctx = multiprocessing.get_context('spawn')
+    manager = ctx.Manager()
+    registry = manager.dict()
+    replies = manager.dict()  # 工作进程对按需查询（快照、完整棋步）的回复
+    lock = manager.Lock()
+    commands = [ctx.Queue() for _ in range(args.battle_workers)]
+
+    processes = [ctx.Process(target=battle_worker, args=(i, commands[i], registry, replies), name=f'battle-worker-{i}')
+                 for i in range(args.battle_workers)]
+    processes += [ctx.Process(target=web_worker, args=(port, commands, registry, lock, replies), name=f'web-{port}')
+                  for port in ports]
+    for process in processes:
+        process.start()
+
+    # 上次退出或崩溃时未结束的对战，从检查点继续
+    from models.battle_worker import WorkerPool
+    from models.checkpoint import startup_resume_ids
+    pool = WorkerPool(commands, registry, lock, replies)
+    for battle_id in startup_resume_ids():
+        pool.resume_battle(battle_id)
+        logger.info("从检查点继续对战 %s", battle_id)
+
+    logger.info("已启动 %d 个对战进程、%d 个Web进程（端口 %s），消息队列: %s",
+                args.battle_workers, args.web_workers, ", ".join(map(str, ports)), args.message_queue)
+    if len(ports) > 1:
+        logger.info("多个Web进程前需要粘性会话的负载均衡器，运行 python serve.py --nginx 获取配置示例")
+
+    def stop(signum, frame):
+        for queue in commands:
+            queue.put(('shutdown',))
+        for process in processes:
+            process.terminate()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop(None, None)
+    finally:
+        if broker:
+            broker.stop()
+        manager.shutdown()
+
+
+if __name__ == '__main__':
+    main()
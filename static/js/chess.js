@@ -1,5 +1,15 @@
+// 调试日志：模板按 Config.DEBUG 设置 window.CHESS_DEBUG，关闭时不输出
+const DEBUG = Boolean(window.CHESS_DEBUG);
+
+function debugLog(...args) {
+    if (DEBUG) {
+        console.log(...args);
+    }
+}
+
 // 全局变量
 let socket;
+let watchingBattleId = null;  // 当前观看的对战
 let gameState = {
     isPlaying: false,
     currentPlayer: 'red',
@@ -114,93 +124,179 @@ function streamThinkingProcess(player, message, speed = 50) {
     }
 }
 
-// 实时流式输出思考过程（用于Socket.IO流式数据）
-let currentStreamingElements = {};
+// 思考过程中最多直接显示的字符数，更早的内容折叠到“展开”按钮后
+const THINKING_VISIBLE_CHARS = 6000;
 
-function streamThinkingProcessRealtime(player, content) {
-    const thinkingBoxId = `${player}-thinking-process`;
-    const thinkingBox = document.getElementById(thinkingBoxId);
+// 思考过程流式渲染器（用于Socket.IO流式数据）
+// 同一动画帧内收到的片段合并为一个文本节点追加，不再重写整段文本；
+// 内容过长时把开头部分移出DOM，点击“展开”再一次性插回
+class ThinkingStreamRenderer {
+    constructor(maxVisibleChars = THINKING_VISIBLE_CHARS) {
+        this.maxVisibleChars = maxVisibleChars;
+        this.streams = {};  // player -> 当前一轮思考的渲染状态
+        this.frameRequested = false;
+    }
     
-    console.log(`streamThinkingProcessRealtime调用: player=${player}, thinkingBoxId=${thinkingBoxId}`);
-    console.log('thinkingBox元素:', thinkingBox);
+    // 开始新一轮思考：清空思考框
+    start(player) {
+        const box = document.getElementById(`${player}-thinking-process`);
+        if (!box) {
+            console.error(`找不到思考区元素: ${player}-thinking-process`);
+            return null;
+        }
+        box.innerHTML = '';
+        
+        const toggle = document.createElement('button');
+        toggle.className = 'thinking-expand';
+        toggle.style.display = 'none';
+        toggle.addEventListener('click', () => this.expand(player));
+        
+        const container = document.createElement('div');
+        container.className = 'thinking-content-stream';
+        
+        box.appendChild(toggle);
+        box.appendChild(container);
+        
+        const stream = {
+            box: box,
+            toggle: toggle,
+            container: container,
+            pending: [],        // 等待下一帧写入的片段
+            visibleChars: 0,
+            hidden: [],         // 折叠的开头部分
+            hiddenChars: 0,
+            expanded: false,
+            complete: false
+        };
+        this.streams[player] = stream;
+        return stream;
+    }
     
-    if (!thinkingBox) {
-        console.error(`找不到思考区元素: ${thinkingBoxId}`);
-        return;
+    append(player, content) {
+        let stream = this.streams[player];
+        if (!stream || stream.complete) {
+            stream = this.start(player);
+        }
+        if (!stream || !content) {
+            return;
+        }
+        stream.pending.push(content);
+        this.scheduleFrame();
     }
     
-    // 如果是第一次为该玩家创建流式元素
-    if (!currentStreamingElements[player]) {
-        console.log(`为${player}创建新的流式元素`);
-        
-        // 如果是第一条消息，清空默认文本
-        if (thinkingBox.innerHTML.includes('等待') || thinkingBox.innerHTML.includes('开始思考')) {
-            thinkingBox.innerHTML = '';
-            console.log(`清空${player}的默认文本`);
+    // 本轮思考结束；尚未写入的片段仍在下一帧写入，下一次 append 开始新一轮
+    complete(player) {
+        const stream = this.streams[player];
+        if (stream) {
+            stream.complete = true;
         }
-        
-        // 创建思考项
-        const thinkingItem = document.createElement('div');
-        thinkingItem.className = `thinking-item ${player === 'red' ? 'red-thinking' : 'black-thinking'}`;
-        
-        // 添加时间戳
-        const timestamp = document.createElement('div');
-        timestamp.className = 'thinking-timestamp';
-        timestamp.textContent = new Date().toLocaleTimeString();
-        
-        // 添加思考内容容器
-        const thinkingText = document.createElement('div');
-        thinkingText.className = 'thinking-text';
-        thinkingText.id = `${player}-current-stream`;
-        
-        thinkingItem.appendChild(timestamp);
-        thinkingItem.appendChild(thinkingText);
-        thinkingBox.appendChild(thinkingItem);
-        
-        // 保存当前流式元素的引用
-        currentStreamingElements[player] = thinkingText;
-        console.log(`${player}的流式元素已创建并保存`);
     }
     
-    // 追加内容到当前流式元素
-    const streamElement = currentStreamingElements[player];
-    if (streamElement) {
-        streamElement.textContent += content;
-        thinkingBox.scrollTop = thinkingBox.scrollHeight;
-        console.log(`成功向${player}的思考区添加内容: "${content.substring(0, 20)}..."`);
-    } else {
-        console.error(`${player}的流式元素不存在`);
+    // 用快照内容替换思考框（中途加入或重连）
+    reset(player, content) {
+        this.start(player);
+        this.append(player, content);
     }
-}
-
-// 清理流式输出状态
-function clearStreamingState(player) {
-    if (currentStreamingElements[player]) {
-        delete currentStreamingElements[player];
+    
+    scheduleFrame() {
+        if (!this.frameRequested) {
+            this.frameRequested = true;
+            requestAnimationFrame(() => this.flush());
+        }
+    }
+    
+    flush() {
+        this.frameRequested = false;
+        for (const stream of Object.values(this.streams)) {
+            if (stream.pending.length === 0) {
+                continue;
+            }
+            const box = stream.box;
+            // 写入前读取滚动位置（此时布局是干净的）；用户向上翻看时不强制滚到底部
+            const atBottom = box.scrollHeight - box.scrollTop - box.clientHeight < 30;
+            
+            const text = stream.pending.join('');
+            stream.pending = [];
+            stream.container.appendChild(document.createTextNode(text));
+            stream.visibleChars += text.length;
+            
+            if (!stream.expanded) {
+                this.collapse(stream);
+            }
+            if (atBottom) {
+                box.scrollTop = box.scrollHeight;
+            }
+        }
+    }
+    
+    // 把超出显示上限的开头部分移出DOM
+    collapse(stream) {
+        const container = stream.container;
+        while (stream.visibleChars > this.maxVisibleChars && container.firstChild) {
+            const node = container.firstChild;
+            const excess = stream.visibleChars - this.maxVisibleChars;
+            if (node.data.length > excess) {
+                node.splitText(excess);
+            }
+            stream.hidden.push(node.data);
+            stream.hiddenChars += node.data.length;
+            stream.visibleChars -= node.data.length;
+            container.removeChild(node);
+        }
+        if (stream.hiddenChars > 0) {
+            stream.toggle.textContent = `展开全部（已折叠前 ${stream.hiddenChars} 字）`;
+            stream.toggle.style.display = '';
+        }
+    }
+    
+    expand(player) {
+        const stream = this.streams[player];
+        if (!stream || stream.hidden.length === 0) {
+            return;
+        }
+        const container = stream.container;
+        container.insertBefore(document.createTextNode(stream.hidden.join('')), container.firstChild);
+        stream.visibleChars += stream.hiddenChars;
+        stream.hidden = [];
+        stream.hiddenChars = 0;
+        stream.expanded = true;
+        stream.toggle.style.display = 'none';
     }
 }
 
+const thinkingRenderer = new ThinkingStreamRenderer();
+
 // 中国象棋棋盘渲染器
 class ChessBoardRenderer {
-    constructor(canvasId) {
+    // options.scale 用于缩略图等小尺寸棋盘；options.animationMs 为走子动画时长（0 关闭动画）
+    constructor(canvasId, options = {}) {
         this.canvas = document.getElementById(canvasId);
         this.ctx = this.canvas.getContext('2d');
+        this.scale = options.scale || 1;
+        this.animationMs = options.animationMs === undefined ? 180 : options.animationMs;
         
         // 增大的中国象棋棋盘尺寸比例 (9:10)
-        this.boardWidth = 520;   // 9列
-        this.boardHeight = 580;  // 10行
-        this.margin = 40;
+        this.boardWidth = 520 * this.scale;   // 9列
+        this.boardHeight = 580 * this.scale;  // 10行
+        this.margin = 40 * this.scale;
         
         this.canvas.width = this.boardWidth + this.margin * 2;
         this.canvas.height = this.boardHeight + this.margin * 2;
         
         this.cellWidth = this.boardWidth / 8;   // 8个间隔，9条线
         this.cellHeight = this.boardHeight / 9; // 9个间隔，10条线
+        this.pieceRadius = Math.min(this.cellWidth, this.cellHeight) * 0.4;
         
         this.pieces = {};
         this.lastMove = null;
+        this.position = new Array(90).fill('.');  // 画布上当前显示的局面，按 row * 9 + col 索引
+        this.highlighted = [];                     // 当前高亮的格子索引
+        this.animation = null;
         
         this.initializePieces();
+        // 静态图层：棋盘背景和棋子图像只绘制一次，之后只做区域拷贝
+        this.background = this.renderBackground();
+        this.sprites = this.renderSprites();
         this.drawBoard();
         this.showInitialPosition();
     }
@@ -213,99 +309,110 @@ class ChessBoardRenderer {
         };
     }
     
-    drawBoard() {
-        // 清空画布
-        this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+    createLayer(width, height) {
+        const layer = document.createElement('canvas');
+        layer.width = Math.ceil(width);
+        layer.height = Math.ceil(height);
+        return layer;
+    }
+    
+    // 预先绘制棋盘背景（网格、九宫、楚河汉界、兵炮位标记）
+    renderBackground() {
+        const layer = this.createLayer(this.canvas.width, this.canvas.height);
+        const ctx = layer.getContext('2d');
         
         // 绘制传统木质背景
-        this.ctx.fillStyle = '#F5DEB3';
-        this.ctx.fillRect(0, 0, this.canvas.width, this.canvas.height);
+        ctx.fillStyle = '#F5DEB3';
+        ctx.fillRect(0, 0, layer.width, layer.height);
         
         // 绘制棋盘边框
-        this.ctx.strokeStyle = '#8B4513';
-        this.ctx.lineWidth = 3;
-        this.ctx.strokeRect(this.margin - 2, this.margin - 2, this.boardWidth + 4, this.boardHeight + 4);
+        ctx.strokeStyle = '#8B4513';
+        ctx.lineWidth = 3 * this.scale;
+        ctx.strokeRect(this.margin - 2 * this.scale, this.margin - 2 * this.scale,
+                       this.boardWidth + 4 * this.scale, this.boardHeight + 4 * this.scale);
         
         // 设置线条样式
-        this.ctx.strokeStyle = '#000000';
-        this.ctx.lineWidth = 1.5;
+        ctx.strokeStyle = '#000000';
+        ctx.lineWidth = 1.5 * this.scale;
         
         // 绘制横线（10条）
         for (let i = 0; i <= 9; i++) {
-            this.ctx.beginPath();
-            this.ctx.moveTo(this.margin, this.margin + i * this.cellHeight);
-            this.ctx.lineTo(this.margin + this.boardWidth, this.margin + i * this.cellHeight);
-            this.ctx.stroke();
+            ctx.beginPath();
+            ctx.moveTo(this.margin, this.margin + i * this.cellHeight);
+            ctx.lineTo(this.margin + this.boardWidth, this.margin + i * this.cellHeight);
+            ctx.stroke();
         }
         
         // 绘制竖线（9条）- 楚河汉界中间不连接
         for (let i = 0; i <= 8; i++) {
             // 上半部分竖线（黑方区域）
-            this.ctx.beginPath();
-            this.ctx.moveTo(this.margin + i * this.cellWidth, this.margin);
-            this.ctx.lineTo(this.margin + i * this.cellWidth, this.margin + 4 * this.cellHeight);
-            this.ctx.stroke();
+            ctx.beginPath();
+            ctx.moveTo(this.margin + i * this.cellWidth, this.margin);
+            ctx.lineTo(this.margin + i * this.cellWidth, this.margin + 4 * this.cellHeight);
+            ctx.stroke();
             
             // 下半部分竖线（红方区域）
-            this.ctx.beginPath();
-            this.ctx.moveTo(this.margin + i * this.cellWidth, this.margin + 5 * this.cellHeight);
-            this.ctx.lineTo(this.margin + i * this.cellWidth, this.margin + this.boardHeight);
-            this.ctx.stroke();
+            ctx.beginPath();
+            ctx.moveTo(this.margin + i * this.cellWidth, this.margin + 5 * this.cellHeight);
+            ctx.lineTo(this.margin + i * this.cellWidth, this.margin + this.boardHeight);
+            ctx.stroke();
         }
         
         // 绘制九宫格斜线
-        this.drawPalaceDiagonals();
+        this.drawPalaceDiagonals(ctx);
         
         // 绘制楚河汉界
-        this.drawRiverBoundary();
+        this.drawRiverBoundary(ctx);
         
         // 绘制兵卒位置标记
-        this.drawPositionMarkers();
+        this.drawPositionMarkers(ctx);
+        
+        return layer;
     }
     
-    drawPalaceDiagonals() {
-        this.ctx.strokeStyle = '#000000';
-        this.ctx.lineWidth = 1.5;
+    drawPalaceDiagonals(ctx) {
+        ctx.strokeStyle = '#000000';
+        ctx.lineWidth = 1.5 * this.scale;
         
         // 黑方九宫格斜线（顶部）
-        this.ctx.beginPath();
-        this.ctx.moveTo(this.margin + 3 * this.cellWidth, this.margin);
-        this.ctx.lineTo(this.margin + 5 * this.cellWidth, this.margin + 2 * this.cellHeight);
-        this.ctx.stroke();
+        ctx.beginPath();
+        ctx.moveTo(this.margin + 3 * this.cellWidth, this.margin);
+        ctx.lineTo(this.margin + 5 * this.cellWidth, this.margin + 2 * this.cellHeight);
+        ctx.stroke();
         
-        this.ctx.beginPath();
-        this.ctx.moveTo(this.margin + 5 * this.cellWidth, this.margin);
-        this.ctx.lineTo(this.margin + 3 * this.cellWidth, this.margin + 2 * this.cellHeight);
-        this.ctx.stroke();
+        ctx.beginPath();
+        ctx.moveTo(this.margin + 5 * this.cellWidth, this.margin);
+        ctx.lineTo(this.margin + 3 * this.cellWidth, this.margin + 2 * this.cellHeight);
+        ctx.stroke();
         
         // 红方九宫格斜线（底部）
-        this.ctx.beginPath();
-        this.ctx.moveTo(this.margin + 3 * this.cellWidth, this.margin + 7 * this.cellHeight);
-        this.ctx.lineTo(this.margin + 5 * this.cellWidth, this.margin + 9 * this.cellHeight);
-        this.ctx.stroke();
-        
-        this.ctx.beginPath();
-        this.ctx.moveTo(this.margin + 5 * this.cellWidth, this.margin + 7 * this.cellHeight);
-        this.ctx.lineTo(this.margin + 3 * this.cellWidth, this.margin + 9 * this.cellHeight);
-        this.ctx.stroke();
+        ctx.beginPath();
+        ctx.moveTo(this.margin + 3 * this.cellWidth, this.margin + 7 * this.cellHeight);
+        ctx.lineTo(this.margin + 5 * this.cellWidth, this.margin + 9 * this.cellHeight);
+        ctx.stroke();
+        
+        ctx.beginPath();
+        ctx.moveTo(this.margin + 5 * this.cellWidth, this.margin + 7 * this.cellHeight);
+        ctx.lineTo(this.margin + 3 * this.cellWidth, this.margin + 9 * this.cellHeight);
+        ctx.stroke();
     }
     
-    drawRiverBoundary() {
+    drawRiverBoundary(ctx) {
         // 绘制楚河汉界文字
-        this.ctx.fillStyle = '#8B4513';
-        this.ctx.font = 'bold 18px SimHei, Microsoft YaHei, Arial';
-        this.ctx.textAlign = 'center';
-        this.ctx.textBaseline = 'middle';
+        ctx.fillStyle = '#8B4513';
+        ctx.font = `bold ${18 * this.scale}px SimHei, Microsoft YaHei, Arial`;
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
         
         const riverY = this.margin + 4.5 * this.cellHeight;
         
-        this.ctx.fillText('楚河', this.margin + 2 * this.cellWidth, riverY);
-        this.ctx.fillText('汉界', this.margin + 6 * this.cellWidth, riverY);
+        ctx.fillText('楚河', this.margin + 2 * this.cellWidth, riverY);
+        ctx.fillText('汉界', this.margin + 6 * this.cellWidth, riverY);
     }
     
-    drawPositionMarkers() {
-        this.ctx.strokeStyle = '#000000';
-        this.ctx.lineWidth = 1;
+    drawPositionMarkers(ctx) {
+        ctx.strokeStyle = '#000000';
+        ctx.lineWidth = this.scale;
         
         // 兵卒位置标记
         const positions = [
@@ -320,151 +427,279 @@ class ChessBoardRenderer {
         positions.forEach(([col, row]) => {
             const x = this.margin + col * this.cellWidth;
             const y = this.margin + row * this.cellHeight;
-            const size = 4;
+            const size = 4 * this.scale;
             
             // 绘制十字标记
-            this.ctx.beginPath();
-            this.ctx.moveTo(x - size, y);
-            this.ctx.lineTo(x + size, y);
-            this.ctx.moveTo(x, y - size);
-            this.ctx.lineTo(x, y + size);
-            this.ctx.stroke();
+            ctx.beginPath();
+            ctx.moveTo(x - size, y);
+            ctx.lineTo(x + size, y);
+            ctx.moveTo(x, y - size);
+            ctx.lineTo(x, y + size);
+            ctx.stroke();
         });
     }
     
-    drawCoordinates() {
-        this.ctx.fillStyle = '#8B4513';
-        this.ctx.font = '12px Arial';
-        this.ctx.textAlign = 'center';
-        this.ctx.textBaseline = 'middle';
+    drawCoordinates(ctx) {
+        ctx.fillStyle = '#8B4513';
+        ctx.font = `${12 * this.scale}px Arial`;
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
         
         // 列标识 (a-i) - 底部
         for (let i = 0; i < 9; i++) {
             const letter = String.fromCharCode(97 + i);
-            this.ctx.fillText(letter, this.margin + i * this.cellWidth, this.canvas.height - 10);
+            ctx.fillText(letter, this.margin + i * this.cellWidth, this.canvas.height - 10 * this.scale);
         }
         
         // 行标识 (0-9) - 左侧
         for (let i = 0; i <= 9; i++) {
-            this.ctx.fillText(i.toString(), 15, this.margin + i * this.cellHeight);
+            ctx.fillText(i.toString(), 15 * this.scale, this.margin + i * this.cellHeight);
         }
     }
     
+    // 预先绘制每种棋子（含阴影），走子时直接拷贝
+    renderSprites() {
+        const radius = this.pieceRadius;
+        const shadow = 2 * this.scale;
+        this.spriteCenter = radius + 2;
+        const size = 2 * this.spriteCenter + shadow;
+        const sprites = {};
+        
+        Object.keys(this.pieces).forEach(piece => {
+            const layer = this.createLayer(size, size);
+            const ctx = layer.getContext('2d');
+            const c = this.spriteCenter;
+            const isRed = piece === piece.toUpperCase();
+            
+            // 绘制棋子阴影
+            ctx.beginPath();
+            ctx.arc(c + shadow, c + shadow, radius, 0, 2 * Math.PI);
+            ctx.fillStyle = 'rgba(0, 0, 0, 0.2)';
+            ctx.fill();
+            
+            // 绘制棋子背景：红方浅色，黑方深色
+            ctx.beginPath();
+            ctx.arc(c, c, radius, 0, 2 * Math.PI);
+            ctx.fillStyle = isRed ? '#FFF8DC' : '#2F2F2F';
+            ctx.fill();
+            
+            // 绘制棋子边框
+            ctx.strokeStyle = '#000000';
+            ctx.lineWidth = 2 * this.scale;
+            ctx.stroke();
+            
+            // 绘制棋子文字
+            ctx.font = `bold ${Math.min(this.cellWidth, this.cellHeight) * 0.5}px SimHei, Microsoft YaHei, Arial`;
+            ctx.textAlign = 'center';
+            ctx.textBaseline = 'middle';
+            ctx.fillStyle = isRed ? '#DC143C' : '#FFFFFF';
+            ctx.fillText(this.pieces[piece], c, c);
+            
+            sprites[piece] = layer;
+        });
+        return sprites;
+    }
+    
+    // 整块画布恢复为空棋盘（重置游戏时调用），下一次 updateBoard 重绘全部棋子
+    drawBoard() {
+        this.finishAnimation();
+        this.ctx.drawImage(this.background, 0, 0);
+        this.position = new Array(90).fill('.');
+        this.highlighted = [];
+    }
+    
     showInitialPosition() {
         // 显示初始棋子位置
         const initialBoard = "rnbakabnr/........./.c.....c./p.p.p.p.p/........./........./P.P.P.P.P/.C.....C./........./RNBAKABNR";
+        this.lastMove = null;
         this.updateBoard(initialBoard);
     }
     
-    updateBoard(boardState) {
-        console.log('updateBoard被调用，棋盘状态:', boardState);
-        
+    // 与当前显示的局面比较，只重绘发生变化的格子；animate 为 true 且变化恰为 lastMove 时播放走子动画
+    updateBoard(boardState, animate = false) {
         if (!boardState) {
             console.error('棋盘状态为空');
             return;
         }
+        this.finishAnimation();
         
-        // 清空棋盘并重绘
-        console.log('开始重绘棋盘...');
-        this.drawBoard();
-        console.log('棋盘重绘完成');
+        const next = this.parseBoard(boardState);
+        const dirty = new Set();
+        for (let i = 0; i < 90; i++) {
+            if (next[i] !== this.position[i]) {
+                dirty.add(i);
+            }
+        }
         
-        // 解析棋盘状态
-        const rows = boardState.split('/');
-        console.log('解析后的行数据:', rows);
+        // 高亮格子变化时同样需要重绘
+        const highlighted = this.moveSquares(this.lastMove);
+        this.highlighted.forEach(i => dirty.add(i));
+        highlighted.forEach(i => dirty.add(i));
+        
+        const previous = this.position;
+        this.position = next;
+        this.highlighted = highlighted;
         
+        let moving = null;
+        if (animate && this.animationMs > 0 && highlighted.length === 2) {
+            const [from, to] = highlighted;
+            if (next[from] === '.' && next[to] !== '.' && previous[from] === next[to]) {
+                moving = {from: from, to: to, piece: next[to]};
+            }
+        }
+        
+        dirty.forEach(i => this.paintSquare(i, moving ? moving.to : -1));
+        if (moving) {
+            this.animate(moving);
+        }
+    }
+    
+    parseBoard(boardState) {
+        const position = new Array(90).fill('.');
+        const rows = boardState.split('/');
         for (let row = 0; row < 10; row++) {
-            if (rows[row]) {
-                console.log(`处理第${row}行: ${rows[row]}`);
-                for (let col = 0; col < 9; col++) {
-                    const piece = rows[row][col];
-                    if (piece && piece !== '.') {
-                        console.log(`在位置(${col}, ${row})绘制棋子: ${piece}`);
-                        this.drawPiece(col, row, piece);
-                    }
+            const line = rows[row] || '';
+            for (let col = 0; col < 9; col++) {
+                const piece = line[col];
+                if (piece && piece !== '.') {
+                    position[row * 9 + col] = piece;
                 }
             }
         }
-        
-        // 高亮最后一步
-        if (this.lastMove) {
-            console.log('高亮最后一步:', this.lastMove);
-            this.highlightMove(this.lastMove);
+        return position;
+    }
+    
+    moveSquares(move) {
+        if (!move || !move.from || !move.to) return [];
+        const from = parseInt(move.from[1]) * 9 + (move.from.charCodeAt(0) - 97);
+        const to = parseInt(move.to[1]) * 9 + (move.to.charCodeAt(0) - 97);
+        return [from, to];
+    }
+    
+    squareCenter(index) {
+        return {
+            x: this.margin + (index % 9) * this.cellWidth,
+            y: this.margin + Math.floor(index / 9) * this.cellHeight
+        };
+    }
+    
+    // 格子以交叉点为中心、一个格距大小，棋子不会越出自己的格子
+    squareRect(index) {
+        const {x, y} = this.squareCenter(index);
+        return this.pixelRect(x - this.cellWidth / 2, y - this.cellHeight / 2, this.cellWidth, this.cellHeight);
+    }
+    
+    pixelRect(x, y, w, h) {
+        const left = Math.max(0, Math.floor(x));
+        const top = Math.max(0, Math.floor(y));
+        const right = Math.min(this.canvas.width, Math.ceil(x + w));
+        const bottom = Math.min(this.canvas.height, Math.ceil(y + h));
+        return {x: left, y: top, w: right - left, h: bottom - top};
+    }
+    
+    // 重绘一个格子：背景 + 棋子 + 高亮；skip 为正在动画中的目标格，暂不画棋子
+    paintSquare(index, skip = -1) {
+        const r = this.squareRect(index);
+        this.ctx.drawImage(this.background, r.x, r.y, r.w, r.h, r.x, r.y, r.w, r.h);
+        const piece = this.position[index];
+        if (piece !== '.' && index !== skip) {
+            this.drawSprite(piece, this.squareCenter(index));
+        }
+        if (this.highlighted.includes(index)) {
+            this.highlightSquare(index, index === this.highlighted[0] ? '#FFD700' : '#FF6B6B', 0.4);
         }
-        
-        console.log('棋盘更新完成');
     }
     
-    drawPiece(col, row, piece) {
-        const x = this.margin + col * this.cellWidth;
-        const y = this.margin + row * this.cellHeight;
-        const radius = Math.min(this.cellWidth, this.cellHeight) * 0.4;
-        
-        // 绘制棋子阴影
-        this.ctx.beginPath();
-        this.ctx.arc(x + 2, y + 2, radius, 0, 2 * Math.PI);
-        this.ctx.fillStyle = 'rgba(0, 0, 0, 0.2)';
-        this.ctx.fill();
-        
-        // 绘制棋子背景
-        this.ctx.beginPath();
-        this.ctx.arc(x, y, radius, 0, 2 * Math.PI);
-        
-        if (piece === piece.toUpperCase()) {
-            // 红方棋子 - 浅色背景
-            this.ctx.fillStyle = '#FFF8DC';
-        } else {
-            // 黑方棋子 - 深色背景
-            this.ctx.fillStyle = '#2F2F2F';
+    // 重绘任意矩形区域（动画经过的地方），只涉及与之相交的格子
+    repaintRect(rect, skip) {
+        const ctx = this.ctx;
+        ctx.save();
+        ctx.beginPath();
+        ctx.rect(rect.x, rect.y, rect.w, rect.h);
+        ctx.clip();
+        ctx.drawImage(this.background, rect.x, rect.y, rect.w, rect.h, rect.x, rect.y, rect.w, rect.h);
+        
+        const colFrom = Math.max(0, Math.floor((rect.x - this.margin) / this.cellWidth));
+        const colTo = Math.min(8, Math.ceil((rect.x + rect.w - this.margin) / this.cellWidth));
+        const rowFrom = Math.max(0, Math.floor((rect.y - this.margin) / this.cellHeight));
+        const rowTo = Math.min(9, Math.ceil((rect.y + rect.h - this.margin) / this.cellHeight));
+        for (let row = rowFrom; row <= rowTo; row++) {
+            for (let col = colFrom; col <= colTo; col++) {
+                const index = row * 9 + col;
+                if (this.position[index] !== '.' && index !== skip) {
+                    this.drawSprite(this.position[index], this.squareCenter(index));
+                }
+                if (this.highlighted.includes(index)) {
+                    this.highlightSquare(index, index === this.highlighted[0] ? '#FFD700' : '#FF6B6B', 0.4);
+                }
+            }
         }
-        this.ctx.fill();
-        
-        // 绘制棋子边框
-        this.ctx.strokeStyle = '#000000';
-        this.ctx.lineWidth = 2;
-        this.ctx.stroke();
-        
-        // 绘制棋子文字
-        const pieceText = this.pieces[piece] || piece;
-        this.ctx.font = `bold ${Math.min(this.cellWidth, this.cellHeight) * 0.5}px SimHei, Microsoft YaHei, Arial`;
-        this.ctx.textAlign = 'center';
-        this.ctx.textBaseline = 'middle';
-        
-        // 设置文字颜色
-        if (piece === piece.toUpperCase()) {
-            this.ctx.fillStyle = '#DC143C';  // 红方文字
-        } else {
-            this.ctx.fillStyle = '#FFFFFF';  // 黑方文字
+        ctx.restore();
+    }
+    
+    drawSprite(piece, center) {
+        const sprite = this.sprites[piece];
+        if (sprite) {
+            this.ctx.drawImage(sprite, center.x - this.spriteCenter, center.y - this.spriteCenter);
         }
-        
-        this.ctx.fillText(pieceText, x, y);
     }
     
-    highlightMove(move) {
-        if (!move || !move.from || !move.to) return;
+    spriteRect(center) {
+        const size = this.sprites.K.width;
+        return this.pixelRect(center.x - this.spriteCenter, center.y - this.spriteCenter, size, size);
+    }
+    
+    // 走子动画：每帧只恢复上一帧棋子覆盖的区域并在新位置绘制，不重绘整块画布
+    animate(moving) {
+        const start = this.squareCenter(moving.from);
+        const end = this.squareCenter(moving.to);
+        const startTime = performance.now();
+        const animation = {moving: moving, rect: null, frame: null};
         
-        const fromCol = move.from.charCodeAt(0) - 97;
-        const fromRow = parseInt(move.from[1]);
-        const toCol = move.to.charCodeAt(0) - 97;
-        const toRow = parseInt(move.to[1]);
+        const step = now => {
+            const t = Math.min(1, (now - startTime) / this.animationMs);
+            const eased = 1 - Math.pow(1 - t, 3);
+            if (animation.rect) {
+                this.repaintRect(animation.rect, moving.to);
+            }
+            if (t >= 1) {
+                this.animation = null;
+                this.paintSquare(moving.to);
+                return;
+            }
+            const center = {x: start.x + (end.x - start.x) * eased, y: start.y + (end.y - start.y) * eased};
+            this.drawSprite(moving.piece, center);
+            animation.rect = this.spriteRect(center);
+            animation.frame = requestAnimationFrame(step);
+        };
         
-        // 高亮起始位置
-        this.highlightSquare(fromCol, fromRow, '#FFD700', 0.4);
-        // 高亮目标位置
-        this.highlightSquare(toCol, toRow, '#FF6B6B', 0.4);
+        this.animation = animation;
+        animation.frame = requestAnimationFrame(step);
+    }
+    
+    // 立即结束进行中的动画（新局面到达时）
+    finishAnimation() {
+        const animation = this.animation;
+        if (!animation) return;
+        cancelAnimationFrame(animation.frame);
+        this.animation = null;
+        if (animation.rect) {
+            this.repaintRect(animation.rect, animation.moving.to);
+        }
+        this.paintSquare(animation.moving.to);
     }
     
-    highlightSquare(col, row, color, alpha) {
-        const x = this.margin + (col + 0.5) * this.cellSize;
-        const y = this.margin + (row + 0.5) * this.cellSize;
-        const size = this.cellSize * 0.7;
+    highlightSquare(index, color, alpha) {
+        const {x, y} = this.squareCenter(index);
+        const size = Math.min(this.cellWidth, this.cellHeight) * 0.7;
         
         this.ctx.fillStyle = color;
         this.ctx.globalAlpha = alpha;
-        this.ctx.fillRect(x - size/2, y - size/2, size, size);
+        this.ctx.fillRect(x - size / 2, y - size / 2, size, size);
         this.ctx.globalAlpha = 1.0;
     }
     
+    // 设置最后一步；在下一次 updateBoard 时生效
     setLastMove(moveStr) {
         if (moveStr && moveStr.length >= 4) {
             this.lastMove = {
@@ -496,7 +731,7 @@ function initializeApp() {
     // 初始化Socket事件
     initializeSocketEvents();
     
-    console.log('中国象棋应用初始化完成');
+    debugLog('中国象棋应用初始化完成');
 }
 
 function bindEventListeners() {
@@ -515,26 +750,29 @@ function bindEventListeners() {
 }
 
 function initializeSocketEvents() {
-    console.log('开始初始化Socket事件监听器...');
+    debugLog('开始初始化Socket事件监听器...');
     
     // 连接状态
     socket.on('connect', function() {
         updateConnectionStatus('已连接');
-        console.log('Socket连接成功');
-        console.log('Socket ID:', socket.id);
+        debugLog('Socket连接成功');
+        debugLog('Socket ID:', socket.id);
         
         // 连接成功后重新绑定事件监听器
         bindThinkingStreamEvent();
+        
+        // 加入观战房间（未指定时观看最近开始的一局），重连后会收到最新局面快照
+        joinBattle(watchingBattleId);
     });
     
     socket.on('disconnect', function() {
         updateConnectionStatus('连接断开');
-        console.log('Socket连接断开');
+        debugLog('Socket连接断开');
     });
     
     // 游戏事件
     socket.on('thinking', function(data) {
-        console.log('收到thinking事件:', data);
+        debugLog('收到thinking事件:', data);
         showThinkingStatus(data.player, data.message);
     });
     
@@ -542,84 +780,62 @@ function initializeSocketEvents() {
     bindThinkingStreamEvent();
     
     socket.on('move_made', function(data) {
-        console.log('收到move_made事件:', data);
+        debugLog('收到move_made事件:', data);
         handleMoveMade(data);
     });
     
     socket.on('game_over', function(data) {
-        console.log('收到game_over事件:', data);
+        debugLog('收到game_over事件:', data);
         handleGameOver(data);
     });
     
     socket.on('game_error', function(data) {
-        console.log('收到game_error事件:', data);
+        debugLog('收到game_error事件:', data);
         handleGameError(data);
     });
     
-    // 添加通用事件监听器来捕获所有事件
-    socket.onAny(function(eventName, ...args) {
-        console.log(`收到Socket.IO事件: ${eventName}`, args);
+    // 观战：加入房间时的局面快照
+    socket.on('battle_snapshot', function(data) {
+        handleBattleSnapshot(data);
+    });
+    
+    socket.on('viewer_mode', function(data) {
+        if (data.status === 'success' && data.mode === 'overflow') {
+            addBattleLogEntry('观众较多，思考过程将每隔几秒更新一次', 'info');
+        }
     });
     
-    console.log('Socket事件监听器初始化完成');
+    // 调试模式下记录所有事件
+    if (DEBUG) {
+        socket.onAny(function(eventName, ...args) {
+            debugLog(`收到Socket.IO事件: ${eventName}`, args);
+        });
+    }
+    
+    debugLog('Socket事件监听器初始化完成');
 }
 
 // 单独的函数来绑定thinking_stream事件
 function bindThinkingStreamEvent() {
-    console.log('绑定thinking_stream事件监听器...');
-    
     // 移除之前的监听器（如果存在）
     socket.off('thinking_stream');
     
-    // 新增：处理流式思考过程
+    // 处理流式思考过程：只把片段交给渲染器，DOM在下一动画帧统一更新
     socket.on('thinking_stream', function(data) {
-        console.log('收到thinking_stream事件:', data);
-        
         // 确保数据格式正确
         if (!data || typeof data !== 'object') {
             console.error('thinking_stream数据格式错误:', data);
             return;
         }
         
-        const thinkingBoxId = `${data.player}-thinking-process`;
-        const thinkingBox = document.getElementById(thinkingBoxId);
-        
-        if (!thinkingBox) {
-            console.error(`找不到思考区元素: ${thinkingBoxId}`);
-            return;
+        if (data.content) {
+            thinkingRenderer.append(data.player, data.content);
         }
-        
         if (data.is_complete) {
-            // 思考完成，清理状态
-            console.log(`${data.player}思考完成`);
-            clearStreamingState(data.player);
-            return;
-        }
-        
-        // 流式添加思考内容
-        if (data.content && data.content.length > 0) {
-            // 检查是否已有内容容器，如果没有则创建
-            let contentContainer = thinkingBox.querySelector('.thinking-content-stream');
-            if (!contentContainer) {
-                // 清空现有内容
-                thinkingBox.innerHTML = '';
-                // 创建新的内容容器
-                contentContainer = document.createElement('div');
-                contentContainer.className = 'thinking-content-stream';
-                contentContainer.style.whiteSpace = 'pre-wrap';
-                contentContainer.style.wordWrap = 'break-word';
-                thinkingBox.appendChild(contentContainer);
-            }
-            
-            // 直接追加内容，不添加时间戳和装饰样式
-            contentContainer.textContent += data.content;
-            
-            // 自动滚动到底部
-            thinkingBox.scrollTop = thinkingBox.scrollHeight;
+            debugLog(`${data.player}思考完成`);
+            thinkingRenderer.complete(data.player);
         }
     });
-    
-    console.log('thinking_stream事件监听器绑定完成');
 }
 
 function startBattle() {
@@ -649,9 +865,10 @@ function startBattle() {
         if (data.status === 'success') {
             gameState.isPlaying = true;
             gameState.startTime = new Date();
-            console.log('中国象棋对战已开始');
+            debugLog('中国象棋对战已开始');
             updateControlButtons(true);
             clearGameInfo();
+            joinBattle(data.battle_id);
         } else {
             alert('启动对战失败: ' + data.message);
         }
@@ -703,7 +920,7 @@ function resetBattle() {
         document.getElementById('total-moves').textContent = '0';
         document.getElementById('battle-duration').textContent = '00:00';
         
-        console.log('中国象棋游戏已重置');
+        debugLog('中国象棋游戏已重置');
     }
 }
 
@@ -767,12 +984,12 @@ function hideThinkingStatus() {
 }
 
 function handleMoveMade(data) {
-    console.log('收到中国象棋棋步:', data);
+    debugLog('收到中国象棋棋步:', data);
     
-    // 更新棋盘
+    // 更新棋盘：只重绘变化的格子并播放走子动画
     if (data.board_state) {
-        boardRenderer.updateBoard(data.board_state);
         boardRenderer.setLastMove(data.move);
+        boardRenderer.updateBoard(data.board_state, true);
         gameState.boardState = data.board_state;
     }
     
@@ -794,8 +1011,41 @@ function handleMoveMade(data) {
     updateBattleDuration();
 }
 
+function joinBattle(battleId) {
+    watchingBattleId = battleId || null;
+    socket.emit('join_battle', battleId ? {battle_id: battleId} : {});
+}
+
+function handleBattleSnapshot(data) {
+    // 中途加入或重连：用快照恢复棋盘、统计和当前思考内容
+    watchingBattleId = data.battle_id;
+    gameState.isPlaying = data.status === 'playing';
+    gameState.startTime = data.start_time ? new Date(data.start_time * 1000) : null;
+    updateControlButtons(gameState.isPlaying);
+    
+    if (data.board_state) {
+        if (data.last_move) {
+            boardRenderer.setLastMove(data.last_move);
+        }
+        boardRenderer.updateBoard(data.board_state);
+        gameState.boardState = data.board_state;
+    }
+    if (data.current_player) {
+        updateCurrentPlayer(data.current_player);
+        gameState.currentPlayer = data.current_player;
+    }
+    gameState.moveCount = data.move_count || 0;
+    document.getElementById('total-moves').textContent = gameState.moveCount;
+    document.getElementById('current-round').textContent = Math.ceil(gameState.moveCount / 2);
+    
+    const thinking = data.thinking || {};
+    if (thinking.player && thinking.content) {
+        thinkingRenderer.reset(thinking.player, thinking.content);
+    }
+}
+
 function handleGameOver(data) {
-    console.log('中国象棋游戏结束:', data);
+    debugLog('中国象棋游戏结束:', data);
     
     gameState.isPlaying = false;
     updateControlButtons(false);
@@ -0,0 +1,71 @@
+import pytest
+
+from models import adjudication
+from models.adjudication import Adjudicator, position_hash
+from models.chess_game import ChessGame
+
+
+def play(game, adjudicator, moves):
+    verdict = None
+    for move in moves:
+        assert game.make_move(move), move
+        verdict = adjudicator.record(game)
+        if verdict:
+            break
+    return verdict
+
+
+def from_fen(fen):
+    game = ChessGame()
+    game.set_fen(fen)
+    return game
+
+
+def test_incremental_hash_matches_full_hash_after_capture():
+    game = ChessGame()
+    adjudicator = Adjudicator(game)
+    play(game, adjudicator, ['h7e7', 'a3a4', 'e7e3', 'h2e2'])
+    assert game.move_history[2].captured == 'p'
+    assert adjudicator.hash == position_hash(game)
+
+
+def test_same_squares_with_other_side_to_move_hash_differently():
+    red = from_fen('4k4/9/9/9/9/9/9/9/9/3K5 w')
+    black = from_fen('4k4/9/9/9/9/9/9/9/9/3K5 b')
+    assert position_hash(red) != position_hash(black)
+
+
+def test_shuffling_horses_is_a_repetition_draw():
+    game = ChessGame()
+    adjudicator = Adjudicator(game, repetition_limit=3)
+    verdict = play(game, adjudicator, ['h9g7', 'h0g2', 'g7h9', 'g2h0'] * 3)
+    assert verdict['reason'] == 'repetition' and verdict['winner'] is None
+    assert adjudicator.ply == 8
+
+
+def test_perpetual_check_loses():
+    game = from_fen('3k5/9/9/9/9/R8/9/9/9/5K3 w')
+    adjudicator = Adjudicator(game, repetition_limit=3)
+    verdict = play(game, adjudicator, ['a5d5'] + ['d0e0', 'd5e5', 'e0d0', 'e5d5'] * 3)
+    assert verdict['reason'] == 'perpetual_check'
+    assert verdict['winner'] == 'black'
+
+
+def test_perpetual_chase_loses():
+    game = from_fen('4k4/9/1c7/9/3R5/9/9/9/9/3K5 w')
+    adjudicator = Adjudicator(game, repetition_limit=3)
+    verdict = play(game, adjudicator, ['d4b4'] + ['b2c2', 'b4c4', 'c2b2', 'c4b4'] * 3)
+    assert verdict['reason'] == 'perpetual_chase'
+    assert verdict['winner'] == 'black'
+
+
+def test_chase_is_only_evaluated_on_repetition(monkeypatch):
+    def fail(*args):
+        raise AssertionError("is_chase called without a repeated position")
+
+    monkeypatch.setattr(adjudication, 'is_chase', fail)
+    game = ChessGame()
+    adjudicator = Adjudicator(game)
+    assert play(game, adjudicator, ['h9g7', 'h0g2', 'g7h9', 'g2h0'] + ['h9g7', 'h0g2', 'g7h9']) is None
+    with pytest.raises(AssertionError):
+        play(game, adjudicator, ['g2h0'])
@@ -0,0 +1,101 @@
+import threading
+
+from config import Config
+from models import analysis
+from models.analysis import AnalysisJobs, analyze_position, estimated_cost
+from models.chess_game import ChessGame
+
+
+def test_analyze_position_finds_king_capture():
+    game = ChessGame()
+    for move in ('h7e7', 'a3a4', 'e7e3', 'h2e2'):
+        game.make_move(move)
+    result = analyze_position(game.get_fen(), depth=1)
+    assert result['player'] == 'red'
+    assert result['best_move'] == 'e3e0'
+    assert result['mate_in'] > 0
+
+
+def test_estimated_cost_clamps_depth():
+    assert estimated_cost(2, 1) == 2 * Config.ANALYSIS_BRANCHING
+    assert estimated_cost(1, 99) == Config.ANALYSIS_BRANCHING ** Config.ANALYSIS_MAX_DEPTH
+    assert estimated_cost(1) == Config.ANALYSIS_BRANCHING ** Config.ANALYSIS_DEFAULT_DEPTH
+
+
+def test_jobs_collect_results_in_input_order(monkeypatch):
+    release = threading.Event()
+
+    def fake_iter(positions, depth=None):
+        release.wait(5)
+        for index in reversed(range(len(positions))):
+            yield {'index': index, 'fen': positions[index]}
+
+    monkeypatch.setattr(analysis, 'iter_analysis', fake_iter)
+    jobs = AnalysisJobs(limit=1)
+    job_id = jobs.submit(['a', 'b', 'c'], depth=2)
+    job = jobs.get(job_id)
+    assert job['status'] == 'running' and job['total'] == 3 and 'results' not in job
+
+    release.set()
+    for _ in range(500):
+        job = jobs.get(job_id)
+        if job['status'] != 'running':
+            break
+        threading.Event().wait(0.01)
+    assert job['status'] == 'finished' and job['completed'] == 3
+    assert [result['fen'] for result in job['results']] == ['a', 'b', 'c']
+    assert jobs.get('missing') is None
+
+
+def test_jobs_keep_only_recent_finished(monkeypatch):
+    def no_results(positions, depth=None):
+        yield from ()
+
+    monkeypatch.setattr(analysis, 'iter_analysis', no_results)
+    jobs = AnalysisJobs(limit=1)
+    first = jobs.submit(['a'])
+    for thread in threading.enumerate():
+        if thread.name == f'analysis-{first}':
+            thread.join(5)
+    second = jobs.submit(['b'])
+    for thread in threading.enumerate():
+        if thread.name == f'analysis-{second}':
+            thread.join(5)
+    jobs.submit(['c'])
+    assert jobs.get(first) is None
+    assert jobs.get(second) is not None
+
+
+def test_follow_streams_in_completion_order_and_cancel_stops(monkeypatch):
+    step = threading.Semaphore(0)
+    closed = threading.Event()
+
+    def fake_iter(positions, depth=None):
+        try:
+            for index in reversed(range(len(positions))):
+                step.acquire(timeout=5)
+                yield {'index': index}
+        finally:
+            closed.set()
+
+    monkeypatch.setattr(analysis, 'iter_analysis', fake_iter)
+    jobs = AnalysisJobs(limit=5)
+    job_id = jobs.submit(['a', 'b', 'c'])
+    step.release()
+    for _ in range(500):
+        results, running = jobs.follow(job_id)
+        if results:
+            break
+        threading.Event().wait(0.01)
+    assert results == [{'index': 2}] and running
+
+    jobs.cancel(job_id)
+    step.release()
+    assert closed.wait(5)
+    for _ in range(500):
+        if jobs.get(job_id)['status'] != 'running':
+            break
+        threading.Event().wait(0.01)
+    job = jobs.get(job_id)
+    assert job['status'] == 'cancelled' and job['completed'] == 2
+    assert jobs.follow(job_id, 1) == ([{'index': 1}], False)
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from config import Config
+from models.battle import ChessBattle
+from models.battle_runner import run_battle
+from models.llm_player import LLMPlayer
+
+
+class RecordingEmitter:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data=None, to=None):
+        # 只记录实时房间的事件；BattleChannel 发出的是 PreEncoded
+        if not to.endswith(':overflow'):
+            self.events.append((event, data.data))
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+@pytest.fixture
+def battle(monkeypatch):
+    monkeypatch.setattr(Config, 'MAX_THINKING_TIME', 30)
+    red = LLMPlayer('deepseek-chat', 'key', display_name='红')
+    black = LLMPlayer('deepseek-chat', 'key', display_name='黑')
+    battle = ChessBattle(red, black)
+    yield battle
+    battle.release()
+
+
+def test_stop_goes_through_finish_and_cancels_request(battle, monkeypatch):
+    cancelled = threading.Event()
+
+    def blocking_move(board_state, move_history, legal_moves=None, deadline=None, cancel_event=None):
+        if cancel_event.wait(5):
+            cancelled.set()
+        return None
+
+    monkeypatch.setattr(battle.red_player, 'get_move', blocking_move)
+    emitter = RecordingEmitter()
+    threading.Timer(0.2, battle.stop_battle).start()
+    started = time.monotonic()
+    run_battle(battle, emitter)
+    assert time.monotonic() - started < 2
+    assert cancelled.wait(1)
+    event, summary = emitter.events[-1]
+    assert event == 'game_over'
+    assert summary['result']['status'] == 'stopped'
+    assert battle.status == 'stopped'
+
+
+def test_game_over_after_moves(battle, monkeypatch):
+    monkeypatch.setattr(Config, 'MOVE_DELAY', 0)
+    replies = iter(['h7e7', 'a3a4', 'e7e3', 'h2e2', 'e3e0'])
+
+    def scripted(board_state, move_history, legal_moves=None, deadline=None, cancel_event=None):
+        return {'move': next(replies), 'raw_response': ''}
+
+    monkeypatch.setattr(battle.red_player, 'get_move', scripted)
+    monkeypatch.setattr(battle.black_player, 'get_move', scripted)
+    emitter = RecordingEmitter()
+    run_battle(battle, emitter)
+    moves = [data['move'] for event, data in emitter.events if event == 'move_made']
+    assert moves == ['h7e7', 'a3a4', 'e7e3', 'h2e2', 'e3e0']
+    assert emitter.events[-1][0] == 'game_over'
+    assert battle.get_battle_result()['winner'] == '红'
+    assert battle.get_pgn().rstrip().endswith('3. E3-E0 1-0')
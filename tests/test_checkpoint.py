@@ -0,0 +1,143 @@
+import json
+import time
+
+import pytest
+
+from config import Config
+from models.battle_runner import resume_battle, run_battle
+from models.checkpoint import BattleCheckpoint, list_checkpoints, load_checkpoint, with_api_keys
+from models.reasoning_store import ReasoningStore
+
+PLAYERS = {
+    'red': {'model_name': 'deepseek-chat', 'display_name': '红', 'api_key': 'red-secret'},
+    'black': {'model_name': 'deepseek-chat', 'display_name': '黑', 'api_key': 'black-secret'},
+}
+CLOCK = {'base_time': 0, 'increment': 0}
+
+
+class RecordingEmitter:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data=None, to=None):
+        if not to.endswith(':overflow'):
+            self.events.append((event, data.data))
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'CHECKPOINT_DIR', str(tmp_path / 'checkpoints'))
+    monkeypatch.setattr(Config, 'REASONING_DIR', str(tmp_path / 'reasoning'))
+    monkeypatch.setattr(Config, 'MAX_THINKING_TIME', 30)
+    monkeypatch.setattr(Config, 'MOVE_DELAY', 0)
+    return Config.CHECKPOINT_DIR
+
+
+def write_moves(checkpoint, moves):
+    for ply, move in enumerate(moves, 1):
+        color = 'red' if ply % 2 else 'black'
+        checkpoint.record_move(ply, move, color, {'red': 0.0, 'black': 0.0},
+                               {'thinking_time': 1.5, 'thinking_chars': 10, 'timestamp': time.time()})
+
+
+def test_start_record_has_no_api_keys(directory):
+    checkpoint = BattleCheckpoint.create('b1', PLAYERS, CLOCK, 100.0)
+    checkpoint.close()
+    text = open(checkpoint.path, encoding='utf-8').read()
+    assert 'secret' not in text
+    state = load_checkpoint('b1')
+    assert state['start']['players']['red'] == {'model_name': 'deepseek-chat', 'display_name': '红'}
+
+
+def test_torn_last_line_is_ignored_and_truncated_on_reopen(directory):
+    checkpoint = BattleCheckpoint.create('b2', PLAYERS, CLOCK, 100.0)
+    write_moves(checkpoint, ['h7e7', 'a3a4'])
+    checkpoint.close()
+    with open(checkpoint.path, 'ab') as f:
+        f.write(b'{"type":"move","ply":3,"mo')
+
+    state = load_checkpoint('b2')
+    assert [record['move'] for record in state['moves']] == ['h7e7', 'a3a4']
+
+    checkpoint = BattleCheckpoint.reopen('b2')
+    checkpoint.record_resume(2)
+    checkpoint.close()
+    lines = open(checkpoint.path, 'rb').read().splitlines()
+    assert [json.loads(line)['type'] for line in lines] == ['start', 'move', 'move', 'resume']
+
+
+def test_response_is_kept_only_for_the_pending_ply(directory):
+    checkpoint = BattleCheckpoint.create('b3', PLAYERS, CLOCK, 100.0)
+    checkpoint.record_response(0, 'red', {'move': 'h7e7'})
+    write_moves(checkpoint, ['h7e7'])
+    assert load_checkpoint('b3')['response'] is None
+    checkpoint.record_response(1, 'black', {'move': 'a3a4'})
+    checkpoint.close()
+    assert load_checkpoint('b3')['response']['result'] == {'move': 'a3a4'}
+
+
+def test_response_record_leaves_reasoning_text_out(directory):
+    checkpoint = BattleCheckpoint.create('b5', PLAYERS, CLOCK, 100.0)
+    before = len(open(checkpoint.path, 'rb').read())
+    checkpoint.record_response(4, 'red', {'move': 'h7e7', 'move_source': 'final', 'thinking_time': 3.0,
+                                          'raw_response': '思考' * 10000, 'thinking': '分析' * 5000,
+                                          'analysis': '', 'strategy': ''})
+    checkpoint.close()
+    line = open(checkpoint.path, 'rb').read()[before:]
+    assert len(line) < 300
+    record = json.loads(line)
+    assert record['result'] == {'move': 'h7e7', 'move_source': 'final', 'thinking_time': 3.0}
+    assert record['ply'] == 4 and record['reasoning'] == 5
+
+
+def test_missing_key_is_read_from_environment(monkeypatch):
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'from-env')
+    assert with_api_keys({'model_name': 'deepseek-chat'})['api_key'] == 'from-env'
+    assert with_api_keys({'model_name': 'deepseek-chat'}, {'api_key': 'given'})['api_key'] == 'given'
+    monkeypatch.delenv('DEEPSEEK_API_KEY')
+    with pytest.raises(ValueError):
+        with_api_keys({'model_name': 'deepseek-chat', 'display_name': '红'})
+
+
+def test_resume_replays_moves_and_uses_pending_response(directory, monkeypatch):
+    checkpoint = BattleCheckpoint.create('b4', PLAYERS, CLOCK, 100.0)
+    write_moves(checkpoint, ['h7e7', 'a3a4'])
+    checkpoint.record_response(2, 'red', {'move': 'e7e3', 'raw_response': '炮五进四吃卒'})
+    checkpoint.close()
+    store = ReasoningStore('b4')
+    store.append(3, {'raw_response': '炮五进四吃卒', 'thinking': '中路突破'})
+    store.close()
+    summary, = list_checkpoints()
+    assert summary['move_count'] == 2 and summary['pending_response'] and summary['ended'] is None
+
+    emitter = RecordingEmitter()
+    overrides = {side: {'api_key': 'key'} for side in ('red_player', 'black_player')}
+    battle = resume_battle('b4', emitter, overrides)
+    assert battle.game.get_move_count() == 2
+    assert battle.start_time == 100.0
+    assert battle.red_player.total_thinking_time == 1.5
+
+    calls = []
+    replies = iter(['h2e2', 'e3e0'])
+
+    def scripted(board_state, move_history, legal_moves=None, deadline=None, cancel_event=None):
+        calls.append(len(move_history))
+        return {'move': next(replies), 'raw_response': ''}
+
+    monkeypatch.setattr(battle.red_player, 'get_move', scripted)
+    monkeypatch.setattr(battle.black_player, 'get_move', scripted)
+    run_battle(battle, emitter)
+
+    assert calls == [3, 4]  # 第3步直接使用检查点中的模型结果
+    assert battle.get_reasoning(3)['thinking'] == '中路突破'  # 思考文本从思考记录取回
+    assert battle.battle_log[2]['thinking_chars'] == len('炮五进四吃卒')
+    assert battle.get_battle_result()['winner'] == '红'
+    state = load_checkpoint('b4')
+    assert [record['move'] for record in state['moves']] == ['h7e7', 'a3a4', 'e7e3', 'h2e2', 'e3e0']
+    assert state['resumes'] == 1 and state['end']['status'] == 'finished'
+    with pytest.raises(ValueError):
+        resume_battle('b4', emitter, overrides)
+    battle.release()
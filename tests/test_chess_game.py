@@ -0,0 +1,65 @@
+from models.chess_game import ChessGame, LEGAL_CACHE_DEPTH
+
+
+def test_legal_moves_are_generated_once_per_position():
+    game = ChessGame()
+    first = game.get_legal_moves()
+    assert game.get_legal_moves() is first
+    assert 'h7e7' in game.get_legal_move_set()
+    assert game.legal_move_stats == {'generated': 1, 'reused': 2}
+
+
+def test_make_move_invalidates_cache():
+    game = ChessGame()
+    red_moves = game.get_legal_moves()
+    assert game.make_move('h7e7')
+    black_moves = game.get_legal_moves()
+    assert black_moves is not red_moves
+    assert 'h2e2' in black_moves and 'h7e7' not in black_moves
+    assert black_moves == game.generate_legal_moves()
+
+
+def test_illegal_move_keeps_cache():
+    game = ChessGame()
+    moves = game.get_legal_moves()
+    assert not game.make_move('a0a5')
+    assert game.get_legal_moves() is moves
+    assert game.legal_move_stats['generated'] == 1
+
+
+def test_undo_restores_previous_cache():
+    game = ChessGame()
+    red_moves = game.get_legal_moves()
+    game.make_move('h7e7')
+    game.get_legal_moves()
+    assert game.undo_last_move()
+    assert game.get_legal_moves() is red_moves
+    assert game.legal_move_stats['generated'] == 2
+
+
+def test_undo_beyond_cache_depth_regenerates():
+    game = ChessGame()
+    for _ in range(LEGAL_CACHE_DEPTH // 4 + 1):
+        for move in ('h9g7', 'h0g2', 'g7h9', 'g2h0'):
+            assert game.make_move(move)
+    while game.undo_last_move():
+        pass
+    assert game.get_legal_moves() == ChessGame().generate_legal_moves()
+
+
+def test_set_board_state_clears_cache():
+    game = ChessGame()
+    game.get_legal_moves()
+    game.make_move('h7e7')
+    game.set_board_state(ChessGame().get_board_state())
+    assert game.get_legal_moves() == ChessGame().generate_legal_moves()
+    assert not game.undo_last_move()
+
+
+def test_pgn_lists_iccs_moves_and_result():
+    game = ChessGame()
+    for move in ('h7e7', 'h2e2', 'e7e3'):
+        game.make_move(move)
+    pgn = game.get_pgn({'Red': 'A', 'Black': 'B'})
+    assert '[Red "A"]' in pgn and '[Format "ICCS"]' in pgn and '[Result "*"]' in pgn
+    assert pgn.rstrip().endswith('1. H7-E7 H2-E2 2. E7-E3 *')
@@ -0,0 +1,100 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from config import Config
+from models.battle import ChessBattle
+from models.battle_runner import run_battle
+from models.clock import ChessClock, deadline_passed, move_cancelled, move_deadline, remaining_time, time_left
+from models.llm_player import LLMPlayer
+
+
+def test_no_deadline_outside_scope():
+    assert remaining_time() is None
+    assert time_left(30) == 30
+    assert not deadline_passed()
+    assert not move_cancelled()
+
+
+def test_deadline_scope_nests_and_resets():
+    with move_deadline(time.monotonic() + 10):
+        assert 9 < time_left(30) <= 10
+        with move_deadline(time.monotonic() - 1):
+            assert deadline_passed()
+            assert time_left(30) == 0
+        assert not deadline_passed()
+    assert remaining_time() is None
+
+
+def test_deadline_and_cancel_follow_copied_context():
+    cancel_event = threading.Event()
+    with move_deadline(time.monotonic() + 5, cancel_event), ThreadPoolExecutor(1) as executor:
+        remaining = executor.submit(contextvars.copy_context().run, remaining_time).result()
+        cancel_event.set()
+        cancelled = executor.submit(contextvars.copy_context().run, move_cancelled).result()
+        # 未复制上下文的线程看不到截止时刻
+        bare = executor.submit(remaining_time).result()
+    assert 4 < remaining <= 5
+    assert cancelled
+    assert bare is None
+
+
+def test_clock_increment_and_turn_deadline():
+    clock = ChessClock(base_time=60, increment=5)
+    clock.start('red')
+    assert clock.running == 'red'
+    clock.stop()
+    assert 64.9 < clock.remaining['red'] <= 65
+    assert clock.remaining['black'] == 60
+    deadline = clock.turn_deadline('black', move_limit=10)
+    assert 9.9 < deadline - time.monotonic() <= 10
+    assert ChessClock(base_time=0).time_left('red') is None
+    assert ChessClock(base_time=0).turn_deadline('red', move_limit=0) is None
+
+
+class RecordingEmitter:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data=None, to=None):
+        # 只记录实时房间的事件；BattleChannel 发出的是 PreEncoded
+        if not to.endswith(':overflow'):
+            self.events.append((event, data.data))
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+@pytest.fixture
+def slow_battle(monkeypatch):
+    monkeypatch.setattr(Config, 'MAX_THINKING_TIME', 0.3)
+    monkeypatch.setattr(Config, 'CLOCK_BASE_TIME', 0)
+    cancelled = threading.Event()
+
+    def slow_move(board_state, move_history, legal_moves=None, deadline=None, cancel_event=None):
+        if cancel_event.wait(2):
+            cancelled.set()
+        return {'move': legal_moves[0], 'raw_response': ''}
+
+    red = LLMPlayer('deepseek-chat', 'key', display_name='红')
+    black = LLMPlayer('deepseek-chat', 'key', display_name='黑')
+    monkeypatch.setattr(red, 'get_move', slow_move)
+    battle = ChessBattle(red, black)
+    yield battle, cancelled
+    battle.release()
+
+
+def test_side_is_flagged_at_deadline_and_request_cancelled(slow_battle):
+    battle, cancelled = slow_battle
+    emitter = RecordingEmitter()
+    started = time.monotonic()
+    run_battle(battle, emitter)
+    assert time.monotonic() - started < 1.5
+    assert battle.adjudication['reason'] == 'move_time'
+    assert battle.adjudication['winner'] == 'black'
+    assert not battle.game.move_history
+    assert cancelled.wait(1)
+    assert [event for event, _ in emitter.events][-1] == 'game_over'
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from models.ensemble_player import EnsemblePlayer
+
+
+class StubMember:
+    """按给定棋步立即返回，或一直等到被取消"""
+
+    def __init__(self, name, move=None):
+        self.model_name = name
+        self.display_name = name
+        self.move = move
+        self.socketio = None
+        self.cancelled = threading.Event()
+
+    def get_move(self, board_state, move_history, legal_moves=None, deadline=None, cancel_event=None):
+        if self.move:
+            return {'move': self.move, 'move_source': 'coord', 'raw_response': self.move}
+        if cancel_event.wait(5):
+            self.cancelled.set()
+        return None
+
+
+def test_early_decision_cancels_remaining_members():
+    slow = StubMember('slow')
+    ensemble = EnsemblePlayer([StubMember('a', 'h7e7'), StubMember('b', 'h7e7'), slow], timeout=10)
+    started = time.monotonic()
+    result = ensemble.get_move('', [], ['h7e7'])
+    assert result['move'] == 'h7e7'
+    assert slow.cancelled.wait(1)
+    assert time.monotonic() - started < 2
+    assert ensemble.ensemble_stats['early_decisions'] == 1
+    assert ensemble.ensemble_stats['cancelled'] == 1
+
+
+def test_deadline_cancels_unfinished_members():
+    slow = StubMember('slow')
+    ensemble = EnsemblePlayer([StubMember('a', 'h7e7'), slow], timeout=0.2)
+    result = ensemble.get_move('', [], ['h7e7'])
+    assert result['move'] == 'h7e7'
+    assert slow.cancelled.wait(1)
+    assert ensemble.ensemble_stats['timeouts'] == 1
@@ -0,0 +1,56 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from config import Config
+from models.chess_game import ChessGame
+from models.llm_player import LLMPlayer
+
+USAGE = {'prompt_cache_hit_tokens': 30, 'prompt_cache_miss_tokens': 70}
+
+
+class MoveStream(BaseHTTPRequestHandler):
+    """每次回复 "棋步：h7e7"，最后一块带 usage"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for chunk in ({'choices': [{'delta': {'content': '棋步：h7e7'}}]}, {'choices': [], 'usage': USAGE}):
+            self.wfile.write(b'data: ' + json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b'\n\n')
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url(monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_ENABLED', False)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MoveStream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/v1'
+    server.shutdown()
+    server.server_close()
+
+
+def test_hedge_player_usage_is_counted_on_owner():
+    player = LLMPlayer('deepseek-chat', 'key')
+    hedge = player.build_hedge_player()
+    assert hedge is not player and hedge.socketio is None
+    hedge.record_usage({'prompt_tokens': 100, 'prompt_tokens_details': {'cached_tokens': 40}})
+    stats = player.get_stats()['prompt_stats']
+    assert (stats['requests'], stats['prompt_tokens'], stats['cached_tokens']) == (1, 100, 40)
+
+
+def test_all_samples_are_counted(base_url):
+    player = LLMPlayer('deepseek-chat', 'key', base_url=base_url, samples=2, sample_selection='majority')
+    game = ChessGame()
+    response = player.call_model_sampled('prompt', 'red', game.get_legal_moves(), game)
+    assert response == '棋步：h7e7'
+    assert player.sample_stats['requests'] == 2
+    assert player.prompt_stats == {'requests': 2, 'prompt_tokens': 200, 'cached_tokens': 60}
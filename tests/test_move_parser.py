@@ -0,0 +1,62 @@
+from models.chess_game import ChessGame
+from models.move_parser import MoveParser
+
+
+def legal_moves():
+    return ChessGame().get_legal_moves()
+
+
+def test_final_marker_beats_moves_mentioned_in_analysis():
+    response = "分析：可以考虑 b7e7 或者 h9g7。\n策略：先出马。\n棋步：h9g7"
+    best, candidates = MoveParser().select_move(response, legal_moves())
+    assert best['move'] == 'h9g7'
+    assert [c['move'] for c in candidates] == ['b7e7', 'h9g7', 'h9g7']
+
+
+def test_negated_move_is_not_selected():
+    response = "我选择 h9g7，而不是 b7e7"
+    best, _ = MoveParser().select_move(response, legal_moves())
+    assert best['move'] == 'h9g7'
+
+
+def test_illegal_candidates_are_skipped():
+    response = "棋步：a0a5\n其实应该走 h9g7"
+    best, _ = MoveParser().select_move(response, legal_moves())
+    assert best['move'] == 'h9g7'
+
+
+def test_no_legal_candidate_returns_none_and_counts():
+    parser = MoveParser()
+    assert parser.parse("棋步：a0a5", legal_moves()) is None
+    assert parser.get_stats()['no_legal_candidate'] == 1
+
+
+def test_chinese_notation_is_mapped_to_coordinates():
+    game = ChessGame()
+    result = MoveParser().parse("分析：中炮开局。\n棋步：炮二平五", game.get_legal_moves(), game)
+    assert result['move'] == 'h7e7'
+    assert result['move_source'] == 'notation'
+    assert result['analysis'] == "中炮开局。"
+
+
+def test_separators_and_case_are_normalised():
+    best, _ = MoveParser().select_move("棋步：H9-G7", legal_moves())
+    assert best['move'] == 'h9g7'
+
+
+def test_repair_is_counted_when_legacy_rule_picks_illegal_move():
+    parser = MoveParser()
+    # 旧规则取行末的 a0a5（非法），新规则在合法候选中选 h9g7
+    result = parser.parse("走 h9g7，不走 a0a5", legal_moves())
+    assert result['move'] == 'h9g7'
+    assert parser.get_stats()['repaired'] == 1
+    assert parser.get_stats()['retries_avoided'] == 1
+
+
+def test_shortlist_prefers_moves_sharing_a_square_with_rejected_ones():
+    parser = MoveParser()
+    moves = legal_moves()
+    shortlist = parser.shortlist(moves, parser.rejected_moves("h9h5", moves), 5)
+    related = [move for move in shortlist if {move[:2], move[2:]} & {'h9', 'h5'}]
+    assert shortlist[:len(related)] == related and 'h9g7' in related
+    assert len(shortlist) == 5
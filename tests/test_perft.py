@@ -0,0 +1,14 @@
+import pytest
+
+from benchmarks.bench_engine import EXPECTED_PERFT, POSITIONS, load_position, perft
+
+# 测试中只跑较浅的深度，更深的计数由 benchmarks/bench_engine.py 校验
+SHALLOW = [('start', 1), ('start', 2), ('middlegame', 2),
+           ('endgame_red', 3), ('endgame_black', 3)]
+
+
+@pytest.mark.parametrize('name, depth', SHALLOW)
+def test_perft_matches_expected(name, depth):
+    board_state, player, _ = POSITIONS[name]
+    assert perft(load_position(board_state, player), depth) == EXPECTED_PERFT[name][depth]
+
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from models.rate_limiter import AcquireAbortedError, ProviderLimiter, TokenBucket, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+    assert bucket.wait_time(120) <= 60
+
+
+def test_acquire_gives_up_at_deadline():
+    limiter = ProviderLimiter('test', rpm=1000, tpm=10**6, concurrency=1)
+    with limiter.acquire():
+        started = time.monotonic()
+        with pytest.raises(AcquireAbortedError):
+            with limiter.acquire(deadline=time.monotonic() + 0.1):
+                pass
+        assert time.monotonic() - started < 0.5
+    stats = limiter.get_stats()
+    assert stats['aborted'] == 1 and stats['queue_depth'] == 0
+    with limiter.acquire(deadline=time.monotonic() + 0.1):
+        pass
+
+
+def test_cancelled_waiter_behind_head_releases_its_ticket():
+    limiter = ProviderLimiter('test', rpm=1000, tpm=10**6, concurrency=1)
+    cancel_event = threading.Event()
+    outcomes = []
+
+    def waiter(name, **kwargs):
+        try:
+            with limiter.acquire(**kwargs):
+                outcomes.append(name)
+        except AcquireAbortedError:
+            outcomes.append(name + ' aborted')
+
+    holder = limiter.acquire()
+    holder.__enter__()
+    head = threading.Thread(target=waiter, args=('head',))
+    head.start()
+    time.sleep(0.05)
+    cancelled = threading.Thread(target=waiter, args=('cancelled',), kwargs={'cancel_event': cancel_event})
+    cancelled.start()
+    time.sleep(0.05)
+    tail = threading.Thread(target=waiter, args=('tail',))
+    tail.start()
+    time.sleep(0.05)
+    cancel_event.set()
+    cancelled.join(1)
+    holder.__exit__(None, None, None)
+    head.join(1)
+    tail.join(1)
+    assert outcomes == ['cancelled aborted', 'head', 'tail']
+    assert not limiter.abandoned
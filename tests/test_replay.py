@@ -0,0 +1,65 @@
+import random
+
+from models.chess_game import ChessGame, MoveRecord
+from models.replay import GameReplay
+
+
+def play_random(plies, seed=7):
+    rng = random.Random(seed)
+    game = ChessGame()
+    moves = []
+    for _ in range(plies):
+        move = rng.choice(game.get_legal_moves())
+        game.make_move(move)
+        moves.append(move)
+        if game.is_game_over():
+            break
+    return game, moves
+
+
+def test_move_record_notation_is_computed_lazily():
+    game = ChessGame()
+    game.make_move('h7e7')
+    record = game.move_history[-1]
+    assert isinstance(record, MoveRecord)
+    assert record._notation is None
+    assert record.notation == '炮二平五'
+    assert record['notation'] == '炮二平五'
+    assert record.to_dict()['move'] == 'h7e7'
+
+
+def test_tandem_prefix_is_taken_before_the_move():
+    game = ChessGame()
+    for move in ('h7h3', 'a3a4', 'b7h7', 'a4a5', 'h3h4'):
+        assert game.make_move(move)
+    assert game.move_history[-1].notation == '前炮退一'
+
+
+def test_replay_computes_notation_on_demand():
+    game, moves = play_random(40)
+    replay = GameReplay.from_moves(moves, snapshot_interval=3)
+    assert replay.notations == []
+    expected = [record.notation for record in game.move_history]
+    assert [entry['notation'] for entry in replay.get_moves()] == expected
+    assert replay.notations == expected
+
+
+def test_get_moves_extends_cache_incrementally():
+    game, moves = play_random(20)
+    replay = GameReplay.from_moves(moves[:10], snapshot_interval=4)
+    replay.get_moves()
+    replay_game = replay.game_at(10)
+    for move in moves[10:]:
+        replay_game.make_move(move)
+        replay.record(replay_game)
+    assert [entry['notation'] for entry in replay.get_moves()] == [r.notation for r in game.move_history]
+
+
+def test_position_notation_at_snapshot_boundary():
+    game, moves = play_random(12)
+    replay = GameReplay.from_moves(moves, snapshot_interval=4)
+    for ply in (0, 1, 4, 8, 9, len(moves)):
+        position = replay.position(ply)
+        assert position['last_move'] == (moves[ply - 1] if ply else None)
+        assert position['last_notation'] == (game.move_history[ply - 1].notation if ply else None)
+    assert replay.position(8)['board_state'] == replay.game_at(8).get_board_state()
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from config import Config
+from models.request_scheduler import HedgedRequestScheduler, LatencyTracker, mark_admitted
+
+KEY = ('api.example.com', 'model')
+
+
+def test_percentile_uses_nearest_rank():
+    tracker = LatencyTracker(window=10)
+    for seconds in range(1, 11):
+        tracker.record(KEY, seconds)
+    assert tracker.percentile(KEY, 0.5) == 5
+    assert tracker.percentile(KEY, 0.95) == 10
+    assert tracker.percentile(('other', 'model'), 0.5) is None
+
+
+def test_cancelled_loser_is_not_recorded(monkeypatch):
+    monkeypatch.setattr(Config, 'HEDGE_DEFAULT_DELAY', 0.05)
+    monkeypatch.setattr(Config, 'HEDGE_MAX_RATIO', 1.0)
+    scheduler = HedgedRequestScheduler(max_workers=2)
+    primary_cancelled = threading.Event()
+
+    def primary(cancel_event):
+        cancel_event.wait(5)
+        primary_cancelled.set()
+        return ""
+
+    response, info = scheduler.run(KEY, primary, hedge=lambda cancel_event: "棋步：h7e7",
+                                   hedge_key=('backup', 'model'))
+    assert response == "棋步：h7e7"
+    assert info == {'hedged': True, 'winner': 'hedge'}
+    assert primary_cancelled.wait(1)
+    assert scheduler.tracker.count(KEY) == 0
+    assert scheduler.tracker.count(('backup', 'model')) == 1
+    assert scheduler.get_stats()['cancelled'] == 1
+
+
+def test_run_parallel_records_only_completed_requests():
+    scheduler = HedgedRequestScheduler(max_workers=3)
+    requests = [lambda cancel_event: "a", lambda cancel_event: cancel_event.wait(5) and "b"]
+    results = scheduler.run_parallel(KEY, requests, enough=lambda results: True)
+    assert results == [(0, "a")]
+    assert scheduler.tracker.count(KEY) == 1
+
+
+def test_failed_and_rejected_results_are_not_recorded():
+    scheduler = HedgedRequestScheduler(max_workers=1)
+    scheduler.run(KEY, lambda cancel_event: "")
+    scheduler.run(KEY, lambda cancel_event: "没有棋步", accept=lambda text: 'h7e7' in text)
+    scheduler.run_parallel(KEY, [lambda cancel_event: "", lambda cancel_event: "没有棋步"],
+                           accept=lambda text: 'h7e7' in text)
+    assert scheduler.tracker.count(KEY) == 0
+    scheduler.run(KEY, lambda cancel_event: "棋步：h7e7", accept=lambda text: 'h7e7' in text)
+    assert scheduler.tracker.count(KEY) == 1
+
+
+def test_latency_starts_at_rate_limiter_admission():
+    scheduler = HedgedRequestScheduler(max_workers=1)
+
+    def queued(cancel_event):
+        time.sleep(0.2)  # 排队等待限流额度
+        mark_admitted()
+        return "h7e7"
+
+    scheduler.run(KEY, queued)
+    assert scheduler.tracker.percentile(KEY, 0.5) < 0.1
+
+
+def test_fallback_reports_the_request_that_produced_it(monkeypatch):
+    monkeypatch.setattr(Config, 'HEDGE_DEFAULT_DELAY', 0.05)
+    monkeypatch.setattr(Config, 'HEDGE_MAX_RATIO', 1.0)
+    scheduler = HedgedRequestScheduler(max_workers=2)
+
+    def primary(cancel_event):
+        time.sleep(0.3)
+        return ""
+
+    response, info = scheduler.run(KEY, primary, hedge=lambda cancel_event: "没有棋步",
+                                   accept=lambda text: 'h7e7' in text)
+    assert response == "没有棋步"
+    assert info == {'hedged': True, 'winner': 'hedge'}
@@ -0,0 +1,62 @@
+import pytest
+
+from config import Config
+from models.battle import ChessBattle
+from models.llm_player import LLMPlayer
+from models.spectators import BattleChannel, ChunkBuffer, overflow_room
+
+
+class RecordingEmitter:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data=None, to=None):
+        self.events.append((event, data, to))
+
+    def sleep(self, seconds):
+        pass
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    monkeypatch.setattr(Config, 'SPECTATOR_THINKING_BUFFER', 10)
+    battle = ChessBattle(LLMPlayer('deepseek-chat', 'key', display_name='红'),
+                         LLMPlayer('deepseek-chat', 'key', display_name='黑'))
+    yield BattleChannel(battle, RecordingEmitter())
+    battle.release()
+
+
+def test_chunk_buffer_keeps_tail_only():
+    buffer = ChunkBuffer(5)
+    for text in ('abc', 'def', 'ghi'):
+        buffer.append(text)
+    assert buffer.text() == 'efghi'
+    assert buffer.size <= 5 + 3
+    assert buffer.take() == 'efghi'
+    assert not buffer
+
+
+def test_snapshot_thinking_is_bounded(channel):
+    for _ in range(50):
+        channel.emit('thinking_stream', {'player': 'red', 'content': '0123456789ab'})
+    snapshot = channel.snapshot().data
+    assert snapshot['thinking'] == {'player': 'red', 'content': '23456789ab'}
+    assert channel.overflow_pending.size <= 10 + 12
+
+
+def test_overflow_room_gets_capped_merged_thinking(channel, monkeypatch):
+    monkeypatch.setattr(Config, 'SPECTATOR_OVERFLOW_INTERVAL', 3600)
+    for _ in range(5):
+        channel.emit('thinking_stream', {'player': 'red', 'content': 'abcdef'})
+    channel.emit('thinking_stream', {'player': 'red', 'content': '', 'is_complete': True})
+    merged = [data.data for event, data, to in channel.emitter.events if to == overflow_room(channel.battle.battle_id)]
+    assert merged == [{'player': 'red', 'content': 'cdefabcdef', 'is_complete': True}]
+
+
+def test_snapshot_is_cached_until_next_event(channel):
+    first = channel.snapshot()
+    assert channel.snapshot() is first
+    channel.emit('thinking_stream', {'player': 'red', 'content': 'x'})
+    second = channel.snapshot()
+    assert second is not first
+    assert second.data['thinking']['content'] == 'x'
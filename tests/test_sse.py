@@ -0,0 +1,83 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from config import Config
+from models.llm_player import LLMPlayer
+from models.sse import DONE, SSEParser, iter_events, parse_json
+
+
+def feed_all(chunks):
+    parser = SSEParser()
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    return events, parser
+
+
+def test_single_line_events_in_one_chunk():
+    events, _ = feed_all([b'data: {"a":1}\n\ndata: {"a":2}\n\ndata: [DONE]\n\n'])
+    assert events == [b'{"a":1}', b'{"a":2}', DONE]
+
+
+def test_events_split_at_every_byte():
+    stream = b'data: {"a":1}\n\n: keepalive\n\nevent: x\ndata: line1\ndata: line2\n\n'
+    events, _ = feed_all([stream[i:i + 1] for i in range(len(stream))])
+    assert events == [b'{"a":1}', b'line1\nline2']
+
+
+@pytest.mark.parametrize('newline', [b'\r\n', b'\r'])
+def test_crlf_and_cr_newlines(newline):
+    stream = newline.join([b'data: {"a":1}', b'', b'data:{"a":2}', b'', b''])
+    events, parser = feed_all([stream[:15], stream[15:16], stream[16:]])
+    # 末尾的 \r 可能与下一块的 \n 组成 \r\n，要到流结束时才能确定
+    assert events + parser.flush() == [b'{"a":1}', b'{"a":2}']
+
+
+def test_flush_returns_event_without_trailing_blank_line():
+    events, parser = feed_all([b'data: {"a":1}\n\ndata: {"a":2}'])
+    assert events == [b'{"a":1}']
+    assert parser.flush() == [b'{"a":2}']
+    assert parser.flush() == []
+    assert list(iter_events([b'data: x\n', b'data: y'])) == [b'x\ny']
+
+
+def test_parse_json_accepts_bytes_and_rejects_garbage():
+    assert parse_json('{"内容":"炮二平五"}'.encode('utf-8')) == {'内容': '炮二平五'}
+    assert parse_json(b'{"a":') is None
+
+
+class UnterminatedStream(BaseHTTPRequestHandler):
+    """最后一个事件后没有空行、也没有 [DONE] 的流"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for text in ('分析：中炮。\n', '棋步：h7e7'):
+            chunk = {'choices': [{'delta': {'content': text}}]}
+            self.wfile.write(b'data: ' + json.dumps(chunk).encode('utf-8') + b'\n\n')
+        usage = {'choices': [], 'usage': {'prompt_tokens': 100, 'prompt_cache_hit_tokens': 60,
+                                          'prompt_cache_miss_tokens': 40}}
+        self.wfile.write(b'data: ' + json.dumps(usage).encode('utf-8'))
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def test_stream_handles_final_event_on_flush(monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_ENABLED', False)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), UnterminatedStream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        player = LLMPlayer('deepseek-chat', 'key', base_url=f'http://127.0.0.1:{server.server_port}/v1')
+        assert player.call_deepseek_stream('prompt', 'red') == '分析：中炮。\n棋步：h7e7'
+        assert player.prompt_stats == {'requests': 1, 'prompt_tokens': 100, 'cached_tokens': 60}
+    finally:
+        server.shutdown()
+        server.server_close()